@@ -5,6 +5,7 @@ import tempfile
 import time
 import threading
 from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 from urllib.parse import urlencode
@@ -138,6 +139,35 @@ def _resolve_assembly_backend(modal_url: Optional[str]) -> str:
     return backend
 
 
+# Bump with worker/job_manifest.py MANIFEST_VERSION when the layout changes.
+ASSEMBLY_MANIFEST_VERSION = 1
+
+
+def _describe_asset(client: httpx.Client, url: Optional[str]) -> Optional[dict]:
+    """URL plus size and ETag (the MD5 for single-part storage uploads) from a HEAD request."""
+    if not url:
+        return None
+    entry = {"url": url, "size": None, "etag": None}
+    try:
+        resp = client.head(url)
+        if resp.status_code < 400:
+            length = resp.headers.get("content-length")
+            entry["size"] = int(length) if length and length.isdigit() else None
+            entry["etag"] = (resp.headers.get("etag") or "").strip('"') or None
+    except Exception as e:
+        print(f"[queue] Could not describe asset {url}: {e}")
+    return entry
+
+
+def _describe_assets(urls: list) -> list:
+    """Describe urls in parallel. Blocks for up to the 5s timeout, so async callers run it in a thread."""
+    live = [url for url in urls if url]
+    if not live:
+        return [None] * len(urls)
+    with httpx.Client(timeout=5, follow_redirects=True) as client, ThreadPoolExecutor(max_workers=min(8, len(live))) as pool:
+        return list(pool.map(lambda url: _describe_asset(client, url), urls))
+
+
 def _build_assembly_payload(
     video_id: str,
     image_urls: list,
@@ -145,25 +175,46 @@ def _build_assembly_payload(
     script: dict,
     config: dict,
     bgm_url: Optional[str] = None,
+    render_profile: Optional[str] = None,
 ) -> dict:
+    """Versioned job manifest with everything the worker needs, so it reads nothing else before rendering."""
     beats = script.get("beats") or []
+    bgm_url = bgm_url or config.get("bgm_url")
+    audio, bgm, *images = _describe_assets([audio_url, bgm_url, *image_urls])
     return {
+        "manifest_version": ASSEMBLY_MANIFEST_VERSION,
         "video_id": video_id,
-        "image_urls": image_urls,
-        "audio_url": audio_url,
-        "beats": beats,
-        "durations": [b.get("duration", 4) for b in beats],
-        "include_captions": config.get("include_captions", True),
-        "caption_style": config.get("caption_style", "red_highlight"),
-        "motion_effect": config.get("motion_effect", "ken_burns"),
-        "transition_style": config.get("transition_style", "random"),
-        "color_grade": config.get("color_grade", "cinematic"),
-        "bgm_url": bgm_url or config.get("bgm_url"),
-        "words_per_line": config.get("words_per_line", 2),
+        "assets": {"audio": audio, "bgm": bgm, "images": images},
+        "timing": {
+            "beats": beats,
+            "durations": [b.get("duration", 4) for b in beats],
+        },
+        "style": {
+            "include_captions": config.get("include_captions", True),
+            "caption_style": config.get("caption_style", "red_highlight"),
+            "motion_effect": config.get("motion_effect", "ken_burns"),
+            "transition_style": config.get("transition_style", "random"),
+            "color_grade": config.get("color_grade", "cinematic"),
+            "words_per_line": config.get("words_per_line", 2),
+            "render_profile": render_profile or config.get("render_profile"),
+        },
     }
 
 
-def enqueue_assembly_job(video_id: str, payload: dict, priority: int = 5, source_type: str = "director", source_id: Optional[str] = None) -> Optional[dict]:
+# Owners stored before real accounts exist. They aren't users, so their jobs
+# get no shared fair-share group (and no shared running cap).
+PLACEHOLDER_USER_IDS = {"demo_user"}
+
+
+def enqueue_assembly_job(
+    video_id: str,
+    payload: dict,
+    priority: int = 5,
+    source_type: str = "director",
+    source_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    tier: Optional[str] = None,
+) -> Optional[dict]:
     if not supabase:
         return None
     try:
@@ -177,25 +228,43 @@ def enqueue_assembly_job(video_id: str, payload: dict, priority: int = 5, source
         if existing.data:
             return existing.data[0]
 
-        # Get source_id from database if not provided
-        if not source_id:
+        # Get source_id / owner from database if not provided (the owner drives fair-share claiming)
+        if not source_id or not user_id:
             table_name = "director_videos" if source_type == "director" else "episodes"
             try:
-                source_result = supabase.table(table_name).select("id").eq("video_id", video_id).execute()
+                source_result = supabase.table(table_name).select("id, user_id").eq("video_id", video_id).execute()
                 if source_result.data:
-                    source_id = source_result.data[0].get("id")
+                    source_id = source_id or source_result.data[0].get("id")
+                    user_id = user_id or source_result.data[0].get("user_id")
             except Exception as e:
                 print(f"[queue] Warning: Could not fetch source_id from {table_name}: {e}")
+        if user_id in PLACEHOLDER_USER_IDS:
+            user_id = None
 
-        insert = supabase.table("assembly_jobs").insert({
+        row = {
             "video_id": video_id,
             "status": "pending",
             "priority": priority,
             "payload": payload,
             "source_type": source_type,
             "source_id": source_id,
-        }).execute()
+            "user_id": user_id,
+            "tier": tier,
+        }
+        missing_column_re = re.compile(r"Could not find the '([^']+)' column")
+        while True:
+            try:
+                insert = supabase.table("assembly_jobs").insert(row).execute()
+                break
+            except Exception as e:
+                # Schemas without the fair-share columns still get the job.
+                match = missing_column_re.search(str(e))
+                if match and match.group(1) in ("user_id", "tier") and match.group(1) in row:
+                    row.pop(match.group(1))
+                    continue
+                raise
         if insert.data:
+            _wake_assembly_worker()
             return insert.data[0]
         return None
     except Exception as e:
@@ -203,6 +272,21 @@ def enqueue_assembly_job(video_id: str, payload: dict, priority: int = 5, source
         return None
 
 
+def _wake_assembly_worker() -> None:
+    """Poke the worker's /wake endpoint so it claims the new job without waiting to poll."""
+    wake_url = os.environ.get("ASSEMBLY_WORKER_WAKE_URL")
+    if not wake_url:
+        return
+
+    def _post():
+        try:
+            requests.post(wake_url, timeout=2)
+        except Exception as e:
+            print(f"[queue] Worker wake failed: {e}")
+
+    threading.Thread(target=_post, daemon=True).start()
+
+
 def _find_video_in_storage(video_id: str) -> Optional[str]:
     if not supabase or not video_id:
         return None
@@ -1716,7 +1800,13 @@ def _run_generate_episode(episode_id: str, topic: str, series: dict):
                     result.get("config") or {},
                     bgm_url=None,
                 )
-                enqueue_assembly_job(result.get("video_id"), job_payload, source_type="episode", source_id=episode_id)
+                enqueue_assembly_job(
+                    result.get("video_id"),
+                    job_payload,
+                    source_type="episode",
+                    source_id=episode_id,
+                    user_id=series.get("user_id"),
+                )
                 _safe_update_video(result.get("video_id"), {
                     "status": "assembling",
                     "assembly_reason": None,
@@ -2580,7 +2670,9 @@ async def api_generate_video(payload: VideoGenerateRequest, http_request: Reques
 
                 if result.get("status") == "assembling":
                     bgm_url = payload.bgm_custom_url if payload.bgm_mode == "custom" else None
-                    job_payload = _build_assembly_payload(
+                    # HEADs every asset; keep them off the event loop.
+                    job_payload = await asyncio.to_thread(
+                        _build_assembly_payload,
                         result["video_id"],
                         result.get("image_urls") or [],
                         result.get("audio_url"),
@@ -2711,8 +2803,16 @@ async def get_video_status(video_id: str):
 
 
 @app.post("/api/video/{video_id}/assemble")
-async def retry_assemble(video_id: str, background_tasks: BackgroundTasks, request: Request):
-    """Retry assembling a video using existing assets (fire-and-forget)"""
+async def retry_assemble(
+    video_id: str,
+    background_tasks: BackgroundTasks,
+    request: Request,
+    render_profile: Optional[str] = None,
+):
+    """
+    Retry assembling a video using existing assets (fire-and-forget).
+    render_profile (draft/preview/final) overrides the video's configured profile.
+    """
     if not supabase:
         raise HTTPException(status_code=503, detail="Database not configured")
 
@@ -2765,12 +2865,15 @@ async def retry_assemble(video_id: str, background_tasks: BackgroundTasks, reque
         callback_token = os.environ.get("ASSEMBLY_CALLBACK_TOKEN")
 
         if use_queue:
-            job_payload = _build_assembly_payload(
+            # HEADs every asset; keep them off the event loop.
+            job_payload = await asyncio.to_thread(
+                _build_assembly_payload,
                 video_id,
                 record.get("image_urls", []),
                 record.get("audio_url"),
                 record.get("script", {}) or {},
                 record.get("config", {}) or {},
+                render_profile=render_profile,
             )
             # Check if this is a director video or episode
             source_type = "director"
@@ -2844,6 +2947,7 @@ async def retry_assemble(video_id: str, background_tasks: BackgroundTasks, reque
                         30,
                         report_progress,
                         should_cancel,
+                        render_profile,
                     )
                     if should_cancel():
                         return
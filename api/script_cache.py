@@ -0,0 +1,88 @@
+"""
+In-process cache for generated scripts.
+
+Entries expire after SCRIPT_CACHE_TTL_SECONDS and the least recently used
+entry is evicted past SCRIPT_CACHE_MAX_ENTRIES. Concurrent calls for the
+same key share one in-flight generation (single-flight), so a burst of
+retries for one topic costs a single GPT call. Failures are not cached.
+"""
+
+import asyncio
+import copy
+import os
+import re
+import time
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+SCRIPT_CACHE_TTL_SECONDS = float(os.environ.get("SCRIPT_CACHE_TTL_SECONDS", "3600"))
+SCRIPT_CACHE_MAX_ENTRIES = int(os.environ.get("SCRIPT_CACHE_MAX_ENTRIES", "256"))
+
+# key -> (expires_at, script)
+_entries: "OrderedDict[Tuple, Tuple[float, dict]]" = OrderedDict()
+# In-flight generations, per event loop (tasks can't be awaited across loops).
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, asyncio.Task]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def normalize(text: str) -> str:
+    """Case- and whitespace-insensitive form of a topic or niche."""
+    return re.sub(r"\s+", " ", text or "").strip().casefold()
+
+
+def make_key(topic: str, niche: str, beats: int, prompt_version: int) -> Tuple:
+    return (prompt_version, normalize(niche), int(beats), normalize(topic))
+
+
+def _get(key: Tuple) -> Optional[dict]:
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    expires_at, script = entry
+    if expires_at <= time.monotonic():
+        del _entries[key]
+        return None
+    _entries.move_to_end(key)
+    return script
+
+
+def _put(key: Tuple, script: dict) -> None:
+    if SCRIPT_CACHE_TTL_SECONDS <= 0 or SCRIPT_CACHE_MAX_ENTRIES <= 0:
+        return
+    _entries[key] = (time.monotonic() + SCRIPT_CACHE_TTL_SECONDS, script)
+    _entries.move_to_end(key)
+    while len(_entries) > SCRIPT_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+async def get_or_create(key: Tuple, create: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Cached script for key, else the result of create(). Callers get their
+    own copy, so mutating a returned script never touches the cache.
+    """
+    script = _get(key)
+    if script is not None:
+        print(f"[cache] Reusing script for {key[-1]!r}")
+        return copy.deepcopy(script)
+
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(key)
+    if task is None:
+        async def run() -> dict:
+            try:
+                result = await create()
+                _put(key, result)
+                return result
+            finally:
+                inflight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        inflight[key] = task
+    # Shielded so one caller being cancelled doesn't cancel the others' generation.
+    return copy.deepcopy(await asyncio.shield(task))
+
+
+def clear() -> None:
+    _entries.clear()
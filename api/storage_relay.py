@@ -0,0 +1,194 @@
+"""
+Streaming relay from providers into storage.
+
+Chunks flow from the provider response (or any async byte iterator)
+straight into the upload request: at most a couple of chunks are held in
+memory and the upload runs while the download is still arriving. The
+content type is sniffed from the first chunk and a SHA-256 is computed on
+the way through.
+
+STORAGE_BACKEND=local writes into LOCAL_STORAGE_DIR instead, in the
+bucket/path layout the worker's local queue backend serves.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+
+SUPABASE_URL = (os.environ.get("SUPABASE_URL") or "").rstrip("/")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+# Same default as the worker's ASSEMBLY_LOCAL_STORAGE_DIR, so a local worker finds the assets.
+LOCAL_STORAGE_DIR = os.environ.get("LOCAL_STORAGE_DIR") or os.path.join(
+    tempfile.gettempdir(), "reelsbot-assembly", "local_storage"
+)
+RELAY_CHUNK_SIZE = 64 * 1024
+RELAY_TIMEOUT_SECONDS = float(os.environ.get("RELAY_TIMEOUT_SECONDS", "120"))
+DEFAULT_BUCKET = "videos"
+
+# (magic bytes at offset 0, content type)
+_SIGNATURES: Tuple[Tuple[bytes, str], ...] = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"ID3", "audio/mpeg"),
+    (b"\xff\xfb", "audio/mpeg"),
+    (b"\xff\xf3", "audio/mpeg"),
+    (b"OggS", "audio/ogg"),
+)
+
+_upload_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@dataclass
+class RelayResult:
+    """Where a relayed object landed, plus what was measured on the way."""
+    url: str
+    size: int
+    sha256: str
+    content_type: str
+
+
+def enabled() -> bool:
+    """True when there is somewhere to relay to."""
+    if STORAGE_BACKEND == "local":
+        return True
+    return bool(SUPABASE_URL and SUPABASE_KEY)
+
+
+def sniff_content_type(head: bytes, fallback: str) -> str:
+    """Content type from the first bytes of a file, else the fallback."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    for magic, content_type in _SIGNATURES:
+        if head.startswith(magic):
+            return content_type
+    return fallback
+
+
+def _upload_client() -> httpx.AsyncClient:
+    """Pooled client for uploads, one per event loop."""
+    loop = asyncio.get_running_loop()
+    client = _upload_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=RELAY_TIMEOUT_SECONDS)
+        _upload_clients[loop] = client
+    return client
+
+
+async def _upload_supabase(bucket: str, path: str, body, content_type: str, content_length: Optional[int]) -> str:
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY,
+        "Content-Type": content_type,
+        "cache-control": "max-age=3600",
+        "x-upsert": "true",
+    }
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+    resp = await _upload_client().post(f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path}", content=body, headers=headers)
+    resp.raise_for_status()
+    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+
+async def _write_local(bucket: str, path: str, body) -> str:
+    target = Path(LOCAL_STORAGE_DIR, bucket, path).resolve()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with tmp.open("wb") as handle:
+            async for chunk in body:
+                handle.write(chunk)
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return target.as_uri()
+
+
+async def relay_stream(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    content_type: str = "application/octet-stream",
+    content_length: Optional[int] = None,
+    bucket: str = DEFAULT_BUCKET,
+) -> RelayResult:
+    """Upload an async byte stream to bucket/path without buffering it."""
+    iterator = chunks.__aiter__()
+    head = b""
+    async for chunk in iterator:
+        if chunk:
+            head = chunk
+            break
+    detected = sniff_content_type(head, content_type)
+    digest = hashlib.sha256()
+    size = 0
+
+    async def body():
+        nonlocal size
+        if head:
+            digest.update(head)
+            size += len(head)
+            yield head
+        async for chunk in iterator:
+            digest.update(chunk)
+            size += len(chunk)
+            yield chunk
+
+    if STORAGE_BACKEND == "local":
+        url = await _write_local(bucket, path, body())
+    else:
+        url = await _upload_supabase(bucket, path, body(), detected, content_length)
+    return RelayResult(url=url, size=size, sha256=digest.hexdigest(), content_type=detected)
+
+
+async def relay_url(
+    url: str,
+    path: str,
+    content_type: Optional[str] = None,
+    bucket: str = DEFAULT_BUCKET,
+) -> RelayResult:
+    """Stream a provider URL into bucket/path; content_type is the fallback if it can't be detected."""
+    async with httpx.AsyncClient(timeout=RELAY_TIMEOUT_SECONDS, follow_redirects=True) as client:
+        async with client.stream("GET", url) as resp:
+            resp.raise_for_status()
+            length = resp.headers.get("content-length")
+            # aiter_bytes decodes gzip etc., so the length only holds for identity bodies.
+            encoded = resp.headers.get("content-encoding", "identity").lower() != "identity"
+            header_type = resp.headers.get("content-type", "").split(";")[0].strip()
+            if header_type in ("application/octet-stream", "binary/octet-stream"):
+                header_type = ""
+            return await relay_stream(
+                resp.aiter_bytes(RELAY_CHUNK_SIZE),
+                path,
+                header_type or content_type or "application/octet-stream",
+                int(length) if length and length.isdigit() and not encoded else None,
+                bucket,
+            )
+
+
+async def relay_bytes(
+    data: bytes,
+    path: str,
+    content_type: str = "application/octet-stream",
+    bucket: str = DEFAULT_BUCKET,
+) -> RelayResult:
+    """Upload bytes already in memory (e.g. a generated placeholder)."""
+    async def one_chunk():
+        yield data
+
+    return await relay_stream(one_chunk(), path, content_type, len(data), bucket)
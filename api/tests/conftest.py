@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# API modules import each other as top-level modules (uvicorn main:app).
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import script_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    script_cache.clear()
+    yield
+    script_cache.clear()
+
+
+def test_keys_ignore_case_and_whitespace():
+    assert script_cache.make_key("  Dark  Secrets ", "History", 6, 1) == script_cache.make_key("dark secrets", "history", 6, 1)
+    assert script_cache.make_key("dark secrets", "history", 6, 1) != script_cache.make_key("dark secrets", "history", 6, 2)
+
+
+def test_concurrent_calls_share_one_generation():
+    calls = []
+
+    async def create() -> dict:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"beats": ["one"]}
+
+    async def run():
+        key = script_cache.make_key("topic", "niche", 6, 1)
+        return await asyncio.gather(*[script_cache.get_or_create(key, create) for _ in range(5)])
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(result == {"beats": ["one"]} for result in results)
+    # Every caller gets its own copy.
+    results[0]["beats"].append("mutated")
+    assert results[1] == {"beats": ["one"]}
+
+
+def test_results_are_cached_and_copied():
+    calls = []
+
+    async def create() -> dict:
+        calls.append(1)
+        return {"beats": ["one"]}
+
+    async def run():
+        key = script_cache.make_key("topic", "niche", 6, 1)
+        first = await script_cache.get_or_create(key, create)
+        first["beats"].clear()
+        return await script_cache.get_or_create(key, create)
+
+    assert asyncio.run(run()) == {"beats": ["one"]}
+    assert len(calls) == 1
+
+
+def test_failures_are_not_cached():
+    attempts = []
+
+    async def create() -> dict:
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("rate limited")
+        return {"beats": ["ok"]}
+
+    async def run():
+        key = script_cache.make_key("topic", "niche", 6, 1)
+        with pytest.raises(RuntimeError):
+            await script_cache.get_or_create(key, create)
+        return await script_cache.get_or_create(key, create)
+
+    assert asyncio.run(run()) == {"beats": ["ok"]}
+    assert len(attempts) == 2
+
+
+def test_one_cancelled_caller_does_not_cancel_the_others():
+    async def create() -> dict:
+        await asyncio.sleep(0.05)
+        return {"beats": ["one"]}
+
+    async def run():
+        key = script_cache.make_key("topic", "niche", 6, 1)
+        impatient = asyncio.ensure_future(script_cache.get_or_create(key, create))
+        patient = asyncio.ensure_future(script_cache.get_or_create(key, create))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == {"beats": ["one"]}
+
+
+def test_expired_entries_are_regenerated(monkeypatch):
+    monkeypatch.setattr(script_cache, "SCRIPT_CACHE_TTL_SECONDS", 0.01)
+    calls = []
+
+    async def create() -> dict:
+        calls.append(1)
+        return {"beats": [len(calls)]}
+
+    async def run():
+        key = script_cache.make_key("topic", "niche", 6, 1)
+        await script_cache.get_or_create(key, create)
+        await asyncio.sleep(0.02)
+        return await script_cache.get_or_create(key, create)
+
+    assert asyncio.run(run()) == {"beats": [2]}
@@ -0,0 +1,26 @@
+import pytest
+
+from storage_relay import sniff_content_type
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (b"\x89PNG\r\n\x1a\n\x00\x00", "image/png"),
+        (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+        (b"GIF89a\x01\x00", "image/gif"),
+        (b"RIFF\x24\x00\x00\x00WEBPVP8 ", "image/webp"),
+        (b"RIFF\x24\x00\x00\x00WAVEfmt ", "audio/wav"),
+        (b"\x00\x00\x00\x20ftypisom", "video/mp4"),
+        (b"ID3\x04\x00\x00", "audio/mpeg"),
+        (b"\xff\xfb\x90\x00", "audio/mpeg"),
+        (b"OggS\x00\x02", "audio/ogg"),
+    ],
+)
+def test_sniffs_known_signatures(head, expected):
+    assert sniff_content_type(head, "application/octet-stream") == expected
+
+
+@pytest.mark.parametrize("head", [b"", b"RIFF", b"RIFF\x24\x00\x00\x00AVI ", b"<html>"])
+def test_falls_back_for_unknown_or_short_heads(head):
+    assert sniff_content_type(head, "image/png") == "image/png"
@@ -14,20 +14,28 @@ import json
 import gc
 import os
 import uuid
-import time
 import asyncio
+import functools
 import tempfile
 import shutil
 import subprocess
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
-from typing import Optional, List, Callable, Tuple, Union
+from typing import Optional, List, Callable, Tuple, Union, Dict
 
 import httpx
 import imageio_ffmpeg
-from openai import OpenAI
+from openai import AsyncOpenAI
 from supabase import create_client
 from PIL import Image, ImageDraw, ImageFont
 
+import script_cache
+import storage_relay
+from storage_relay import RELAY_CHUNK_SIZE
+
 # Environment variables
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
@@ -37,11 +45,23 @@ MODAL_TOKEN_SECRET = os.environ.get("MODAL_TOKEN_SECRET")
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
-# Initialize clients
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Initialize clients. OpenAI calls are awaited; the blocking SDKs (Replicate,
+# Supabase storage) run on PROVIDER_EXECUTOR so they never stall the event loop.
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY) if SUPABASE_URL and SUPABASE_KEY else None
 
 VIDEO_BUCKET = "videos"
+# Bump when the script prompt changes so cached scripts from the old one are skipped.
+SCRIPT_PROMPT_VERSION = 1
+# Concurrent image requests per provider, shared by all generations on a loop.
+IMAGE_CONCURRENCY = {
+    "replicate": int(os.environ.get("IMAGE_CONCURRENCY_REPLICATE", "4")),
+    "dalle": int(os.environ.get("IMAGE_CONCURRENCY_DALLE", "3")),
+}
+PROVIDER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PROVIDER_EXECUTOR_WORKERS", "16")),
+    thread_name_prefix="provider",
+)
 PLACEHOLDER_BG = (26, 26, 46)
 PLACEHOLDER_TEXT = (255, 255, 255)
 
@@ -107,6 +127,12 @@ ART_STYLES = {
 }
 
 
+async def _run_blocking(fn: Callable, *args, **kwargs):
+    """Run a blocking SDK call on PROVIDER_EXECUTOR and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(PROVIDER_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
 def ensure_bucket():
     if not supabase:
         return
@@ -156,9 +182,19 @@ def _download_file_sync(url: str, dest: Path, timeout: float = 60.0) -> None:
 # ============ SCRIPT GENERATION ============
 
 async def generate_script(topic: str, niche: str = "entertainment", beats: int = 8) -> dict:
+    """
+    Script for topic/niche/beats. Repeats (retries, regenerations) within
+    SCRIPT_CACHE_TTL_SECONDS come from the cache, and identical concurrent
+    requests share one GPT call.
+    """
     if not openai_client:
         raise RuntimeError("OpenAI API key not configured")
 
+    key = script_cache.make_key(topic, niche, beats, SCRIPT_PROMPT_VERSION)
+    return await script_cache.get_or_create(key, lambda: _request_script(topic, niche, beats))
+
+
+async def _request_script(topic: str, niche: str, beats: int) -> dict:
     prompt = f"""Create a viral short-form vertical video script about: {topic}
     Niche: {niche}
 
@@ -185,7 +221,7 @@ async def generate_script(topic: str, niche: str = "entertainment", beats: int =
     }}
     Ensure durations are numbers, not strings."""
 
-    response = openai_client.chat.completions.create(
+    response = await openai_client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a viral video scriptwriter. Always respond with valid JSON."},
@@ -199,7 +235,8 @@ async def generate_script(topic: str, niche: str = "entertainment", beats: int =
 
 # ============ VOICEOVER ============
 
-async def generate_voiceover_openai(text: str, voice: str = "alloy") -> bytes:
+@asynccontextmanager
+async def stream_voiceover_openai(text: str, voice: str = "alloy"):
     if not openai_client:
         raise RuntimeError("OpenAI not configured")
     
@@ -207,20 +244,22 @@ async def generate_voiceover_openai(text: str, voice: str = "alloy") -> bytes:
     if voice not in valid_voices:
         voice = "alloy"
     
-    response = openai_client.audio.speech.create(
+    async with openai_client.audio.speech.with_streaming_response.create(
         model="tts-1",
         voice=voice,
         input=text,
-    )
-    return response.content
+    ) as response:
+        yield response.iter_bytes(RELAY_CHUNK_SIZE)
 
 
-async def generate_voiceover_elevenlabs(text: str, voice_id: str) -> bytes:
+@asynccontextmanager
+async def stream_voiceover_elevenlabs(text: str, voice_id: str):
     if not ELEVENLABS_API_KEY:
         raise RuntimeError("ElevenLabs not configured")
     
     async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
+        async with client.stream(
+            "POST",
             f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
             headers={
                 "Accept": "audio/mpeg",
@@ -237,22 +276,49 @@ async def generate_voiceover_elevenlabs(text: str, voice_id: str) -> bytes:
                     "use_speaker_boost": True
                 },
             },
-        )
-        response.raise_for_status()
-        return response.content
+        ) as response:
+            response.raise_for_status()
+            yield response.aiter_bytes(RELAY_CHUNK_SIZE)
+
+
+@asynccontextmanager
+async def stream_voiceover(text: str, voice: str = "adam"):
+    """
+    Voiceover audio as an async chunk iterator. Falls back to OpenAI when
+    ElevenLabs can't start the stream (auth, quota, voice errors).
+    """
+    async with AsyncExitStack() as stack:
+        chunks = None
+        if ELEVENLABS_API_KEY and voice in ELEVENLABS_VOICES:
+            try:
+                print(f"[voice] Using ElevenLabs: {voice}")
+                chunks = await stack.enter_async_context(stream_voiceover_elevenlabs(text, ELEVENLABS_VOICES[voice]))
+            except Exception as e:
+                print(f"[voice] ElevenLabs failed: {e}")
+
+        if chunks is None:
+            openai_voice = OPENAI_VOICES.get(voice, "alloy")
+            print(f"[voice] Using OpenAI: {openai_voice}")
+            chunks = await stack.enter_async_context(stream_voiceover_openai(text, openai_voice))
+        yield chunks
 
 
 async def generate_voiceover(text: str, voice: str = "adam") -> bytes:
-    if ELEVENLABS_API_KEY and voice in ELEVENLABS_VOICES:
-        try:
-            print(f"[voice] Using ElevenLabs: {voice}")
-            return await generate_voiceover_elevenlabs(text, ELEVENLABS_VOICES[voice])
-        except Exception as e:
-            print(f"[voice] ElevenLabs failed: {e}")
-    
-    openai_voice = OPENAI_VOICES.get(voice, "alloy")
-    print(f"[voice] Using OpenAI: {openai_voice}")
-    return await generate_voiceover_openai(text, openai_voice)
+    async with stream_voiceover(text, voice) as chunks:
+        return b"".join([chunk async for chunk in chunks])
+
+
+async def _generate_and_store_voiceover(video_id: str, narration: str, voice: str) -> Optional[str]:
+    """Synthesize the narration, streaming it into storage; returns the audio URL (None without storage)."""
+    if not storage_relay.enabled():
+        audio_bytes = await generate_voiceover(narration, voice)
+        print(f"[{video_id}] Voiceover: {len(audio_bytes)} bytes (no storage configured)")
+        return None
+
+    async with stream_voiceover(narration, voice) as chunks:
+        stored = await storage_relay.relay_stream(chunks, f"{video_id}/audio.mp3", "audio/mpeg")
+    print(f"[{video_id}] Voiceover: {stored.size} bytes streamed to storage (sha256 {stored.sha256[:12]})")
+    return stored.url
 
 
 # ============ IMAGE GENERATION ============
@@ -273,7 +339,7 @@ async def generate_image_replicate(prompt: str, style: str = "cinematic") -> Opt
         )
         
         def run_once():
-            return replicate.run(
+            return replicate.async_run(
                 "black-forest-labs/flux-schnell",
                 input={
                     "prompt": full_prompt,
@@ -286,13 +352,13 @@ async def generate_image_replicate(prompt: str, style: str = "cinematic") -> Opt
             )
 
         try:
-            output = run_once()
+            output = await run_once()
         except Exception as e:
             msg = str(e)
             if "429" in msg or "rate limit" in msg.lower():
                 print("[image] Replicate 429, retrying after 10s...")
-                time.sleep(10)
-                output = run_once()
+                await asyncio.sleep(10)
+                output = await run_once()
             else:
                 raise
         
@@ -332,7 +398,7 @@ async def generate_image_dalle(prompt: str, style: str = "cinematic") -> str:
     )
 
     try:
-        response = openai_client.images.generate(
+        response = await openai_client.images.generate(
             model="dall-e-3",
             prompt=base_prompt,
             size="1024x1792",  # Portrait 9:16 format (TikTok optimized)
@@ -349,7 +415,7 @@ async def generate_image_dalle(prompt: str, style: str = "cinematic") -> str:
                 f"{prompt}. With human subjects, positive emotions, welcoming composition. "
                 "Vertical 9:16 format, no violence, no gore. No text, no watermarks."
             )
-            response = openai_client.images.generate(
+            response = await openai_client.images.generate(
                 model="dall-e-3",
                 prompt=safe_prompt,
                 size="1024x1792",
@@ -360,14 +426,67 @@ async def generate_image_dalle(prompt: str, style: str = "cinematic") -> str:
         raise
 
 
+_provider_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """Concurrency limit for one image provider on the running event loop."""
+    per_loop = _provider_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if provider not in per_loop:
+        per_loop[provider] = asyncio.Semaphore(max(1, IMAGE_CONCURRENCY[provider]))
+    return per_loop[provider]
+
+
 async def generate_image(prompt: str, style: str = "cinematic") -> str:
     if REPLICATE_API_TOKEN:
-        img_url = await generate_image_replicate(prompt, style)
+        async with _provider_semaphore("replicate"):
+            img_url = await generate_image_replicate(prompt, style)
         if img_url:
             return img_url
         print(f"[image] Replicate failed, trying DALL-E")
-    
-    return await generate_image_dalle(prompt, style)
+
+    async with _provider_semaphore("dalle"):
+        return await generate_image_dalle(prompt, style)
+
+
+async def _generate_beat_image(video_id: str, index: int, beat: dict, art_style: str, total: int) -> str:
+    """Generate and store one beat's image; a placeholder stands in if generation fails."""
+    try:
+        print(f"[{video_id}] Image {index+1}/{total}...")
+        img_url = await generate_image(beat["visual"], art_style)
+
+        # Store immediately, streaming from the provider into storage
+        if storage_relay.enabled() and img_url:
+            try:
+                stored = await storage_relay.relay_url(img_url, f"{video_id}/image_{index+1:02d}.webp", "image/webp")
+                img_url = stored.url
+            except Exception as e:
+                print(f"[{video_id}] Image storage failed: {e}")
+
+        return img_url
+
+    except Exception as e:
+        print(f"[{video_id}] Image {index+1} failed: {e}")
+        placeholder_bytes = create_placeholder_image(beat.get("visual", f"Scene {index+1}"))
+        stored = None
+        if storage_relay.enabled():
+            try:
+                stored = await storage_relay.relay_bytes(
+                    placeholder_bytes, f"{video_id}/image_{index+1:02d}_placeholder.jpg", "image/jpeg"
+                )
+            except Exception as store_err:
+                print(f"[{video_id}] Placeholder storage failed: {store_err}")
+        del placeholder_bytes
+        return stored.url if stored else ""
+
+
+async def generate_beat_images(video_id: str, beats: List[dict], art_style: str) -> List[str]:
+    """Image URLs for every beat, in beat order, generated concurrently within the provider limits."""
+    return list(await asyncio.gather(*(
+        _generate_beat_image(video_id, i, beat, art_style, len(beats)) for i, beat in enumerate(beats)
+    )))
 
 
 # ============ VIDEO ASSEMBLY (Modal) ============
@@ -462,6 +581,90 @@ def _get_ffmpeg_path() -> str:
         return "ffmpeg"
 
 
+def _available_cores() -> int:
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+ENCODE_WORKERS = int(os.environ.get("ASSEMBLY_ENCODE_WORKERS", "0")) or max(1, min(4, _available_cores() // 2))
+ENCODE_THREADS = int(os.environ.get("ASSEMBLY_ENCODE_THREADS", "0")) or max(1, _available_cores() // ENCODE_WORKERS)
+
+# Same profiles as worker/config.py RENDER_PROFILES (the API deploys without worker modules).
+RENDER_PROFILES = {
+    "draft": {
+        "width": 540, "height": 960, "fps": 24,
+        "preset": "ultrafast", "crf": 32,
+        "segment_preset": "ultrafast", "segment_crf": 32,
+        "audio_bitrate": "96k",
+    },
+    "preview": {
+        "width": 720, "height": 1280, "fps": 30,
+        "preset": "veryfast", "crf": 28,
+        "segment_preset": "veryfast", "segment_crf": 28,
+        "audio_bitrate": "128k",
+    },
+    "final": {
+        "width": 1080, "height": 1920, "fps": 30,
+        "preset": "fast", "crf": 23,
+        "segment_preset": "veryfast", "segment_crf": 28,
+        "audio_bitrate": "192k",
+    },
+}
+
+
+def _run_segment_encodes(
+    commands: List[List[str]],
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> Optional[str]:
+    """Encode segments on a bounded pool; first failure or cancel kills the rest."""
+    abort = threading.Event()
+    running: Dict[int, subprocess.Popen] = {}
+    lock = threading.Lock()
+
+    def run_one(index: int, cmd: List[str]) -> Optional[str]:
+        with lock:
+            if abort.is_set():
+                return None
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            running[index] = proc
+        try:
+            _, stderr = proc.communicate()
+        finally:
+            with lock:
+                running.pop(index, None)
+        if proc.returncode != 0 and not abort.is_set():
+            return f"Segment {index} failed: {(stderr or '')[-200:]}"
+        return None
+
+    error = None
+    with ThreadPoolExecutor(max_workers=min(ENCODE_WORKERS, len(commands)) or 1) as pool:
+        pending = {pool.submit(run_one, i, cmd) for i, cmd in enumerate(commands)}
+        while pending:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result and not error:
+                    error = result
+            if not error and should_cancel and should_cancel():
+                error = "Canceled by user"
+            if error:
+                with lock:
+                    abort.set()
+                    procs = list(running.values())
+                for proc in procs:
+                    try:
+                        proc.kill()
+                    except Exception:
+                        pass
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+                break
+    return error
+
+
 def assemble_video_local_sync(
     video_id: str,
     image_urls: List[str],
@@ -472,7 +675,14 @@ def assemble_video_local_sync(
     fps: int = 30,
     progress_cb: Optional[Callable[[dict], None]] = None,
     should_cancel: Optional[Callable[[], bool]] = None,
+    render_profile: Optional[str] = None,
 ) -> Tuple[Optional[str], Optional[str]]:
+    # An explicit profile overrides the size args; without one the encoder
+    # settings match the historical 720x1280 preview render.
+    profile = RENDER_PROFILES.get(render_profile or "preview", RENDER_PROFILES["preview"])
+    if render_profile in RENDER_PROFILES:
+        output_width, output_height, fps = profile["width"], profile["height"], profile["fps"]
+
     if not image_urls:
         return None, "No image URLs provided"
     if not audio_url:
@@ -508,11 +718,10 @@ def assemble_video_local_sync(
             progress_cb({"stage": "building_segments", "progress": 40, "log": "Building video segments"})
 
         segment_paths: List[Path] = []
+        segment_cmds: List[List[str]] = []
         for idx, (img_path, duration) in enumerate(zip(image_paths, durations)):
-            if should_cancel and should_cancel():
-                return None, "Canceled by user"
             seg_path = tmpdir / f"seg_{idx:03d}.mp4"
-            cmd = [
+            segment_cmds.append([
                 ffmpeg_bin,
                 "-y",
                 "-loop", "1",
@@ -521,17 +730,19 @@ def assemble_video_local_sync(
                 "-vf", f"scale={output_width}:{output_height},format=yuv420p",
                 "-r", str(fps),
                 "-c:v", "libx264",
-                "-preset", "veryfast",
-                "-crf", "28",
+                "-preset", profile["segment_preset"],
+                "-crf", str(profile["segment_crf"]),
+                "-threads", str(ENCODE_THREADS),
                 "-pix_fmt", "yuv420p",
                 "-an",
                 str(seg_path),
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                return None, f"Segment {idx} failed: {result.stderr[:200]}"
+            ])
             segment_paths.append(seg_path)
 
+        segment_error = _run_segment_encodes(segment_cmds, should_cancel)
+        if segment_error:
+            return None, segment_error
+
         if progress_cb:
             progress_cb({"stage": "concatenating", "progress": 70, "log": "Concatenating segments"})
 
@@ -556,8 +767,8 @@ def assemble_video_local_sync(
                 "-safe", "0",
                 "-i", str(concat_list),
                 "-c:v", "libx264",
-                "-preset", "veryfast",
-                "-crf", "28",
+                "-preset", profile["segment_preset"],
+                "-crf", str(profile["segment_crf"]),
                 "-pix_fmt", "yuv420p",
                 str(video_only),
             ]
@@ -578,6 +789,7 @@ def assemble_video_local_sync(
             "-i", str(audio_path),
             "-c:v", "copy",
             "-c:a", "aac",
+            "-b:a", profile["audio_bitrate"],
             "-shortest",
             str(final_path),
         ]
@@ -589,9 +801,10 @@ def assemble_video_local_sync(
                 "-i", str(video_only),
                 "-i", str(audio_path),
                 "-c:v", "libx264",
-                "-preset", "veryfast",
-                "-crf", "28",
+                "-preset", profile["preset"],
+                "-crf", str(profile["crf"]),
                 "-c:a", "aac",
+                "-b:a", profile["audio_bitrate"],
                 "-shortest",
                 str(final_path),
             ]
@@ -644,8 +857,8 @@ async def generate_video(
     """
     Main video generation function V2.
     1. Generate script (GPT-4)
-    2. Generate voiceover (ElevenLabs/OpenAI)
-    3. Generate images (Replicate/DALL-E)
+    2. Generate voiceover (ElevenLabs/OpenAI)  } concurrently; a failed branch
+    3. Generate images (Replicate/DALL-E)      } leaves the other's assets intact
     4. Assemble VIRAL video V2 (Modal - with word-by-word captions, BGM, transitions, color grading!)
     """
     video_id = str(uuid.uuid4())[:8]
@@ -656,65 +869,44 @@ async def generate_video(
     if not openai_client:
         raise RuntimeError("OpenAI API key required")
     
-    ensure_bucket()
+    await _run_blocking(ensure_bucket)
     
     # ===== STEP 1: Generate Script =====
     print(f"[{video_id}] Step 1/4: Generating script...")
     script = await generate_script(topic, niche, beats_count)
     print(f"[{video_id}] Script: {script.get('title', 'Untitled')}")
     
-    # ===== STEP 2: Generate Voiceover =====
-    print(f"[{video_id}] Step 2/4: Generating voiceover...")
+    # ===== STEPS 2-3: Voiceover and Images (independent, run together) =====
+    print(f"[{video_id}] Steps 2-3/4: Generating voiceover and {len(script['beats'])} images...")
     narration = script["hook"] + " " + " ".join([b["line"] for b in script["beats"]]) + " " + script["cta"]
-    
-    audio_bytes = await generate_voiceover(narration, voice)
-    print(f"[{video_id}] Voiceover: {len(audio_bytes)} bytes")
-    
-    # Upload audio
-    audio_url = None
-    if supabase:
-        audio_url = upload_to_storage(f"{video_id}/audio.mp3", audio_bytes, "audio/mpeg")
-        print(f"[{video_id}] Audio uploaded")
-    del audio_bytes
+
+    # Each branch fails on its own: a TTS error keeps the finished images and vice versa.
+    audio_result, images_result = await asyncio.gather(
+        _generate_and_store_voiceover(video_id, narration, voice),
+        generate_beat_images(video_id, script["beats"], art_style),
+        return_exceptions=True,
+    )
     gc.collect()
-    
-    # ===== STEP 3: Generate Images =====
-    print(f"[{video_id}] Step 3/4: Generating {len(script['beats'])} images...")
+
+    audio_url = None
+    branch_errors = []
+    if isinstance(audio_result, BaseException):
+        print(f"[{video_id}] Voiceover failed: {audio_result}")
+        branch_errors.append(f"Voiceover failed: {audio_result}")
+    else:
+        audio_url = audio_result
+
     image_urls = []
-    
-    for i, beat in enumerate(script["beats"]):
-        try:
-            print(f"[{video_id}] Image {i+1}/{len(script['beats'])}...")
-            img_url = await generate_image(beat["visual"], art_style)
-            
-            # Store immediately
-            if supabase and img_url:
-                try:
-                    img_bytes = await download_bytes(img_url)
-                    stored_url = upload_to_storage(
-                        f"{video_id}/image_{i+1:02d}.webp",
-                        img_bytes,
-                        "image/webp"
-                    )
-                    del img_bytes
-                    if stored_url:
-                        img_url = stored_url
-                except Exception as e:
-                    print(f"[{video_id}] Image storage failed: {e}")
-            
-            image_urls.append(img_url)
-            
-        except Exception as e:
-            print(f"[{video_id}] Image {i+1} failed: {e}")
-            placeholder_bytes = create_placeholder_image(beat.get("visual", f"Scene {i+1}"))
-            stored = upload_to_storage(f"{video_id}/image_{i+1:02d}_placeholder.jpg", placeholder_bytes, "image/jpeg") if supabase else None
-            del placeholder_bytes
-            image_urls.append(stored or "")
+    if isinstance(images_result, BaseException):
+        print(f"[{video_id}] Image generation failed: {images_result}")
+        branch_errors.append(f"Image generation failed: {images_result}")
+    else:
+        image_urls = images_result
     
     # ===== STEP 4: Assemble Video =====
     video_url = None
     status = "assets_ready"
-    assembly_reason = ""
+    assembly_reason = "; ".join(branch_errors)
     
     MODAL_WEBHOOK_URL = os.environ.get("MODAL_WEBHOOK_URL")
     assembly_backend = os.environ.get("ASSEMBLY_BACKEND", "queue").lower()
@@ -773,17 +965,10 @@ async def generate_video(
             
             if video_url:
                 # Store final video in Supabase
-                if supabase:
+                if storage_relay.enabled():
                     try:
-                        video_bytes = await download_bytes(video_url)
-                        stored_url = upload_to_storage(
-                            f"{video_id}/video.mp4",
-                            video_bytes,
-                            "video/mp4"
-                        )
-                        del video_bytes
-                        if stored_url:
-                            video_url = stored_url
+                        stored = await storage_relay.relay_url(video_url, f"{video_id}/video.mp4", "video/mp4")
+                        video_url = stored.url
                     except Exception as e:
                         print(f"[{video_id}] Video storage failed: {e}")
                 
@@ -888,10 +1073,8 @@ async def reassemble_video(
         beats = script.get("beats", [])
         narration = script.get("hook", "") + " " + " ".join([b.get("line", "") for b in beats]) + " " + script.get("cta", "")
         
-        audio_bytes = await generate_voiceover(narration, voice)
-        if supabase:
-            audio_url = upload_to_storage(f"{video_id}/audio.mp3", audio_bytes, "audio/mpeg")
-            print(f"[{video_id}] Audio regenerated: {audio_url}")
+        audio_url = await _generate_and_store_voiceover(video_id, narration, voice)
+        print(f"[{video_id}] Audio regenerated: {audio_url}")
     else:
         print(f"[{video_id}] Using existing audio")
     
@@ -117,16 +117,33 @@ CREATE TABLE IF NOT EXISTS assembly_jobs (
     locked_at TIMESTAMPTZ,
     locked_by TEXT,
 
-    -- Error tracking
+    -- Error tracking (failed_stage / error_history: stage and class per failed attempt)
     last_error TEXT,
+    failed_stage TEXT,
+    error_history JSONB DEFAULT '[]'::JSONB,
 
     -- Retry mechanism
     next_run_at TIMESTAMPTZ,
 
+    -- Per-stage timing/resource metrics
+    metrics JSONB,
+
+    -- Render dedup (fingerprint of render inputs, uploaded output)
+    fingerprint TEXT,
+    output_url TEXT,
+    -- Identical manifests (all but video_id) render identically; the claim runs one at a time
+    render_key TEXT GENERATED ALWAYS AS (
+        CASE WHEN payload ? 'manifest_version' THEN md5((payload - 'video_id')::TEXT) END
+    ) STORED,
+
     -- Source tracking
     source_type TEXT DEFAULT 'director',
     source_id UUID,
 
+    -- Fair-share scheduling (owner and pricing tier)
+    user_id TEXT,
+    tier TEXT,
+
     -- Timestamps
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
@@ -174,6 +191,11 @@ CREATE INDEX IF NOT EXISTS idx_assembly_jobs_video_id ON assembly_jobs(video_id)
 CREATE INDEX IF NOT EXISTS idx_assembly_jobs_source ON assembly_jobs(source_type, source_id);
 CREATE INDEX IF NOT EXISTS idx_assembly_jobs_status_priority ON assembly_jobs(status, priority DESC, created_at ASC)
     WHERE status IN ('pending', 'retry');
+CREATE INDEX IF NOT EXISTS idx_assembly_jobs_user_status ON assembly_jobs(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_assembly_jobs_fingerprint ON assembly_jobs(fingerprint, status)
+    WHERE fingerprint IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_assembly_jobs_render_key ON assembly_jobs(render_key, status)
+    WHERE render_key IS NOT NULL;
 
 -- Social accounts indexes
 CREATE INDEX IF NOT EXISTS idx_social_accounts_user_id ON social_accounts(user_id);
@@ -192,6 +214,19 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Wake LISTENing workers when an assembly job becomes claimable
+CREATE OR REPLACE FUNCTION notify_assembly_job()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Delayed retries are picked up by the workers' idle polling instead
+    IF NEW.status IN ('pending', 'retry')
+        AND (NEW.next_run_at IS NULL OR NEW.next_run_at <= NOW()) THEN
+        PERFORM pg_notify('assembly_jobs', NEW.id::TEXT);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Update series statistics
 CREATE OR REPLACE FUNCTION update_series_stats()
 RETURNS TRIGGER AS $$
@@ -239,50 +274,176 @@ RETURNS TABLE (
     source_type TEXT,
     source_id UUID,
     created_at TIMESTAMPTZ,
-    updated_at TIMESTAMPTZ
+    updated_at TIMESTAMPTZ,
+    fingerprint TEXT
 )
 LANGUAGE plpgsql
 AS $$
+BEGIN
+    -- One job with the batch claim's fair-share ordering (default weights, no caps)
+    RETURN QUERY
+    SELECT * FROM claim_assembly_jobs(worker_id, lock_seconds, 1);
+END;
+$$;
+
+-- Batch claim with per-user fair share (multi-slot workers)
+CREATE OR REPLACE FUNCTION claim_assembly_jobs(
+    worker_id TEXT,
+    lock_seconds INTEGER DEFAULT 900,
+    max_jobs INTEGER DEFAULT 1,
+    tier_policy JSONB DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    video_id TEXT,
+    status TEXT,
+    priority INTEGER,
+    attempts INTEGER,
+    max_attempts INTEGER,
+    payload JSONB,
+    locked_at TIMESTAMPTZ,
+    locked_by TEXT,
+    last_error TEXT,
+    next_run_at TIMESTAMPTZ,
+    source_type TEXT,
+    source_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    fingerprint TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Serialize claims so per-user running counts can't race between workers
+    PERFORM pg_advisory_xact_lock(hashtext('claim_assembly_jobs'));
+
+    -- Weighted fair share: a user's k-th waiting job is ordered by
+    -- (running + k) / weight, so light users go ahead of a deep backlog
+    -- and heavier tiers get proportionally more turns. tier_policy is
+    -- {"<tier>": {"weight": n, "max_running": n}}; unknown or missing
+    -- tiers use "free". Jobs without a user_id (enqueue stores placeholder
+    -- owners as NULL) are their own group and have no running cap. Jobs
+    -- with the same manifest (render_key) are handed out one at a time: a
+    -- twin of a running job waits, and only the first of several waiting
+    -- twins is claimable, so the rest reuse its output once it completes.
+    RETURN QUERY
+    WITH running AS (
+        SELECT aj.user_id AS owner, COUNT(*) AS running_count
+        FROM assembly_jobs aj
+        WHERE aj.status = 'running'
+            AND aj.user_id IS NOT NULL
+        GROUP BY aj.user_id
+    ),
+    waiting AS (
+        SELECT
+            aj.id AS job_id,
+            aj.user_id AS owner,
+            aj.priority AS job_priority,
+            aj.created_at AS job_created_at,
+            COALESCE(tier_policy -> aj.tier, tier_policy -> 'free') AS rule,
+            CASE WHEN aj.user_id IS NOT NULL
+                THEN COALESCE(tier_policy -> aj.tier, tier_policy -> 'free') ->> 'max_running'
+            END AS tier_cap,
+            ROW_NUMBER() OVER (
+                PARTITION BY COALESCE(aj.render_key, aj.id::TEXT)
+                ORDER BY aj.priority DESC, aj.created_at ASC, aj.id ASC
+            ) AS twin_rank
+        FROM assembly_jobs aj
+        WHERE aj.status IN ('pending', 'retry')
+            AND (aj.next_run_at IS NULL OR aj.next_run_at <= NOW())
+            AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (lock_seconds || ' seconds')::INTERVAL)
+            AND (aj.render_key IS NULL OR NOT EXISTS (
+                SELECT 1 FROM assembly_jobs twin
+                WHERE twin.render_key = aj.render_key
+                    AND twin.status = 'running'
+            ))
+    ),
+    ranked AS (
+        SELECT
+            w.job_id,
+            w.job_priority,
+            w.job_created_at,
+            COALESCE(r.running_count, 0) + ROW_NUMBER() OVER (
+                PARTITION BY COALESCE(w.owner, w.job_id::TEXT)
+                ORDER BY w.job_priority DESC, w.job_created_at ASC
+            ) AS user_slot,
+            GREATEST(COALESCE((w.rule ->> 'weight')::NUMERIC, 1), 0.01) AS weight,
+            w.tier_cap::INTEGER AS max_running
+        FROM waiting w
+        LEFT JOIN running r ON r.owner = w.owner
+        WHERE w.twin_rank = 1
+    ),
+    claimable AS (
+        SELECT aj.id AS job_id
+        FROM assembly_jobs aj
+        JOIN ranked rk ON rk.job_id = aj.id
+        WHERE aj.status IN ('pending', 'retry')
+            AND (rk.max_running IS NULL OR rk.user_slot <= rk.max_running)
+        ORDER BY rk.job_priority DESC, rk.user_slot / rk.weight ASC, rk.job_created_at ASC
+        FOR UPDATE OF aj SKIP LOCKED
+        LIMIT GREATEST(max_jobs, 1)
+    )
+    UPDATE assembly_jobs aj
+    SET
+        status = 'running',
+        locked_by = worker_id,
+        locked_at = NOW(),
+        updated_at = NOW()
+    FROM claimable c
+    WHERE aj.id = c.job_id
+    RETURNING
+        aj.id,
+        aj.video_id,
+        aj.status,
+        aj.priority,
+        aj.attempts,
+        aj.max_attempts,
+        aj.payload,
+        aj.locked_at,
+        aj.locked_by,
+        aj.last_error,
+        aj.next_run_at,
+        aj.source_type,
+        aj.source_id,
+        aj.created_at,
+        aj.updated_at,
+        aj.fingerprint;
+END;
+$$;
+
+-- Requeue running jobs whose worker stopped heartbeating
+CREATE OR REPLACE FUNCTION reap_stale_assembly_jobs(
+    stale_seconds INTEGER DEFAULT 45
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
 DECLARE
-    v_job_id UUID;
+    v_reaped INTEGER;
 BEGIN
-    -- Find and lock a job atomically
-    SELECT aj.id INTO v_job_id
-    FROM assembly_jobs aj
-    WHERE aj.status IN ('pending', 'retry')
-        AND (aj.next_run_at IS NULL OR aj.next_run_at <= NOW())
-        AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (lock_seconds || ' seconds')::INTERVAL)
-    ORDER BY aj.priority DESC, aj.created_at ASC
-    FOR UPDATE SKIP LOCKED
-    LIMIT 1;
-
-    -- Update and return the job if found
-    IF v_job_id IS NOT NULL THEN
-        RETURN QUERY
-        UPDATE assembly_jobs aj
-        SET
-            status = 'running',
-            locked_by = worker_id,
-            locked_at = NOW(),
-            updated_at = NOW()
-        WHERE aj.id = v_job_id
-        RETURNING
-            aj.id,
-            aj.video_id,
-            aj.status,
-            aj.priority,
-            aj.attempts,
-            aj.max_attempts,
-            aj.payload,
-            aj.locked_at,
-            aj.locked_by,
-            aj.last_error,
-            aj.next_run_at,
-            aj.source_type,
-            aj.source_id,
-            aj.created_at,
-            aj.updated_at;
-    END IF;
+    -- Running jobs whose worker stopped renewing locked_at go back to the
+    -- queue (or fail once they are out of attempts)
+    WITH stale AS (
+        SELECT aj.id AS job_id
+        FROM assembly_jobs aj
+        WHERE aj.status = 'running'
+            AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (stale_seconds || ' seconds')::INTERVAL)
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE assembly_jobs aj
+    SET
+        status = CASE WHEN aj.attempts + 1 >= aj.max_attempts THEN 'failed' ELSE 'retry' END,
+        attempts = aj.attempts + 1,
+        last_error = 'Lease expired (worker ' || COALESCE(aj.locked_by, 'unknown') || ' stopped heartbeating)',
+        locked_by = NULL,
+        locked_at = NULL,
+        next_run_at = NOW(),
+        updated_at = NOW()
+    FROM stale s
+    WHERE aj.id = s.job_id;
+
+    GET DIAGNOSTICS v_reaped = ROW_COUNT;
+    RETURN v_reaped;
 END;
 $$;
 
@@ -325,6 +486,13 @@ CREATE TRIGGER trigger_update_series_stats
     FOR EACH ROW
     EXECUTE FUNCTION update_series_stats();
 
+-- Assembly job wakeup trigger
+DROP TRIGGER IF EXISTS trigger_notify_assembly_job ON assembly_jobs;
+CREATE TRIGGER trigger_notify_assembly_job
+    AFTER INSERT OR UPDATE OF status ON assembly_jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_assembly_job();
+
 -- =====================================================
 -- 9. ROW LEVEL SECURITY
 -- =====================================================
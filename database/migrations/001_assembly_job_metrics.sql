@@ -0,0 +1,6 @@
+-- =====================================================
+-- Assembly job metrics
+-- Per-stage timing/resource blob written by the worker
+-- (wall time, child CPU, peak RSS, bytes in/out, ffmpeg speed)
+-- =====================================================
+ALTER TABLE assembly_jobs ADD COLUMN IF NOT EXISTS metrics JSONB;
@@ -0,0 +1,68 @@
+-- =====================================================
+-- Batch job claiming
+-- Lets a multi-slot worker claim several assembly jobs in
+-- one round trip (FOR UPDATE SKIP LOCKED, like claim_assembly_job)
+-- =====================================================
+CREATE OR REPLACE FUNCTION claim_assembly_jobs(
+    worker_id TEXT,
+    lock_seconds INTEGER DEFAULT 900,
+    max_jobs INTEGER DEFAULT 1
+)
+RETURNS TABLE (
+    id UUID,
+    video_id TEXT,
+    status TEXT,
+    priority INTEGER,
+    attempts INTEGER,
+    max_attempts INTEGER,
+    payload JSONB,
+    locked_at TIMESTAMPTZ,
+    locked_by TEXT,
+    last_error TEXT,
+    next_run_at TIMESTAMPTZ,
+    source_type TEXT,
+    source_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Same selection and locking as claim_assembly_job, up to max_jobs rows
+    RETURN QUERY
+    WITH claimable AS (
+        SELECT aj.id AS job_id
+        FROM assembly_jobs aj
+        WHERE aj.status IN ('pending', 'retry')
+            AND (aj.next_run_at IS NULL OR aj.next_run_at <= NOW())
+            AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (lock_seconds || ' seconds')::INTERVAL)
+        ORDER BY aj.priority DESC, aj.created_at ASC
+        FOR UPDATE SKIP LOCKED
+        LIMIT GREATEST(max_jobs, 1)
+    )
+    UPDATE assembly_jobs aj
+    SET
+        status = 'running',
+        locked_by = worker_id,
+        locked_at = NOW(),
+        updated_at = NOW()
+    FROM claimable c
+    WHERE aj.id = c.job_id
+    RETURNING
+        aj.id,
+        aj.video_id,
+        aj.status,
+        aj.priority,
+        aj.attempts,
+        aj.max_attempts,
+        aj.payload,
+        aj.locked_at,
+        aj.locked_by,
+        aj.last_error,
+        aj.next_run_at,
+        aj.source_type,
+        aj.source_id,
+        aj.created_at,
+        aj.updated_at;
+END;
+$$;
@@ -0,0 +1,22 @@
+-- =====================================================
+-- Assembly job wakeups
+-- NOTIFY assembly_jobs whenever a job becomes claimable so
+-- workers LISTENing (ASSEMBLY_NOTIFY_DSN) pick it up at once
+-- =====================================================
+CREATE OR REPLACE FUNCTION notify_assembly_job()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Delayed retries are picked up by the workers' idle polling instead
+    IF NEW.status IN ('pending', 'retry')
+        AND (NEW.next_run_at IS NULL OR NEW.next_run_at <= NOW()) THEN
+        PERFORM pg_notify('assembly_jobs', NEW.id::TEXT);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_notify_assembly_job ON assembly_jobs;
+CREATE TRIGGER trigger_notify_assembly_job
+    AFTER INSERT OR UPDATE OF status ON assembly_jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_assembly_job();
@@ -0,0 +1,40 @@
+-- =====================================================
+-- Assembly job leases
+-- Workers renew locked_at on running jobs every
+-- ASSEMBLY_HEARTBEAT_SECONDS and call this reaper to requeue
+-- jobs whose worker died or stalled
+-- =====================================================
+CREATE OR REPLACE FUNCTION reap_stale_assembly_jobs(
+    stale_seconds INTEGER DEFAULT 45
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_reaped INTEGER;
+BEGIN
+    -- Running jobs whose worker stopped renewing locked_at go back to the
+    -- queue (or fail once they are out of attempts)
+    WITH stale AS (
+        SELECT aj.id AS job_id
+        FROM assembly_jobs aj
+        WHERE aj.status = 'running'
+            AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (stale_seconds || ' seconds')::INTERVAL)
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE assembly_jobs aj
+    SET
+        status = CASE WHEN aj.attempts + 1 >= aj.max_attempts THEN 'failed' ELSE 'retry' END,
+        attempts = aj.attempts + 1,
+        last_error = 'Lease expired (worker ' || COALESCE(aj.locked_by, 'unknown') || ' stopped heartbeating)',
+        locked_by = NULL,
+        locked_at = NULL,
+        next_run_at = NOW(),
+        updated_at = NOW()
+    FROM stale s
+    WHERE aj.id = s.job_id;
+
+    GET DIAGNOSTICS v_reaped = ROW_COUNT;
+    RETURN v_reaped;
+END;
+$$;
@@ -0,0 +1,10 @@
+-- =====================================================
+-- Render deduplication
+-- Jobs store a fingerprint of their render inputs and the URL
+-- of their output, so identical payloads reuse a finished
+-- render (or wait for a running one) instead of encoding again
+-- =====================================================
+ALTER TABLE assembly_jobs ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+ALTER TABLE assembly_jobs ADD COLUMN IF NOT EXISTS output_url TEXT;
+CREATE INDEX IF NOT EXISTS idx_assembly_jobs_fingerprint ON assembly_jobs(fingerprint, status)
+    WHERE fingerprint IS NOT NULL;
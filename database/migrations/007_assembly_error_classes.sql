@@ -0,0 +1,8 @@
+-- =====================================================
+-- Error-classified retries
+-- Each failed attempt records the stage it failed in and
+-- whether the error was transient (retried with backoff) or
+-- permanent (failed immediately)
+-- =====================================================
+ALTER TABLE assembly_jobs ADD COLUMN IF NOT EXISTS failed_stage TEXT;
+ALTER TABLE assembly_jobs ADD COLUMN IF NOT EXISTS error_history JSONB DEFAULT '[]'::JSONB;
@@ -0,0 +1,167 @@
+-- =====================================================
+-- One claim per render fingerprint
+-- The API stores each job's fingerprint at enqueue, and the claim
+-- holds back twins: a job whose fingerprint is already running waits,
+-- and of several waiting twins only the first is claimable. Claims
+-- are serialized, so identical jobs can no longer render side by side;
+-- the held-back twins reuse the output once it completes. Both claim
+-- functions now also return the fingerprint.
+-- =====================================================
+
+-- The result columns change, so both functions are recreated
+DROP FUNCTION IF EXISTS claim_assembly_job(TEXT, INTEGER);
+DROP FUNCTION IF EXISTS claim_assembly_jobs(TEXT, INTEGER, INTEGER, JSONB);
+
+CREATE OR REPLACE FUNCTION claim_assembly_job(
+    worker_id TEXT,
+    lock_seconds INTEGER DEFAULT 900
+)
+RETURNS TABLE (
+    id UUID,
+    video_id TEXT,
+    status TEXT,
+    priority INTEGER,
+    attempts INTEGER,
+    max_attempts INTEGER,
+    payload JSONB,
+    locked_at TIMESTAMPTZ,
+    locked_by TEXT,
+    last_error TEXT,
+    next_run_at TIMESTAMPTZ,
+    source_type TEXT,
+    source_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    fingerprint TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- One job with the batch claim's fair-share ordering (default weights, no caps)
+    RETURN QUERY
+    SELECT * FROM claim_assembly_jobs(worker_id, lock_seconds, 1);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION claim_assembly_jobs(
+    worker_id TEXT,
+    lock_seconds INTEGER DEFAULT 900,
+    max_jobs INTEGER DEFAULT 1,
+    tier_policy JSONB DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    video_id TEXT,
+    status TEXT,
+    priority INTEGER,
+    attempts INTEGER,
+    max_attempts INTEGER,
+    payload JSONB,
+    locked_at TIMESTAMPTZ,
+    locked_by TEXT,
+    last_error TEXT,
+    next_run_at TIMESTAMPTZ,
+    source_type TEXT,
+    source_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    fingerprint TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Serialize claims so per-user running counts can't race between workers
+    PERFORM pg_advisory_xact_lock(hashtext('claim_assembly_jobs'));
+
+    -- Weighted fair share: a user's k-th waiting job is ordered by
+    -- (running + k) / weight, so light users go ahead of a deep backlog
+    -- and heavier tiers get proportionally more turns. tier_policy is
+    -- {"<tier>": {"weight": n, "max_running": n}}. Unknown or missing
+    -- tiers get the "free" weight but no running cap: until jobs carry a
+    -- real tier, capping them would throttle the whole fleet. Jobs without
+    -- a user_id are their own group. Jobs sharing a render fingerprint
+    -- are handed out one at a time: a twin of a running job waits, and
+    -- only the first of several waiting twins is claimable, so the rest
+    -- reuse its output once it completes.
+    RETURN QUERY
+    WITH running AS (
+        SELECT aj.user_id AS owner, COUNT(*) AS running_count
+        FROM assembly_jobs aj
+        WHERE aj.status = 'running'
+            AND aj.user_id IS NOT NULL
+        GROUP BY aj.user_id
+    ),
+    waiting AS (
+        SELECT
+            aj.id AS job_id,
+            aj.user_id AS owner,
+            aj.priority AS job_priority,
+            aj.created_at AS job_created_at,
+            COALESCE(tier_policy -> aj.tier, tier_policy -> 'free') AS rule,
+            tier_policy -> aj.tier ->> 'max_running' AS tier_cap,
+            ROW_NUMBER() OVER (
+                PARTITION BY COALESCE(aj.fingerprint, aj.id::TEXT)
+                ORDER BY aj.priority DESC, aj.created_at ASC, aj.id ASC
+            ) AS twin_rank
+        FROM assembly_jobs aj
+        WHERE aj.status IN ('pending', 'retry')
+            AND (aj.next_run_at IS NULL OR aj.next_run_at <= NOW())
+            AND (aj.locked_at IS NULL OR aj.locked_at < NOW() - (lock_seconds || ' seconds')::INTERVAL)
+            AND (aj.fingerprint IS NULL OR NOT EXISTS (
+                SELECT 1 FROM assembly_jobs twin
+                WHERE twin.fingerprint = aj.fingerprint
+                    AND twin.status = 'running'
+            ))
+    ),
+    ranked AS (
+        SELECT
+            w.job_id,
+            w.job_priority,
+            w.job_created_at,
+            COALESCE(r.running_count, 0) + ROW_NUMBER() OVER (
+                PARTITION BY COALESCE(w.owner, w.job_id::TEXT)
+                ORDER BY w.job_priority DESC, w.job_created_at ASC
+            ) AS user_slot,
+            GREATEST(COALESCE((w.rule ->> 'weight')::NUMERIC, 1), 0.01) AS weight,
+            w.tier_cap::INTEGER AS max_running
+        FROM waiting w
+        LEFT JOIN running r ON r.owner = w.owner
+        WHERE w.twin_rank = 1
+    ),
+    claimable AS (
+        SELECT aj.id AS job_id
+        FROM assembly_jobs aj
+        JOIN ranked rk ON rk.job_id = aj.id
+        WHERE aj.status IN ('pending', 'retry')
+            AND (rk.max_running IS NULL OR rk.user_slot <= rk.max_running)
+        ORDER BY rk.job_priority DESC, rk.user_slot / rk.weight ASC, rk.job_created_at ASC
+        FOR UPDATE OF aj SKIP LOCKED
+        LIMIT GREATEST(max_jobs, 1)
+    )
+    UPDATE assembly_jobs aj
+    SET
+        status = 'running',
+        locked_by = worker_id,
+        locked_at = NOW(),
+        updated_at = NOW()
+    FROM claimable c
+    WHERE aj.id = c.job_id
+    RETURNING
+        aj.id,
+        aj.video_id,
+        aj.status,
+        aj.priority,
+        aj.attempts,
+        aj.max_attempts,
+        aj.payload,
+        aj.locked_at,
+        aj.locked_by,
+        aj.last_error,
+        aj.next_run_at,
+        aj.source_type,
+        aj.source_id,
+        aj.created_at,
+        aj.updated_at,
+        aj.fingerprint;
+END;
+$$;
@@ -0,0 +1,157 @@
+# asset_fetcher.py
+"""
+Concurrent asset downloads for assembly jobs.
+Streams every URL straight to disk over one pooled async HTTP client,
+retries transient failures and records per-asset timing.
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import httpx
+
+
+FETCH_CONCURRENCY = int(os.environ.get("ASSEMBLY_FETCH_CONCURRENCY", "8"))
+FETCH_RETRIES = int(os.environ.get("ASSEMBLY_FETCH_RETRIES", "3"))
+FETCH_TIMEOUT_SECONDS = float(os.environ.get("ASSEMBLY_FETCH_TIMEOUT_SECONDS", "60"))
+CHUNK_SIZE = 64 * 1024
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchedAsset:
+    """Outcome of downloading one asset."""
+    key: str
+    url: str
+    path: Path
+    bytes: int = 0
+    seconds: float = 0.0
+    attempts: int = 0
+    error: Optional[str] = None
+    # The last error was a network blip or 5xx rather than a bad URL/file.
+    transient: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def _copy_local(url: str, dest: Path) -> int:
+    """file:// assets (offline runs on the local queue backend) are copied."""
+    shutil.copyfile(unquote(urlparse(url).path), dest)
+    return dest.stat().st_size
+
+
+async def _fetch_one(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    key: str,
+    url: str,
+    dest: Path,
+    retries: int,
+    on_complete: Optional[Callable[[FetchedAsset], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> FetchedAsset:
+    asset = FetchedAsset(key=key, url=url, path=dest)
+    async with semaphore:
+        start = time.monotonic()
+        for attempt in range(1, retries + 1):
+            if should_stop and should_stop():
+                asset.error = "Stopped"
+                break
+            asset.attempts = attempt
+            written = 0
+            try:
+                if url.startswith("file://"):
+                    written = await asyncio.get_running_loop().run_in_executor(None, _copy_local, url, dest)
+                else:
+                    async with client.stream("GET", url) as resp:
+                        resp.raise_for_status()
+                        with dest.open("wb") as handle:
+                            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                                handle.write(chunk)
+                                written += len(chunk)
+                asset.bytes = written
+                asset.error = None
+                asset.transient = False
+                break
+            except Exception as e:
+                message = str(e).splitlines()[0] if str(e) else ""
+                asset.error = f"{type(e).__name__}: {message}"
+                asset.transient = _is_retryable(e)
+                dest.unlink(missing_ok=True)
+                if attempt >= retries or not _is_retryable(e):
+                    break
+                await asyncio.sleep(min(8.0, 0.5 * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5))
+        asset.seconds = time.monotonic() - start
+        if on_complete:
+            # Runs off the event loop while this slot is still held, so a
+            # callback that blocks throttles further downloads.
+            await asyncio.get_running_loop().run_in_executor(None, on_complete, asset)
+    return asset
+
+
+async def _fetch_all(
+    items: List[Tuple[str, str, Path]],
+    concurrency: int,
+    retries: int,
+    timeout: float,
+    on_complete: Optional[Callable[[FetchedAsset], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Dict[str, FetchedAsset]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        results = await asyncio.gather(*[
+            _fetch_one(client, semaphore, key, url, dest, retries, on_complete, should_stop)
+            for key, url, dest in items
+        ])
+    return {asset.key: asset for asset in results}
+
+
+def fetch_assets(
+    items: List[Tuple[str, str, Path]],
+    concurrency: int = FETCH_CONCURRENCY,
+    retries: int = FETCH_RETRIES,
+    timeout: float = FETCH_TIMEOUT_SECONDS,
+    on_complete: Optional[Callable[[FetchedAsset], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Dict[str, FetchedAsset]:
+    """
+    Download (key, url, dest) items concurrently.
+
+    Returns a dict keyed by item key. Failed downloads are reported through
+    FetchedAsset.error rather than raised, so callers decide which assets
+    are required.
+
+    on_complete is called with each asset as soon as it finishes, in
+    completion order. should_stop lets a caller skip downloads that have
+    not started yet.
+    """
+    if not items:
+        return {}
+    results = asyncio.run(_fetch_all(
+        items, max(1, concurrency), max(1, retries), timeout, on_complete, should_stop,
+    ))
+    for asset in results.values():
+        status = "ok" if asset.ok else f"failed ({asset.error})"
+        print(
+            f"[fetch] {asset.key}: {status} {asset.bytes / 1024:.0f} KB in {asset.seconds:.2f}s"
+            f" ({asset.attempts} attempt{'s' if asset.attempts != 1 else ''})",
+            flush=True,
+        )
+    return results
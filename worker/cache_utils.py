@@ -7,6 +7,8 @@ View, clear, and manage all cached assets.
 from pathlib import Path
 import shutil
 
+from segment_cache import SEGMENT_CACHE_DIR
+
 # All cache directories
 CACHE_DIRS = {
     "beats": Path("cache/beats"),
@@ -14,6 +16,7 @@ CACHE_DIRS = {
     "trimmed_audio": Path("cache/trimmed_audio"),
     "alignment": Path("cache/alignment"),
     "images": Path("media_cache"),
+    "segments": SEGMENT_CACHE_DIR,
 }
 
 
@@ -0,0 +1,60 @@
+# capacity.py
+"""
+Worker capacity: how many assembly jobs this process runs at once and how
+many cores each job gets. Container limits (cgroup CPU affinity / memory)
+are respected so slot counts match what the scheduler actually gave us.
+"""
+
+import os
+from functools import lru_cache
+from typing import Optional
+
+# 1 = one job at a time; 0 = derive from cores and memory.
+WORKER_SLOTS = int(os.environ.get("ASSEMBLY_WORKER_SLOTS", "1"))
+SLOT_CORES = int(os.environ.get("ASSEMBLY_SLOT_CORES", "2"))
+SLOT_MEMORY_MB = int(os.environ.get("ASSEMBLY_SLOT_MEMORY_MB", "1536"))
+
+
+def available_cores() -> int:
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+def available_memory_mb() -> Optional[int]:
+    """Container memory limit if one is set, otherwise total system memory."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number.
+        if raw.isdigit() and int(raw) < 1 << 60:
+            return int(raw) // (1024 * 1024)
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+@lru_cache(maxsize=1)
+def worker_slots() -> int:
+    """Concurrent assembly jobs for this process."""
+    if WORKER_SLOTS > 0:
+        return WORKER_SLOTS
+    slots = available_cores() // max(1, SLOT_CORES)
+    memory_mb = available_memory_mb()
+    if memory_mb:
+        slots = min(slots, memory_mb // max(1, SLOT_MEMORY_MB))
+    return max(1, slots)
+
+
+def job_cores() -> int:
+    """Cores one job should use so all slots together fit the machine."""
+    return max(1, available_cores() // worker_slots())
@@ -512,6 +512,9 @@ class TierLimits:
     available_voices: list[VoiceOption] = field(default_factory=list)
     available_art_styles: list[ArtStyle] = field(default_factory=list)
     available_caption_styles: list[CaptionStyle] = field(default_factory=list)
+    # Assembly queue fair share: claim weight and max jobs rendering at once per user
+    queue_weight: int = 1
+    max_running_assemblies: int = 2
 
 
 TIER_LIMITS = {
@@ -525,6 +528,8 @@ TIER_LIMITS = {
         available_voices=[VoiceOption.ALLOY, VoiceOption.NOVA],
         available_art_styles=[ArtStyle.COMIC_DARK, ArtStyle.REALISTIC],
         available_caption_styles=[CaptionStyle.RED_HIGHLIGHT, CaptionStyle.BOLD_STROKE],
+        queue_weight=1,
+        max_running_assemblies=2,
     ),
     "hobby": TierLimits(
         max_series=3,
@@ -536,6 +541,8 @@ TIER_LIMITS = {
         available_voices=list(VoiceOption),
         available_art_styles=list(ArtStyle),
         available_caption_styles=list(CaptionStyle),
+        queue_weight=2,
+        max_running_assemblies=3,
     ),
     "daily": TierLimits(
         max_series=5,
@@ -547,6 +554,8 @@ TIER_LIMITS = {
         available_voices=list(VoiceOption),
         available_art_styles=list(ArtStyle),
         available_caption_styles=list(CaptionStyle),
+        queue_weight=3,
+        max_running_assemblies=4,
     ),
     "pro": TierLimits(
         max_series=10,
@@ -558,5 +567,73 @@ TIER_LIMITS = {
         available_voices=list(VoiceOption),
         available_art_styles=list(ArtStyle),
         available_caption_styles=list(CaptionStyle),
+        queue_weight=4,
+        max_running_assemblies=6,
     ),
 }
+
+
+# =============================================================================
+# RENDER PROFILES
+# =============================================================================
+
+class RenderProfile(str, Enum):
+    """Assembly quality profiles, picked per job via payload["render_profile"]"""
+    DRAFT = "draft"      # Fast low-res check of timing and captions
+    PREVIEW = "preview"  # Mid-res, what local API assembly has always rendered
+    FINAL = "final"      # Full quality delivery
+
+
+@dataclass
+class RenderSettings:
+    """Encoder settings applied to every assembly pass."""
+    width: int
+    height: int
+    fps: int
+    preset: str          # Delivery encodes (single pass, caption burn)
+    crf: int
+    segment_preset: str  # Intermediate segment encodes
+    segment_crf: int
+    audio_bitrate: str
+
+
+RENDER_PROFILES = {
+    RenderProfile.DRAFT: RenderSettings(
+        width=540,
+        height=960,
+        fps=24,
+        preset="ultrafast",
+        crf=32,
+        segment_preset="ultrafast",
+        segment_crf=32,
+        audio_bitrate="96k",
+    ),
+    RenderProfile.PREVIEW: RenderSettings(
+        width=720,
+        height=1280,
+        fps=30,
+        preset="veryfast",
+        crf=28,
+        segment_preset="veryfast",
+        segment_crf=28,
+        audio_bitrate="128k",
+    ),
+    RenderProfile.FINAL: RenderSettings(
+        width=1080,
+        height=1920,
+        fps=30,
+        preset="fast",
+        crf=23,
+        segment_preset="veryfast",
+        segment_crf=28,
+        audio_bitrate="192k",
+    ),
+}
+
+
+def get_render_settings(profile: Optional[str]) -> RenderSettings:
+    """Look up a render profile by name, falling back to final."""
+    try:
+        return RENDER_PROFILES[RenderProfile(profile)]
+    except ValueError:
+        return RENDER_PROFILES[RenderProfile.FINAL]
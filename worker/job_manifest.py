@@ -0,0 +1,54 @@
+# job_manifest.py
+"""
+Versioned assembly job manifests.
+The API enqueues a self-contained manifest (assets with sizes and ETags,
+timing, style), so the worker can start rendering without reading the
+source video row. expand_manifest() flattens it into the payload shape
+assemble_video() takes; jobs enqueued before manifests pass through as-is.
+"""
+
+from typing import Optional
+
+MANIFEST_VERSION = 1
+
+
+def _asset_url(asset: Optional[dict]) -> Optional[str]:
+    return asset.get("url") if asset else None
+
+
+def expand_manifest(payload: dict) -> dict:
+    """
+    Flat assemble_video payload for a manifest. Raises ValueError for a
+    manifest newer than this worker understands.
+    """
+    version = payload.get("manifest_version")
+    if version is None:
+        return payload
+    if int(version) > MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {version} (worker understands {MANIFEST_VERSION})")
+
+    assets = payload.get("assets") or {}
+    images = assets.get("images") or []
+    timing = payload.get("timing") or {}
+    style = payload.get("style") or {}
+
+    # Sizes recorded at enqueue are checked against what was downloaded;
+    # sizes and ETags together identify the asset contents for render dedup.
+    described = {f"image_{i}": image for i, image in enumerate(images) if image}
+    for key in ("audio", "bgm"):
+        if assets.get(key):
+            described[key] = assets[key]
+
+    return {
+        "manifest_version": int(version),
+        "video_id": payload.get("video_id"),
+        "image_urls": [_asset_url(image) for image in images],
+        "audio_url": _asset_url(assets.get("audio")),
+        "bgm_url": _asset_url(assets.get("bgm")),
+        "beats": timing.get("beats") or [],
+        "durations": timing.get("durations") or [],
+        **style,
+        "asset_sizes": {key: asset["size"] for key, asset in described.items() if asset.get("size")},
+        "asset_etags": {key: asset["etag"] for key, asset in described.items() if asset.get("etag")},
+        "dedup_salt": payload.get("dedup_salt"),
+    }
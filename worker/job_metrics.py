@@ -0,0 +1,128 @@
+# job_metrics.py
+"""
+Per-stage timing and resource metrics for assembly jobs.
+Each stage records wall time, child-process CPU time, peak child RSS,
+bytes in/out and the encode speed ffmpeg reported. The whole job is
+emitted as one `METRICS {json}` log line and stored on assembly_jobs.metrics.
+"""
+
+import json
+import re
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+_SPEED_RE = re.compile(r"speed=\s*([\d.]+)x")
+
+
+def _file_bytes(paths: Iterable[Optional[Path]]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            if path:
+                total += Path(path).stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+@dataclass
+class StageMetrics:
+    """Measurements for one stage of an assembly job."""
+    name: str
+    wall_seconds: float = 0.0
+    cpu_user_seconds: float = 0.0
+    cpu_system_seconds: float = 0.0
+    max_rss_kb: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    speeds: List[float] = field(default_factory=list)
+
+    def add_inputs(self, *paths: Optional[Path]) -> None:
+        self.bytes_in += _file_bytes(paths)
+
+    def add_outputs(self, *paths: Optional[Path]) -> None:
+        self.bytes_out += _file_bytes(paths)
+
+    def add_ffmpeg_output(self, stderr: Optional[str]) -> None:
+        """Record the last `speed=` value from an ffmpeg stderr log."""
+        matches = _SPEED_RE.findall(stderr or "")
+        if matches:
+            try:
+                self.speeds.append(float(matches[-1]))
+            except ValueError:
+                pass
+
+    @property
+    def ffmpeg_speed(self) -> Optional[float]:
+        if not self.speeds:
+            return None
+        return round(sum(self.speeds) / len(self.speeds), 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "wall_seconds": self.wall_seconds,
+            "cpu_user_seconds": self.cpu_user_seconds,
+            "cpu_system_seconds": self.cpu_system_seconds,
+            "max_rss_kb": self.max_rss_kb,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ffmpeg_speed": self.ffmpeg_speed,
+        }
+
+
+class JobMetrics:
+    """
+    Collects StageMetrics for one job.
+
+    CPU time comes from RUSAGE_CHILDREN deltas, so it covers every ffmpeg
+    the stage waited on. RUSAGE_CHILDREN is per process, so stages that
+    overlap with another job in the same process share the attribution,
+    and max_rss_kb is the largest child seen so far, not a per-stage delta.
+    """
+
+    def __init__(self, video_id: str, render_mode: str = "", render_profile: str = ""):
+        self.video_id = video_id
+        self.render_mode = render_mode
+        self.render_profile = render_profile
+        self.stages: List[StageMetrics] = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        metrics = StageMetrics(name=name)
+        wall_start = time.monotonic()
+        usage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield metrics
+        finally:
+            usage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            metrics.wall_seconds = round(time.monotonic() - wall_start, 3)
+            metrics.cpu_user_seconds = round(usage_end.ru_utime - usage_start.ru_utime, 3)
+            metrics.cpu_system_seconds = round(usage_end.ru_stime - usage_start.ru_stime, 3)
+            metrics.max_rss_kb = usage_end.ru_maxrss
+            with self._lock:
+                self.stages.append(metrics)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = [s.to_dict() for s in self.stages]
+        return {
+            "video_id": self.video_id,
+            "render_mode": self.render_mode,
+            "render_profile": self.render_profile,
+            "total_seconds": round(time.monotonic() - self._start, 3),
+            "stages": stages,
+        }
+
+    def log(self) -> dict:
+        """Print the machine-readable METRICS line and return the blob."""
+        data = self.to_dict()
+        print(f"METRICS {json.dumps(data, separators=(',', ':'))}", flush=True)
+        return data
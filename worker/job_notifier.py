@@ -0,0 +1,91 @@
+# job_notifier.py
+"""
+Wakeups for the assembly worker loop.
+The loop sleeps on one in-process event instead of a fixed poll interval.
+Finished jobs, POST /wake on the worker service, and (when a database DSN
+is configured) Postgres NOTIFYs from the assembly_jobs trigger all set it.
+"""
+
+import importlib.util
+import os
+import select
+import threading
+import time
+
+NOTIFY_DSN = os.environ.get("ASSEMBLY_NOTIFY_DSN") or os.environ.get("DATABASE_URL")
+NOTIFY_CHANNEL = os.environ.get("ASSEMBLY_NOTIFY_CHANNEL", "assembly_jobs")
+# The listener checks its connection whenever it has been quiet this long.
+LISTEN_KEEPALIVE_SECONDS = 60
+
+_wake = threading.Event()
+_listener_lock = threading.Lock()
+_listener = None
+
+
+def wake() -> None:
+    """Wake the worker loop now."""
+    _wake.set()
+
+
+def wait_for_wake(timeout: float) -> bool:
+    """Sleep until woken or timeout. True if something woke us."""
+    woke = _wake.wait(timeout)
+    _wake.clear()
+    return woke
+
+
+def start_listener() -> bool:
+    """
+    Start the LISTEN thread if a DSN is configured and psycopg2 is installed.
+    Returns True when push wakeups are active; otherwise the loop just polls.
+    """
+    global _listener
+    if not NOTIFY_DSN:
+        return False
+    if importlib.util.find_spec("psycopg2") is None:
+        print("[job_notifier] psycopg2 not installed, push wakeups disabled", flush=True)
+        return False
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen_loop, name="assembly-listen", daemon=True)
+            _listener.start()
+    return True
+
+
+def _listen_loop() -> None:
+    import psycopg2
+    from psycopg2 import sql
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+    delay = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(NOTIFY_DSN)
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(NOTIFY_CHANNEL)))
+            print(f"[job_notifier] Listening on '{NOTIFY_CHANNEL}'", flush=True)
+            delay = 1
+            # Jobs inserted while we were disconnected sent no NOTIFY we saw.
+            wake()
+            while True:
+                if select.select([conn], [], [], LISTEN_KEEPALIVE_SECONDS) == ([], [], []):
+                    # Quiet for a while: make sure the connection is still alive.
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    wake()
+        except Exception as e:
+            print(f"[job_notifier] Listener error, reconnecting in {delay}s: {e}", flush=True)
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
@@ -0,0 +1,479 @@
+# local_backend.py
+"""
+Local stand-in for the Supabase project the worker talks to.
+LocalClient implements the slice of the supabase-py API the worker uses
+(table queries, the claim / reap RPCs and storage) on one SQLite file and
+one directory. Claims follow claim_assembly_jobs (fair share, tier caps,
+lock_seconds, next_run_at) and reaping follows reap_stale_assembly_jobs,
+so leases, retries and backoff behave as they do against Postgres.
+
+Enqueue work for an offline run:
+    python local_backend.py enqueue payload.json --count 50 --user-id u1
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+_TIMESTAMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T")
+
+# Column defaults PostgREST would get from the schema.
+_TABLE_DEFAULTS = {
+    "assembly_jobs": {"status": "pending", "priority": 0, "attempts": 0, "max_attempts": 3, "source_type": "director"},
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _render_key(job: dict) -> Optional[str]:
+    """The render_key column: a hash of the manifest without its video_id."""
+    payload = job.get("payload") or {}
+    if "manifest_version" not in payload:
+        return None
+    body = {key: value for key, value in payload.items() if key != "video_id"}
+    return hashlib.md5(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _coerce(value: Any) -> Any:
+    """Compare ISO timestamps as datetimes and everything else as-is."""
+    if isinstance(value, str) and _TIMESTAMP_RE.match(value):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    return value
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    if op == "is":
+        return left is right if right in (None, True, False) else left == right
+    if op == "eq":
+        return left is not None and _coerce(left) == _coerce(right)
+    if op == "neq":
+        return left is None or _coerce(left) != _coerce(right)
+    if op == "in":
+        return left in right
+    if left is None or right is None:
+        return False
+    left, right = _coerce(left), _coerce(right)
+    try:
+        return {
+            "lt": left < right,
+            "lte": left <= right,
+            "gt": left > right,
+            "gte": left >= right,
+        }[op]
+    except TypeError:
+        return False
+
+
+def _parse_or(expr: str) -> Callable[[dict], bool]:
+    """PostgREST or=(col.op.value,...) without nesting."""
+    clauses = []
+    for part in expr.split(","):
+        column, op, raw = part.strip().split(".", 2)
+        value = {"null": None, "true": True, "false": False}.get(raw, raw) if op == "is" else raw
+        clauses.append((column, op, value))
+    return lambda row: any(_compare(op, row.get(column), value) for column, op, value in clauses)
+
+
+@dataclass
+class LocalResponse:
+    """Shape of a postgrest APIResponse: rows plus an optional exact count."""
+    data: Any
+    count: Optional[int] = None
+
+
+class _Query:
+    """Chainable table query in the style of postgrest-py's request builder."""
+
+    def __init__(self, client: "LocalClient", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._values: Any = None
+        self._filters: List[Callable[[dict], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "_Query":
+        self._columns = columns
+        self._count = count
+        return self
+
+    def insert(self, values) -> "_Query":
+        self._op, self._values = "insert", values
+        return self
+
+    def update(self, values: dict) -> "_Query":
+        self._op, self._values = "update", values
+        return self
+
+    def delete(self) -> "_Query":
+        self._op = "delete"
+        return self
+
+    def _where(self, column: str, op: str, value: Any) -> "_Query":
+        self._filters.append(lambda row: _compare(op, row.get(column), value))
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "neq", value)
+
+    def lt(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "lte", value)
+
+    def gt(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "gte", value)
+
+    def in_(self, column: str, values: List[Any]) -> "_Query":
+        return self._where(column, "in", list(values))
+
+    def is_(self, column: str, value: Any) -> "_Query":
+        return self._where(column, "is", value)
+
+    def or_(self, expr: str) -> "_Query":
+        self._filters.append(_parse_or(expr))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "_Query":
+        self._limit = count
+        return self
+
+    def _project(self, row: dict) -> dict:
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in self._columns.split(",")}
+
+    def execute(self) -> LocalResponse:
+        with self._client.transaction() as tx:
+            if self._op == "insert":
+                rows = self._values if isinstance(self._values, list) else [self._values]
+                return LocalResponse([tx.insert(self._table, row) for row in rows])
+
+            rows = [row for row in tx.rows(self._table) if all(f(row) for f in self._filters)]
+            if self._op == "update":
+                stamp = _now().isoformat()
+                changed = [tx.save(self._table, {**row, "updated_at": stamp, **self._values}) for row in rows]
+                return LocalResponse(changed)
+            if self._op == "delete":
+                for row in rows:
+                    tx.delete(self._table, row["id"])
+                return LocalResponse(rows)
+
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda r: (r.get(column) is None, _coerce(r.get(column))), reverse=desc)
+        total = len(rows)
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        return LocalResponse([self._project(row) for row in rows], total if self._count else None)
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def rows(self, table: str) -> List[dict]:
+        cur = self.conn.execute("SELECT data FROM rows WHERE tbl = ?", (table,))
+        return [json.loads(data) for (data,) in cur.fetchall()]
+
+    def save(self, table: str, row: dict) -> dict:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO rows (tbl, id, data) VALUES (?, ?, ?)",
+            (table, str(row["id"]), json.dumps(row, default=str)),
+        )
+        return row
+
+    def insert(self, table: str, values: dict) -> dict:
+        stamp = _now().isoformat()
+        row = {
+            **_TABLE_DEFAULTS.get(table, {}),
+            "id": str(uuid.uuid4()),
+            "created_at": stamp,
+            "updated_at": stamp,
+            **values,
+        }
+        return self.save(table, row)
+
+    def delete(self, table: str, row_id: str) -> None:
+        self.conn.execute("DELETE FROM rows WHERE tbl = ? AND id = ?", (table, str(row_id)))
+
+
+class _RpcCall:
+    def __init__(self, fn: Callable[[], Any]):
+        self._fn = fn
+
+    def execute(self) -> LocalResponse:
+        return LocalResponse(self._fn())
+
+
+class LocalBucket:
+    """Directory-backed storage bucket with the storage3 calls the worker makes."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, path: str) -> Path:
+        target = (self.root / path).resolve()
+        if self.root.resolve() not in target.parents:
+            raise ValueError(f"Path escapes bucket: {path}")
+        return target
+
+    def upload(self, path: str, file, file_options: Optional[dict] = None) -> dict:
+        target = self._path(path)
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        if target.exists() and not upsert:
+            raise FileExistsError(f"The resource already exists: {path}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        if isinstance(file, (bytes, bytearray)):
+            tmp.write_bytes(file)
+        else:
+            shutil.copyfile(file, tmp)
+        os.replace(tmp, target)
+        return {"Key": path}
+
+    def list(self, path: str = "") -> List[dict]:
+        folder = self._path(path) if path else self.root
+        if not folder.is_dir():
+            return []
+        return [{"name": entry.name} for entry in sorted(folder.iterdir()) if not entry.name.startswith(".")]
+
+    def copy(self, from_path: str, to_path: str) -> dict:
+        source, target = self._path(from_path), self._path(to_path)
+        if target.exists():
+            raise FileExistsError(f"The resource already exists: {to_path}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, target)
+        return {"Key": to_path}
+
+    def remove(self, paths: List[str]) -> List[dict]:
+        removed = []
+        for path in paths:
+            target = self._path(path)
+            if target.exists():
+                target.unlink()
+                removed.append({"name": path})
+        return removed
+
+    def get_public_url(self, path: str) -> str:
+        return self._path(path).as_uri()
+
+
+class LocalStorage:
+    def __init__(self, root: Path):
+        self.root = root
+
+    def from_(self, bucket: str) -> LocalBucket:
+        folder = self.root / bucket
+        folder.mkdir(parents=True, exist_ok=True)
+        return LocalBucket(folder)
+
+
+class LocalClient:
+    """
+    Drop-in for the supabase client in the worker: table(), rpc(), storage.
+    Every operation runs in a SQLite IMMEDIATE transaction, so several
+    worker processes can share one database file.
+    """
+
+    def __init__(self, db_path: str, storage_dir: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.storage = LocalStorage(Path(storage_dir))
+        self._local = threading.local()
+        with self.transaction() as tx:
+            tx.conn.execute("CREATE TABLE IF NOT EXISTS rows (tbl TEXT, id TEXT, data TEXT, PRIMARY KEY (tbl, id))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield _Transaction(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _RpcCall:
+        functions = {
+            "claim_assembly_jobs": self._claim_assembly_jobs,
+            "claim_assembly_job": self._claim_assembly_job,
+            "reap_stale_assembly_jobs": self._reap_stale_assembly_jobs,
+        }
+        if name not in functions:
+            raise Exception(f"{{'code': 'PGRST202', 'message': 'Could not find the function public.{name}'}}")
+        return _RpcCall(lambda: functions[name](**(params or {})))
+
+    def _claim_assembly_jobs(
+        self,
+        worker_id: str,
+        lock_seconds: int = 900,
+        max_jobs: int = 1,
+        tier_policy: Optional[Dict[str, dict]] = None,
+    ) -> List[dict]:
+        now = _now()
+        lock_cutoff = now - timedelta(seconds=lock_seconds)
+        policy = tier_policy or {}
+        with self.transaction() as tx:
+            jobs = tx.rows("assembly_jobs")
+            running: Dict[str, int] = defaultdict(int)
+            running_keys = set()
+            for job in jobs:
+                if job.get("status") == "running":
+                    if job.get("user_id"):
+                        running[job["user_id"]] += 1
+                    if _render_key(job):
+                        running_keys.add(_render_key(job))
+
+            # One job per manifest (render_key): twins of a running job wait,
+            # and only the first of several waiting twins is claimable.
+            twins: Dict[str, tuple] = {}
+            for job in jobs:
+                if job.get("status") not in ("pending", "retry"):
+                    continue
+                if job.get("next_run_at") and _coerce(job["next_run_at"]) > now:
+                    continue
+                if job.get("locked_at") and _coerce(job["locked_at"]) >= lock_cutoff:
+                    continue
+                if _render_key(job) in running_keys:
+                    continue
+                key = _render_key(job) or str(job["id"])
+                order = (-(job.get("priority") or 0), _coerce(job.get("created_at")), str(job["id"]))
+                if key not in twins or order < twins[key][0]:
+                    twins[key] = (order, job)
+
+            waiting: Dict[str, List[dict]] = defaultdict(list)
+            for _, job in twins.values():
+                waiting[job.get("user_id") or str(job["id"])].append(job)
+
+            ranked = []
+            for owner, owned in waiting.items():
+                owned.sort(key=lambda j: (-(j.get("priority") or 0), _coerce(j.get("created_at"))))
+                for rank, job in enumerate(owned, start=1):
+                    # Unknown or missing tiers use "free"; jobs without an owner have no cap.
+                    rule = policy.get(job.get("tier")) or policy.get("free") or {}
+                    slot = running.get(owner, 0) + rank
+                    cap = rule.get("max_running") if job.get("user_id") else None
+                    if cap is not None and slot > int(cap):
+                        continue
+                    weight = max(float(rule.get("weight", 1)), 0.01)
+                    ranked.append(((-(job.get("priority") or 0), slot / weight, _coerce(job.get("created_at"))), job))
+            ranked.sort(key=lambda item: item[0])
+
+            stamp = now.isoformat()
+            claimed = []
+            for _, job in ranked[: max(max_jobs, 1)]:
+                job.update(status="running", locked_by=worker_id, locked_at=stamp, updated_at=stamp)
+                claimed.append(tx.save("assembly_jobs", job))
+        return claimed
+
+    def _claim_assembly_job(self, worker_id: str, lock_seconds: int = 900) -> List[dict]:
+        return self._claim_assembly_jobs(worker_id, lock_seconds, 1)
+
+    def _reap_stale_assembly_jobs(self, stale_seconds: int = 45) -> int:
+        now = _now()
+        cutoff = now - timedelta(seconds=stale_seconds)
+        reaped = 0
+        with self.transaction() as tx:
+            for job in tx.rows("assembly_jobs"):
+                if job.get("status") != "running":
+                    continue
+                if job.get("locked_at") and _coerce(job["locked_at"]) >= cutoff:
+                    continue
+                attempts = int(job.get("attempts") or 0) + 1
+                job.update(
+                    status="failed" if attempts >= int(job.get("max_attempts") or 3) else "retry",
+                    attempts=attempts,
+                    last_error=f"Lease expired (worker {job.get('locked_by') or 'unknown'} stopped heartbeating)",
+                    locked_by=None,
+                    locked_at=None,
+                    next_run_at=now.isoformat(),
+                    updated_at=now.isoformat(),
+                )
+                tx.save("assembly_jobs", job)
+                reaped += 1
+        return reaped
+
+
+def _main() -> None:
+    from queue_backend import LOCAL_DB_PATH, LOCAL_STORAGE_DIR
+
+    parser = argparse.ArgumentParser(description="Local assembly queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enqueue = sub.add_parser("enqueue", help="Queue copies of a payload JSON file")
+    enqueue.add_argument("payload", help="Assembly payload JSON (video_id is generated per copy)")
+    enqueue.add_argument("--count", type=int, default=1)
+    enqueue.add_argument("--twins", action="store_true", help="Keep copies identical so render dedup reuses one render")
+    enqueue.add_argument("--user-id")
+    enqueue.add_argument("--tier")
+    enqueue.add_argument("--priority", type=int, default=5)
+    sub.add_parser("stats", help="Job counts by status")
+    args = parser.parse_args()
+
+    client = LocalClient(LOCAL_DB_PATH, LOCAL_STORAGE_DIR)
+    if args.command == "enqueue":
+        payload = json.loads(Path(args.payload).read_text())
+        for i in range(args.count):
+            video_id = f"local-{uuid.uuid4().hex[:12]}"
+            # Identical copies are twins to render dedup and the claim; salt
+            # each one so a load test renders every job it queues.
+            salt = {} if args.twins else {"dedup_salt": f"{video_id}-{i}"}
+            client.table("assembly_jobs").insert({
+                "video_id": video_id,
+                "payload": {**payload, **salt, "video_id": video_id},
+                "priority": args.priority,
+                "user_id": args.user_id,
+                "tier": args.tier,
+            }).execute()
+        print(f"Queued {args.count} job(s) in {LOCAL_DB_PATH}")
+    else:
+        counts: Dict[str, int] = defaultdict(int)
+        for job in client.table("assembly_jobs").select("status").execute().data:
+            counts[job["status"]] += 1
+        print(json.dumps(dict(counts), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    _main()
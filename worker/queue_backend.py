@@ -0,0 +1,47 @@
+# queue_backend.py
+"""
+Chooses the data backend the worker reads jobs from and uploads to.
+"supabase" (default) is the hosted project. "local" is LocalClient, a
+SQLite file plus a storage directory with the same client API, for running
+the worker offline or load-testing it on one box.
+"""
+
+import os
+import threading
+
+from segment_cache import STATE_DIR
+
+QUEUE_BACKEND = os.environ.get("ASSEMBLY_QUEUE_BACKEND", "supabase").lower()
+LOCAL_DB_PATH = os.environ.get("ASSEMBLY_LOCAL_DB") or str(STATE_DIR / "local_queue.db")
+LOCAL_STORAGE_DIR = os.environ.get("ASSEMBLY_LOCAL_STORAGE_DIR") or str(STATE_DIR / "local_storage")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_backend_client():
+    """Client for the configured backend, or None if Supabase isn't configured."""
+    if QUEUE_BACKEND == "local":
+        from local_backend import LocalClient
+        return LocalClient(LOCAL_DB_PATH, LOCAL_STORAGE_DIR)
+    if QUEUE_BACKEND != "supabase":
+        raise RuntimeError(f"Unknown ASSEMBLY_QUEUE_BACKEND: {QUEUE_BACKEND}")
+
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        return None
+    from supabase import create_client
+    return create_client(url, key)
+
+
+def get_backend_client():
+    """
+    The process-wide client, created on first use. Its HTTP connections are
+    pooled and shared by every job instead of opening a client per job.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_backend_client()
+        return _client
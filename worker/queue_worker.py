@@ -1,22 +1,95 @@
 import os
+import math
+import random
+import re
+import signal
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
-
-from supabase import create_client
-
+from typing import Dict, Optional
+
+import job_notifier
+from capacity import worker_slots
+from config import TIER_LIMITS
+from job_manifest import expand_manifest
+from queue_backend import LOCAL_DB_PATH, LOCAL_STORAGE_DIR, QUEUE_BACKEND, get_backend_client
+from render_dedup import (
+    COALESCE_DELAY_SECONDS,
+    RENDER_DEDUP_ENABLED,
+    find_completed,
+    find_in_flight,
+    is_dedupable,
+    payload_fingerprint,
+    reuse_output,
+)
+from service_metrics import Counter, Gauge, Histogram
 from viral_pipeline import assemble_video
 
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 WORKER_ID = os.environ.get("WORKER_ID") or f"assembly-worker-{uuid.uuid4().hex[:8]}"
-POLL_SECONDS = int(os.environ.get("ASSEMBLY_POLL_SECONDS", "5"))
+# Idle workers back off from POLL_SECONDS to POLL_MAX_SECONDS between claims.
+POLL_SECONDS = float(os.environ.get("ASSEMBLY_POLL_SECONDS", "1"))
+POLL_MAX_SECONDS = float(os.environ.get("ASSEMBLY_POLL_MAX_SECONDS", "30"))
 LOCK_SECONDS = int(os.environ.get("ASSEMBLY_LOCK_SECONDS", "900"))
+# Transient failures retry after RETRY_BACKOFF_SECONDS * 2^(attempt-1), capped
+# at RETRY_BACKOFF_MAX_SECONDS and jittered so failed jobs don't retry in waves.
 RETRY_BACKOFF_SECONDS = int(os.environ.get("ASSEMBLY_RETRY_BACKOFF_SECONDS", "120"))
+RETRY_BACKOFF_MAX_SECONDS = int(os.environ.get("ASSEMBLY_RETRY_BACKOFF_MAX_SECONDS", "3600"))
 WORKER_MODE = os.environ.get("WORKER_MODE", "service").lower()
 MAX_RUNTIME_SECONDS = int(os.environ.get("WORKER_MAX_SECONDS", "0"))
 MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", "0"))
+# Running jobs renew locked_at every HEARTBEAT_SECONDS; jobs whose lease is
+# older than LEASE_STALE_SECONDS are returned to the queue by the reaper.
+HEARTBEAT_SECONDS = float(os.environ.get("ASSEMBLY_HEARTBEAT_SECONDS", "10"))
+LEASE_STALE_SECONDS = int(os.environ.get("ASSEMBLY_LEASE_STALE_SECONDS", "45"))
+# On SIGTERM / service shutdown, running jobs get this long to finish before
+# they are stopped and put straight back on the queue.
+DRAIN_SECONDS = float(os.environ.get("ASSEMBLY_DRAIN_SECONDS", "8"))
+
+_MISSING_COLUMN_RE = re.compile(r"Could not find the '([^']+)' column")
+_batch_claim_available = True
+
+# Drain: stop claiming; at the deadline, abort renders and requeue them.
+_draining = threading.Event()
+_abort_running = threading.Event()
+_drain_deadline = 0.0
+
+# Prometheus metrics served by service.py /metrics
+JOBS_CLAIMED = Counter("assembly_jobs_claimed_total", "Assembly jobs claimed by this worker")
+JOBS_FINISHED = Counter(
+    "assembly_jobs_finished_total",
+    "Assembly jobs this worker finished handling, by outcome "
+    "(completed, failed, retried, canceled, reused, deferred, requeued, lease_lost)",
+    ("outcome",),
+)
+JOB_DURATION = Histogram("assembly_job_duration_seconds", "Wall time of one assembly", ("render_mode", "render_profile"))
+STAGE_DURATION = Histogram("assembly_stage_duration_seconds", "Wall time of one assembly stage", ("stage",))
+CLAIM_LATENCY = Histogram(
+    "assembly_claim_duration_seconds",
+    "Round trip of one claim RPC",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+QUEUE_WAIT = Histogram(
+    "assembly_queue_wait_seconds",
+    "Claim time minus job created_at",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+BYTES_TRANSFERRED = Counter("assembly_bytes_total", "Asset bytes downloaded and output bytes uploaded", ("direction",))
+JOB_FAILURES = Counter(
+    "assembly_job_failures_total",
+    "Failed assembly attempts by stage and kind (transient, permanent)",
+    ("stage", "kind"),
+)
+RUNNING_JOBS = Gauge("assembly_running_jobs", "Jobs running on this worker")
+WORKER_SLOTS = Gauge("assembly_worker_slots", "Concurrent job slots on this worker")
+
+# Live view of the loop for queue_stats()
+_supabase = None
+_state = {"slots": 0, "running": 0, "processed": 0}
 
 
 def log(message: str) -> None:
@@ -24,10 +97,129 @@ def log(message: str) -> None:
     print(f"[{now}] {message}", flush=True)
 
 
+def request_drain() -> None:
+    """Stop claiming new jobs and let running ones finish within DRAIN_SECONDS."""
+    global _drain_deadline
+    if _draining.is_set():
+        return
+    _drain_deadline = time.monotonic() + DRAIN_SECONDS
+    _draining.set()
+    log(f"Drain requested, running jobs have {DRAIN_SECONDS:g}s to finish")
+    job_notifier.wake()
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def observe_result(result: dict) -> None:
+    """Feed an assemble_video result's metrics blob into the Prometheus metrics."""
+    blob = result.get("metrics") or {}
+    if "total_seconds" in blob:
+        JOB_DURATION.observe(
+            blob["total_seconds"],
+            render_mode=blob.get("render_mode", ""),
+            render_profile=blob.get("render_profile", ""),
+        )
+    for stage in blob.get("stages") or []:
+        STAGE_DURATION.observe(stage.get("wall_seconds", 0), stage=stage.get("name", ""))
+        if stage.get("name") in ("download", "download_and_encode"):
+            BYTES_TRANSFERRED.inc(stage.get("bytes_in", 0), direction="download")
+        elif stage.get("name") == "upload":
+            BYTES_TRANSFERRED.inc(stage.get("bytes_out", 0), direction="upload")
+
+
 def update_job(supabase, job_id: str, fields: dict) -> None:
     if "updated_at" not in fields:
         fields = {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}
-    supabase.table("assembly_jobs").update(fields).eq("id", job_id).execute()
+    pending = dict(fields)
+    while True:
+        try:
+            supabase.table("assembly_jobs").update(pending).eq("id", job_id).execute()
+            return
+        except Exception as e:
+            # Columns added by newer migrations (e.g. metrics) are dropped
+            # rather than failing the status update on older schemas.
+            match = _MISSING_COLUMN_RE.search(str(e))
+            if match and match.group(1) in pending and len(pending) > 1:
+                log(f"assembly_jobs has no '{match.group(1)}' column, skipping it")
+                pending.pop(match.group(1))
+                continue
+            raise
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts`: exponential, capped, with jitter."""
+    ceiling = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def fail_job(
+    supabase,
+    job: dict,
+    error: str,
+    stage: Optional[str],
+    transient: bool,
+    extra: Optional[dict] = None,
+) -> None:
+    """
+    Record a failed attempt. Permanent errors and jobs out of attempts are
+    marked failed; transient ones go back on the queue after retry_delay().
+    """
+    job_id = job.get("id")
+    attempts = int(job.get("attempts") or 0) + 1
+    max_attempts = int(job.get("max_attempts") or 3)
+    kind = "transient" if transient else "permanent"
+    JOB_FAILURES.inc(stage=stage or "unknown", kind=kind)
+
+    try:
+        current = supabase.table("assembly_jobs").select("error_history").eq("id", job_id).execute()
+        history = list((current.data[0].get("error_history") if current.data else None) or [])
+    except Exception:
+        # Older schema without error_history; update_job drops the column too.
+        history = []
+    history.append({
+        "attempt": attempts,
+        "stage": stage,
+        "kind": kind,
+        "error": (error or "")[:500],
+        "at": datetime.now(timezone.utc).isoformat(),
+    })
+
+    fields = {
+        "attempts": attempts,
+        "last_error": error,
+        "failed_stage": stage,
+        "error_history": history,
+        **(extra or {}),
+    }
+    if not transient or attempts >= max_attempts:
+        reason = "permanent error" if not transient else f"out of attempts ({attempts}/{max_attempts})"
+        log(f"Job {job_id} failed at {stage or 'unknown stage'}, {reason}: {error}")
+        update_job(supabase, job_id, {"status": "failed", **fields})
+        JOBS_FINISHED.inc(outcome="failed")
+        return
+
+    delay = retry_delay(attempts)
+    log(f"Job {job_id} failed at {stage or 'unknown stage'} (transient), retrying in {delay:.0f}s: {error}")
+    update_job(supabase, job_id, {
+        "status": "retry",
+        "locked_by": None,
+        "locked_at": None,
+        "next_run_at": (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat(),
+        **fields,
+    })
+    JOBS_FINISHED.inc(outcome="retried")
+
+
+def _rpc_missing(error: Exception) -> bool:
+    """True when PostgREST says the function isn't installed."""
+    return "PGRST202" in str(error) or "Could not find the function" in str(error)
 
 
 def claim_job(supabase):
@@ -42,6 +234,143 @@ def claim_job(supabase):
     return None
 
 
+def tier_policy() -> dict:
+    """Fair-share weights and running caps per tier, from config.TIER_LIMITS."""
+    return {
+        tier: {"weight": limits.queue_weight, "max_running": limits.max_running_assemblies}
+        for tier, limits in TIER_LIMITS.items()
+    }
+
+
+def claim_jobs(supabase, count: int) -> list:
+    """
+    Claim up to count jobs in one round trip via claim_assembly_jobs, which
+    applies the per-user fair-share order and tier caps. Falls back to
+    claim_assembly_job when the batch RPC isn't installed.
+    """
+    start = time.monotonic()
+    jobs = _claim_jobs(supabase, count)
+    CLAIM_LATENCY.observe(time.monotonic() - start)
+    now = datetime.now(timezone.utc)
+    for job in jobs:
+        JOBS_CLAIMED.inc()
+        created_at = _parse_timestamp(job.get("created_at"))
+        if created_at:
+            QUEUE_WAIT.observe(max(0.0, (now - created_at).total_seconds()))
+    return jobs
+
+
+def _claim_jobs(supabase, count: int) -> list:
+    global _batch_claim_available
+    if _batch_claim_available:
+        try:
+            result = supabase.rpc("claim_assembly_jobs", {
+                "worker_id": WORKER_ID,
+                "lock_seconds": LOCK_SECONDS,
+                "max_jobs": count,
+                "tier_policy": tier_policy(),
+            }).execute()
+            return result.data or []
+        except Exception as e:
+            if not _rpc_missing(e):
+                log(f"Batch claim failed: {type(e).__name__}: {e}")
+                return []
+            log("claim_assembly_jobs not installed, claiming one job at a time")
+            _batch_claim_available = False
+    jobs = []
+    while len(jobs) < count:
+        job = claim_job(supabase)
+        if not job:
+            break
+        jobs.append(job)
+    return jobs
+
+class LeaseKeeper:
+    """
+    Keeps this worker's job leases alive and reaps everyone's stale ones.
+
+    One background thread renews locked_at for every held job in a single
+    update per HEARTBEAT_SECONDS. A held job that is no longer running
+    under this worker (reaped after a stall, or taken over) has its `lost`
+    event set so the render stops instead of finishing as a duplicate.
+    The same thread calls reap_stale_assembly_jobs so crashed workers'
+    jobs go back to the queue within LEASE_STALE_SECONDS.
+    """
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self._held: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._reaper_available = True
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="assembly-lease", daemon=True)
+
+    def start(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(5)
+
+    def hold(self, job_id: str) -> threading.Event:
+        lost = threading.Event()
+        with self._lock:
+            self._held[job_id] = lost
+        return lost
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._held.pop(job_id, None)
+
+    def _run(self) -> None:
+        self.reap()
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            self.heartbeat()
+            self.reap()
+
+    def heartbeat(self) -> None:
+        with self._lock:
+            held = dict(self._held)
+        if not held:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        try:
+            result = (
+                self.supabase.table("assembly_jobs")
+                .update({"locked_at": now, "updated_at": now})
+                .in_("id", list(held))
+                .eq("locked_by", WORKER_ID)
+                .eq("status", "running")
+                .execute()
+            )
+        except Exception as e:
+            # Keep rendering; the reaper only acts once the lease is actually stale.
+            log(f"Lease heartbeat failed: {e}")
+            return
+        renewed = {row.get("id") for row in result.data or []}
+        with self._lock:
+            for job_id, lost in held.items():
+                if job_id not in renewed and self._held.get(job_id) is lost and not lost.is_set():
+                    log(f"Lease lost for job {job_id}, stopping it")
+                    lost.set()
+
+    def reap(self) -> None:
+        if not self._reaper_available:
+            return
+        try:
+            result = self.supabase.rpc("reap_stale_assembly_jobs", {"stale_seconds": LEASE_STALE_SECONDS}).execute()
+        except Exception as e:
+            if _rpc_missing(e):
+                log("reap_stale_assembly_jobs not installed, stale jobs will not be requeued")
+                self._reaper_available = False
+            else:
+                log(f"Reaper failed: {e}")
+            return
+        if result.data:
+            log(f"Reaped {result.data} stale job(s)")
+
+
 def should_cancel(supabase, video_id: str) -> bool:
     try:
         current = supabase.table("videos").select("status").eq("video_id", video_id).execute()
@@ -52,26 +381,74 @@ def should_cancel(supabase, video_id: str) -> bool:
     return False
 
 
-def run_job(supabase, job: dict) -> None:
+def dedup_job(supabase, job: dict, payload: dict) -> bool:
+    """
+    Record the job's fingerprint, then reuse an identical completed render or
+    wait for an identical running one. True if the job needs no render now.
+    """
+    job_id = job["id"]
+    video_id = job["video_id"]
+    fingerprint = payload_fingerprint(payload)
+    try:
+        if job.get("fingerprint") != fingerprint:
+            update_job(supabase, job_id, {"fingerprint": fingerprint})
+        source = find_completed(supabase, fingerprint)
+        if source:
+            video_url = reuse_output(supabase, video_id, source)
+            if video_url:
+                log(f"Job {job_id} reused the render of job {source['id']}")
+                update_job(supabase, job_id, {
+                    "status": "completed",
+                    "output_url": video_url,
+                    "metrics": {"reused_from": source["id"]},
+                })
+                JOBS_FINISHED.inc(outcome="reused")
+                return True
+        twin = find_in_flight(supabase, fingerprint, job_id)
+        if twin:
+            log(f"Job {job_id} waiting for identical job {twin['id']}")
+            update_job(supabase, job_id, {
+                "status": "retry",
+                "locked_by": None,
+                "locked_at": None,
+                "last_error": f"Waiting for identical render (job {twin['id']})",
+                "next_run_at": (datetime.now(timezone.utc) + timedelta(seconds=COALESCE_DELAY_SECONDS)).isoformat(),
+            })
+            JOBS_FINISHED.inc(outcome="deferred")
+            return True
+    except Exception as e:
+        log(f"Render dedup skipped for job {job_id}: {e}")
+    return False
+
+
+def run_job(supabase, job: dict, lease_lost: Optional[threading.Event] = None) -> bool:
+    """Process one claimed job. True if it reached the renderer."""
     job_id = job.get("id")
     video_id = job.get("video_id")
     source_type = job.get("source_type", "director")
     source_id = job.get("source_id")
     payload = job.get("payload") or {}
     attempts = int(job.get("attempts") or 0)
-    max_attempts = int(job.get("max_attempts") or 3)
 
     if not job_id or not video_id:
-        return
+        return False
 
     if should_cancel(supabase, video_id):
         update_job(supabase, job_id, {"status": "canceled"})
-        return
+        JOBS_FINISHED.inc(outcome="canceled")
+        return False
 
     update_job(supabase, job_id, {"status": "running", "locked_by": WORKER_ID, "locked_at": datetime.now(timezone.utc).isoformat()})
 
-    # Fetch video data from database if payload is empty
-    if not payload or not payload.get("image_urls"):
+    if payload.get("manifest_version") is not None:
+        # Self-contained manifest: everything needed to render is in the job.
+        try:
+            payload = expand_manifest({**payload, "video_id": video_id})
+        except ValueError as e:
+            fail_job(supabase, job, str(e), "manifest", transient=False)
+            return False
+    elif not payload or not payload.get("image_urls"):
+        # Jobs enqueued before manifests: rebuild the payload from the source row.
         try:
             # Determine which table to query based on source_type
             table_name = "director_videos" if source_type == "director" else "episodes"
@@ -96,105 +473,243 @@ def run_job(supabase, job: dict) -> None:
                     "transition_style": config.get("transition_style", "random"),
                     "color_grade": config.get("color_grade", "cinematic"),
                     "words_per_line": config.get("words_per_line", 2),
+                    "render_profile": config.get("render_profile"),
                 }
                 log(f"Built payload with {len(payload.get('beats', []))} beats, captions={payload.get('include_captions')}, style={payload.get('caption_style')}")
             else:
                 log(f"No video found in {table_name} for video_id: {video_id}")
-                update_job(supabase, job_id, {
-                    "status": "failed",
-                    "last_error": f"Video not found in {table_name}",
-                })
-                return
+                fail_job(supabase, job, f"Video not found in {table_name}", "fetch_payload", transient=False)
+                return False
         except Exception as e:
             log(f"Failed to fetch video data: {e}")
-            update_job(supabase, job_id, {
-                "status": "failed",
-                "last_error": f"Failed to fetch video data: {str(e)}",
-            })
-            return
+            fail_job(supabase, job, f"Failed to fetch video data: {str(e)}", "fetch_payload", transient=True)
+            return False
     else:
         # Ensure video_id is in payload
         payload = {**payload, "video_id": video_id}
 
-    result = assemble_video(payload)
+    if RENDER_DEDUP_ENABLED and is_dedupable(payload) and dedup_job(supabase, job, payload):
+        return False
 
-    if result.get("error"):
-        attempts += 1
-        if attempts >= max_attempts:
-            update_job(supabase, job_id, {
-                "status": "failed",
-                "attempts": attempts,
-                "last_error": result.get("error"),
-            })
-            return
+    def should_stop() -> bool:
+        return _abort_running.is_set() or bool(lease_lost and lease_lost.is_set())
+
+    result = assemble_video(payload, should_stop=should_stop)
+    metrics = {"metrics": result["metrics"]} if result.get("metrics") else {}
+    observe_result(result)
+
+    if lease_lost and lease_lost.is_set():
+        # The job was requeued while we held it; its row belongs to whoever claims it next.
+        log(f"Job {job_id} lost its lease, leaving its status alone")
+        JOBS_FINISHED.inc(outcome="lease_lost")
+        return True
 
-        backoff = RETRY_BACKOFF_SECONDS * attempts
+    if _abort_running.is_set() and result.get("error"):
+        log(f"Job {job_id} stopped by drain, requeueing")
         update_job(supabase, job_id, {
             "status": "retry",
-            "attempts": attempts,
-            "last_error": result.get("error"),
-            "next_run_at": (datetime.now(timezone.utc) + timedelta(seconds=backoff)).isoformat(),
+            "locked_by": None,
+            "locked_at": None,
+            "last_error": "Worker shut down mid-render",
+            "next_run_at": datetime.now(timezone.utc).isoformat(),
+            **metrics,
         })
-        return
+        JOBS_FINISHED.inc(outcome="requeued")
+        return True
+
+    if result.get("canceled"):
+        update_job(supabase, job_id, {"status": "canceled", "last_error": result.get("error")})
+        JOBS_FINISHED.inc(outcome="canceled")
+        return True
+
+    if result.get("error"):
+        # Results without a classification are retried, as before.
+        fail_job(supabase, job, result["error"], result.get("failed_stage"), result.get("transient", True), metrics)
+        return True
 
     update_job(supabase, job_id, {
         "status": "completed",
         "attempts": attempts,
+        "output_url": result.get("video_url"),
+        **metrics,
     })
+    JOBS_FINISHED.inc(outcome="completed")
+    return True
 
 
-def main() -> None:
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+def safe_run_job(supabase, job: dict, leases: LeaseKeeper) -> bool:
+    """
+    Run one job under a lease; unexpected errors put it back on the queue.
+    True if it rendered, so deferred and reused jobs don't count toward MAX_JOBS.
+    """
+    lease_lost = leases.hold(job.get("id"))
+    try:
+        return run_job(supabase, job, lease_lost)
+    except Exception as e:
+        log(f"Job {job.get('id')} failed: {e}")
+        if lease_lost.is_set():
+            JOBS_FINISHED.inc(outcome="lease_lost")
+            return False
+        try:
+            fail_job(supabase, job, str(e), "worker", transient=True)
+        except Exception as inner:
+            log(f"Failed to update job status: {inner}")
+        return False
+    finally:
+        leases.release(job.get("id"))
+
+
+def queue_stats() -> dict:
+    """
+    Backlog and slot usage for the autoscaler: claimable queue depth, age of
+    the oldest claimable job, jobs running fleet-wide, and this worker's slots.
+    """
+    stats = {
+        "worker_id": WORKER_ID,
+        "slots": _state["slots"],
+        "active_slots": _state["running"],
+        "processed": _state["processed"],
+        "draining": _draining.is_set(),
+    }
+    if not _supabase:
+        return {**stats, "error": "Worker not started"}
+    now = datetime.now(timezone.utc)
+    try:
+        waiting = (
+            _supabase.table("assembly_jobs")
+            .select("created_at", count="exact")
+            .in_("status", ["pending", "retry"])
+            .or_(f"next_run_at.is.null,next_run_at.lte.{now.isoformat()}")
+            .order("created_at")
+            .limit(1)
+            .execute()
+        )
+        running = (
+            _supabase.table("assembly_jobs")
+            .select("id", count="exact")
+            .eq("status", "running")
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        return {**stats, "error": str(e)}
+
+    oldest_age = None
+    if waiting.data:
+        oldest = _parse_timestamp(waiting.data[0].get("created_at"))
+        if oldest:
+            oldest_age = max(0, int((now - oldest).total_seconds()))
+    queue_depth = waiting.count or 0
+    running_jobs = running.count or 0
+    return {
+        **stats,
+        "queue_depth": queue_depth,
+        "oldest_pending_age_seconds": oldest_age,
+        "running_jobs": running_jobs,
+        # Workers of this size needed to run the whole backlog at once.
+        "desired_workers": math.ceil((queue_depth + running_jobs) / max(1, _state["slots"])),
+    }
+
 
-    log(f"Supabase URL: {SUPABASE_URL}")
-    log(f"Supabase KEY prefix: {SUPABASE_KEY[:20]}..." if SUPABASE_KEY else "None")
+def main() -> None:
+    global _supabase
+    if QUEUE_BACKEND == "local":
+        log(f"Local queue backend: {LOCAL_DB_PATH} (storage in {LOCAL_STORAGE_DIR})")
+    else:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+        log(f"Supabase URL: {SUPABASE_URL}")
+        log(f"Supabase KEY prefix: {SUPABASE_KEY[:20]}..." if SUPABASE_KEY else "None")
 
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        log(f"Worker started: {WORKER_ID}")
+        supabase = get_backend_client()
+        slots = worker_slots()
+        log(f"Worker started: {WORKER_ID} ({slots} slot{'s' if slots != 1 else ''})")
     except Exception as e:
-        log(f"FATAL: Failed to create Supabase client: {e}")
+        log(f"FATAL: Failed to create {QUEUE_BACKEND} client: {e}")
         import traceback
         log(f"Traceback: {traceback.format_exc()}")
         raise
 
+    _supabase = supabase
+    _state["slots"] = slots
+    WORKER_SLOTS.set(slots)
+    push = job_notifier.start_listener()
+    leases = LeaseKeeper(supabase).start()
     start_time = time.monotonic()
     processed = 0
-
-    log("Entering main loop...")
-    while True:
-        log(f"Loop iteration - processed: {processed}, runtime: {int(time.monotonic() - start_time)}s")
-        if MAX_RUNTIME_SECONDS and (time.monotonic() - start_time) >= MAX_RUNTIME_SECONDS:
-            log("Max runtime reached, exiting")
-            break
-        if MAX_JOBS and processed >= MAX_JOBS:
-            log("Max jobs reached, exiting")
-            break
-        log("Attempting to claim job...")
-        job = claim_job(supabase)
-        log(f"Claim result: {job}")
-        if not job:
-            if WORKER_MODE == "job":
-                log("No jobs available, exiting")
+    running = {}
+    idle_delay = POLL_SECONDS
+    idle_logged = False
+
+    log(f"Entering main loop (idle poll {POLL_SECONDS}-{POLL_MAX_SECONDS}s{', push wakeups on' if push else ''})")
+    with ThreadPoolExecutor(max_workers=slots, thread_name_prefix="assembly-slot") as pool:
+        while True:
+            for future in [f for f in running if f.done()]:
+                running.pop(future)
+                if future.result():
+                    processed += 1
+            _state["running"] = len(running)
+            RUNNING_JOBS.set(len(running))
+            _state["processed"] = processed
+
+            if _draining.is_set():
+                if not running:
+                    log("Drained, exiting")
+                    break
+                if time.monotonic() >= _drain_deadline and not _abort_running.is_set():
+                    log(f"Drain timeout, stopping and requeueing {len(running)} job(s)")
+                    _abort_running.set()
+                job_notifier.wait_for_wake(0.5)
+                continue
+
+            stop_reason = None
+            if MAX_RUNTIME_SECONDS and (time.monotonic() - start_time) >= MAX_RUNTIME_SECONDS:
+                stop_reason = "Max runtime reached"
+            elif MAX_JOBS and processed >= MAX_JOBS:
+                stop_reason = "Max jobs reached"
+            if stop_reason:
+                if running:
+                    log(f"{stop_reason}, waiting for {len(running)} running job(s)")
+                    wait(running)
+                    continue
+                log(f"{stop_reason}, exiting")
                 break
-            time.sleep(POLL_SECONDS)
-            continue
-        try:
-            run_job(supabase, job)
-            processed += 1
-        except Exception as e:
-            log(f"Job {job.get('id')} failed: {e}")
-            try:
-                update_job(supabase, job.get("id"), {
-                    "status": "retry",
-                    "attempts": (job.get("attempts") or 0) + 1,
-                    "last_error": str(e),
-                    "next_run_at": (datetime.now(timezone.utc) + timedelta(seconds=RETRY_BACKOFF_SECONDS)).isoformat(),
-                })
-            except Exception as inner:
-                log(f"Failed to update job status: {inner}")
+
+            free = slots - len(running)
+            if MAX_JOBS:
+                free = min(free, MAX_JOBS - processed - len(running))
+            jobs = claim_jobs(supabase, free) if free > 0 else []
+            for job in jobs:
+                future = pool.submit(safe_run_job, supabase, job, leases)
+                future.add_done_callback(lambda _: job_notifier.wake())
+                running[future] = job
+            _state["running"] = len(running)
+            RUNNING_JOBS.set(len(running))
+            if jobs:
+                log(f"Claimed {[job.get('id') for job in jobs]} - processed: {processed}, running: {len(running)}, runtime: {int(time.monotonic() - start_time)}s")
+                idle_delay = POLL_SECONDS
+                idle_logged = False
+
+            if free > 0 and len(jobs) < free:
+                # The queue came up short, so there is nothing else to claim yet.
+                if not running and WORKER_MODE == "job":
+                    log("No jobs available, exiting")
+                    break
+                if not idle_logged:
+                    log(f"Queue empty - processed: {processed}, running: {len(running)}")
+                    idle_logged = True
+                # Back off while idle; a push wakeup or finished job cuts it short.
+                timeout = idle_delay
+                idle_delay = min(idle_delay * 2, POLL_MAX_SECONDS)
+            else:
+                # Every slot is busy; a finishing job wakes us.
+                timeout = POLL_MAX_SECONDS
+            if job_notifier.wait_for_wake(timeout):
+                idle_delay = POLL_SECONDS
+    leases.stop()
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, lambda *_: request_drain())
     main()
@@ -0,0 +1,174 @@
+# render_dedup.py
+"""
+Render deduplication by payload fingerprint.
+The fingerprint covers every payload field that changes the rendered file
+(assets, beats, style settings, render profile) and nothing that doesn't
+(video_id, render mode, callbacks). A job whose fingerprint matches a
+completed render copies that output in storage instead of encoding again;
+a job whose twin is still rendering waits for it. Only manifest jobs whose
+assets all carry a size or ETag take part: a bare URL can't tell a
+re-upload to the same path from the original.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from status_writer import StatusWriter
+from viral_pipeline import DEFAULT_RENDER_PROFILE
+
+RENDER_DEDUP_ENABLED = os.environ.get("ASSEMBLY_RENDER_DEDUP", "true").lower() != "false"
+# How long a job waits before re-checking an identical in-flight render.
+COALESCE_DELAY_SECONDS = int(os.environ.get("ASSEMBLY_COALESCE_DELAY_SECONDS", "15"))
+# Bump when the renderer changes output for the same payload. This is the
+# only render fingerprint; the claim groups identical manifests by their own
+# hash (render_key) and leaves reuse decisions to this one.
+FINGERPRINT_VERSION = 2
+
+VIDEO_BUCKET = "videos"
+
+
+def _asset_keys(payload: dict) -> list:
+    keys = [f"image_{i}" for i, url in enumerate(payload.get("image_urls") or []) if url]
+    return keys + [key for key in ("audio", "bgm") if payload.get(f"{key}_url")]
+
+
+def is_dedupable(payload: dict) -> bool:
+    """True for manifest payloads whose every asset was described (size or ETag) at enqueue."""
+    if payload.get("manifest_version") is None:
+        return False
+    described = set(payload.get("asset_sizes") or {}) | set(payload.get("asset_etags") or {})
+    return all(key in described for key in _asset_keys(payload))
+
+
+def payload_fingerprint(payload: dict) -> str:
+    """Canonical hash of the render inputs, with _assemble_video's defaults applied."""
+    canonical = {
+        "version": FINGERPRINT_VERSION,
+        "image_urls": list(payload.get("image_urls") or []),
+        "audio_url": payload.get("audio_url"),
+        "bgm_url": payload.get("bgm_url"),
+        "beats": payload.get("beats") or [],
+        "durations": [round(float(d), 3) for d in payload.get("durations") or []],
+        "include_captions": bool(payload.get("include_captions", True)),
+        "caption_style": payload.get("caption_style", "red_highlight"),
+        "words_per_line": payload.get("words_per_line", 2),
+        "motion_effect": payload.get("motion_effect", "ken_burns"),
+        "transition_style": payload.get("transition_style", "random"),
+        "color_grade": payload.get("color_grade", "cinematic"),
+        "render_profile": (payload.get("render_profile") or DEFAULT_RENDER_PROFILE).lower(),
+        "asset_sizes": payload.get("asset_sizes") or {},
+        "asset_etags": payload.get("asset_etags") or {},
+        # Set by the local enqueue CLI so load-test copies aren't twins.
+        "salt": payload.get("dedup_salt"),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _storage_path(video_id: str) -> str:
+    return f"{video_id}/video.mp4"
+
+
+def _output_exists(supabase, video_id: str) -> bool:
+    try:
+        files = supabase.storage.from_(VIDEO_BUCKET).list(video_id)
+    except Exception as e:
+        print(f"[render_dedup] Could not list outputs for {video_id}: {e}", flush=True)
+        return False
+    return any(item.get("name") == "video.mp4" for item in files or [])
+
+
+def _latest_completed_fingerprint(supabase, video_id: str) -> Optional[str]:
+    result = (
+        supabase.table("assembly_jobs")
+        .select("fingerprint")
+        .eq("video_id", video_id)
+        .eq("status", "completed")
+        .order("updated_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return result.data[0].get("fingerprint") if result.data else None
+
+
+def find_completed(supabase, fingerprint: str) -> Optional[dict]:
+    """
+    Most recent completed job with this fingerprint whose output is still
+    in storage and hasn't since been overwritten by a different render
+    of the same video.
+    """
+    result = (
+        supabase.table("assembly_jobs")
+        .select("id, video_id, output_url")
+        .eq("fingerprint", fingerprint)
+        .eq("status", "completed")
+        .order("updated_at", desc=True)
+        .limit(5)
+        .execute()
+    )
+    for job in result.data or []:
+        if not job.get("output_url"):
+            continue
+        if _latest_completed_fingerprint(supabase, job["video_id"]) != fingerprint:
+            continue
+        if _output_exists(supabase, job["video_id"]):
+            return job
+    return None
+
+
+def find_in_flight(supabase, fingerprint: str, job_id: str) -> Optional[dict]:
+    """
+    A running job with the same fingerprint that this job should wait for.
+    Only jobs with a lower id count, so two twins claimed together never
+    both wait on each other.
+    """
+    result = (
+        supabase.table("assembly_jobs")
+        .select("id, video_id")
+        .eq("fingerprint", fingerprint)
+        .eq("status", "running")
+        .neq("id", job_id)
+        .execute()
+    )
+    twins = sorted((job for job in result.data or [] if str(job.get("id")) < str(job_id)), key=lambda j: str(j["id"]))
+    return twins[0] if twins else None
+
+
+def reuse_output(supabase, video_id: str, source: dict) -> Optional[str]:
+    """
+    Point video_id at the source job's render, copying it in storage when it
+    belongs to another video. Marks the video completed and returns its URL,
+    or None if the copy failed (the caller then renders normally).
+    """
+    bucket = supabase.storage.from_(VIDEO_BUCKET)
+    if source["video_id"] != video_id:
+        try:
+            # Storage copy refuses to overwrite; clear any stale output first.
+            bucket.remove([_storage_path(video_id)])
+        except Exception:
+            pass
+        try:
+            bucket.copy(_storage_path(source["video_id"]), _storage_path(video_id))
+        except Exception as e:
+            print(f"[render_dedup] Copy from {source['video_id']} failed: {e}", flush=True)
+            return None
+
+    video_url = bucket.get_public_url(_storage_path(video_id))
+    if video_url.endswith("?"):
+        video_url = video_url[:-1]
+
+    writer = StatusWriter(supabase, video_id).start()
+    writer.update({
+        "status": "completed",
+        "video_url": video_url,
+        "assembly_progress": 100,
+        "assembly_stage": "completed",
+        "assembly_eta_seconds": 0,
+        "assembly_log": f"Reused identical render of {source['video_id']}",
+        "assembly_completed_at": datetime.now(timezone.utc).isoformat(),
+    })
+    writer.close()
+    return video_url
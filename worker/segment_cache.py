@@ -0,0 +1,145 @@
+# segment_cache.py
+"""
+Content-addressed cache of encoded scene segments.
+Keys cover the image bytes and every setting that changes the encoded
+output, so re-assemblies that only change captions or audio reuse them.
+Eviction is LRU by total bytes (mtime is bumped on every hit).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+STATE_DIR = Path(os.environ.get("ASSEMBLY_STATE_DIR") or Path(tempfile.gettempdir(), "reelsbot-assembly"))
+SEGMENT_CACHE_DIR = Path(os.environ.get("ASSEMBLY_SEGMENT_CACHE_DIR") or STATE_DIR / "segments")
+SEGMENT_CACHE_MAX_MB = int(os.environ.get("ASSEMBLY_SEGMENT_CACHE_MAX_MB", "2048"))
+SEGMENT_CACHE_ENABLED = os.environ.get("ASSEMBLY_SEGMENT_CACHE", "true").lower() != "false"
+# Single-pass renders never read segments, so writing them there means
+# encoding every scene twice. Off unless re-assemblies are common enough to pay for it.
+SEGMENT_CACHE_WARM_SINGLE_PASS = os.environ.get("ASSEMBLY_SEGMENT_CACHE_WARM_SINGLE_PASS", "false").lower() == "true"
+
+_evict_lock = threading.Lock()
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segment_key(
+    image_path: Path,
+    duration: float,
+    motion_effect: str,
+    color_grade: str,
+    width: int,
+    height: int,
+    fps: int,
+    filter_chain: str,
+    encoder_args: List[str],
+) -> str:
+    """Build the cache key for one encoded segment."""
+    params = {
+        "image": _file_hash(image_path),
+        "duration": f"{duration:.3f}",
+        "motion_effect": motion_effect,
+        "color_grade": color_grade,
+        "size": f"{width}x{height}",
+        "fps": fps,
+        "filter": filter_chain,
+        "encoder": encoder_args,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return SEGMENT_CACHE_DIR / f"{key}.mp4"
+
+
+def lookup(key: str, dest: Path) -> Optional[Path]:
+    """
+    Link (or copy) the cached segment for key to dest and mark it recently
+    used. Returns dest, or None on a miss. The job works from its own link,
+    so another slot evicting the entry can't pull the file out from under it.
+    """
+    if not SEGMENT_CACHE_ENABLED:
+        return None
+    path = _cache_path(key)
+    try:
+        os.utime(path)
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(path, dest)
+        except OSError:
+            # Different filesystem (or no hardlinks): fall back to a copy.
+            shutil.copyfile(path, dest)
+    except OSError:
+        dest.unlink(missing_ok=True)
+        return None
+    return dest
+
+
+def store(key: str, src: Path) -> None:
+    """Copy an encoded segment into the cache, then evict down to the size budget."""
+    if not SEGMENT_CACHE_ENABLED or not src.exists():
+        return
+    SEGMENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = SEGMENT_CACHE_DIR / f".{key}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, _cache_path(key))
+    except OSError as e:
+        print(f"[segment_cache] Failed to store {key[:12]}: {e}")
+        tmp.unlink(missing_ok=True)
+        return
+    evict()
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """Delete least recently used segments until the cache fits. Returns files removed."""
+    if max_bytes is None:
+        max_bytes = SEGMENT_CACHE_MAX_MB * 1024 * 1024
+    if not SEGMENT_CACHE_DIR.exists():
+        return 0
+    with _evict_lock:
+        entries = []
+        total = 0
+        for f in SEGMENT_CACHE_DIR.glob("*.mp4"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        removed = 0
+        for _, size, f in sorted(entries):
+            if total <= max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    if removed:
+        print(f"[segment_cache] Evicted {removed} segments")
+    return removed
+
+
+def clear_cache():
+    """Clear the segment cache."""
+    if SEGMENT_CACHE_DIR.exists():
+        shutil.rmtree(SEGMENT_CACHE_DIR)
+        print("[segment_cache] Cache cleared")
+
+
+def get_cache_size() -> int:
+    """Get total size of cached segments in bytes."""
+    if not SEGMENT_CACHE_DIR.exists():
+        return 0
+    return sum(f.stat().st_size for f in SEGMENT_CACHE_DIR.glob("*.mp4"))
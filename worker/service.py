@@ -1,11 +1,15 @@
 import threading
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
-from queue_worker import main as worker_main
+import job_notifier
+import service_metrics
+from queue_worker import DRAIN_SECONDS, main as worker_main, queue_stats, request_drain
 
 
 app = FastAPI()
+worker_thread = None
 
 
 def worker_wrapper():
@@ -18,11 +22,23 @@ def worker_wrapper():
 
 @app.on_event("startup")
 def start_worker() -> None:
-    thread = threading.Thread(target=worker_wrapper, daemon=True)
-    thread.start()
+    global worker_thread
+    worker_thread = threading.Thread(target=worker_wrapper, daemon=True)
+    worker_thread.start()
     print("Worker thread started", flush=True)
 
 
+@app.on_event("shutdown")
+def stop_worker() -> None:
+    # uvicorn runs this on SIGTERM: stop claiming, let running jobs finish or
+    # requeue them, then let the process exit.
+    request_drain()
+    if worker_thread:
+        worker_thread.join(DRAIN_SECONDS + 5)
+        if worker_thread.is_alive():
+            print("Worker still busy after drain, exiting anyway", flush=True)
+
+
 @app.get("/")
 def root() -> dict:
     return {"status": "ok"}
@@ -31,3 +47,19 @@ def root() -> dict:
 @app.get("/healthz")
 def healthz() -> dict:
     return {"status": "ok"}
+
+
+@app.get("/scaling")
+def scaling() -> dict:
+    return queue_stats()
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(service_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/wake")
+def wake() -> dict:
+    job_notifier.wake()
+    return {"status": "ok"}
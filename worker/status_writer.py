@@ -0,0 +1,167 @@
+# status_writer.py
+"""
+Background status writer for assembly progress.
+Coalesces status updates for one video row on its own thread, polls for
+cancellation on the same thread, and remembers columns the schema lacks
+for the life of the process, so the render path never waits on PostgREST.
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Set
+
+STATUS_FLUSH_SECONDS = float(os.environ.get("ASSEMBLY_STATUS_FLUSH_SECONDS", "1"))
+CANCEL_POLL_SECONDS = float(os.environ.get("ASSEMBLY_CANCEL_POLL_SECONDS", "5"))
+
+_MISSING_COLUMN_RE = re.compile(r"Could not find the '([^']+)' column")
+# Optional columns older schemas may not have; errors naming them drop them too.
+_OPTIONAL_COLUMNS = ("assembly_reason", "updated_at")
+
+_missing_columns: Set[str] = set()
+_missing_lock = threading.Lock()
+
+
+def _drop_missing(fields: dict) -> dict:
+    with _missing_lock:
+        return {k: v for k, v in fields.items() if k not in _missing_columns}
+
+
+def _mark_missing(column: str) -> None:
+    with _missing_lock:
+        if column not in _missing_columns:
+            _missing_columns.add(column)
+            print(f"[status_writer] Column '{column}' not in schema, skipping it from now on", flush=True)
+
+
+class StatusWriter:
+    """
+    Writes status fields for one video on a background thread.
+
+    update() merges fields into a pending dict and returns immediately;
+    the thread writes at most once per flush_seconds. The same thread
+    polls the row's status every cancel_poll_seconds and exposes the
+    result through `canceled`.
+    """
+
+    def __init__(
+        self,
+        supabase,
+        video_id: str,
+        table: str = "videos",
+        flush_seconds: float = STATUS_FLUSH_SECONDS,
+        cancel_poll_seconds: float = CANCEL_POLL_SECONDS,
+    ):
+        self.supabase = supabase
+        self.video_id = video_id
+        self.table = table
+        self.flush_seconds = flush_seconds
+        self.cancel_poll_seconds = cancel_poll_seconds
+        self.canceled = False
+        self.writes = 0
+        self._pending: dict = {}
+        self._writing = False
+        self._flush_requested = False
+        self._stop = False
+        self._last_write = 0.0
+        self._last_poll = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"status-{video_id}", daemon=True)
+
+    def start(self) -> "StatusWriter":
+        self._thread.start()
+        return self
+
+    def update(self, fields: dict) -> None:
+        """Queue fields for the next write; later values win."""
+        with self._cond:
+            self._pending.update(fields)
+            self._cond.notify()
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Write anything pending now and wait for it to land."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            while (self._pending or self._writing) and self._thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[status_writer] Flush timed out for {self.video_id}", flush=True)
+                    return
+                self._cond.wait(remaining)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush pending fields and stop the thread."""
+        self.flush(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop:
+                    now = time.monotonic()
+                    write_due = bool(self._pending) and (
+                        self._flush_requested or now - self._last_write >= self.flush_seconds
+                    )
+                    poll_due = now - self._last_poll >= self.cancel_poll_seconds
+                    if write_due or poll_due:
+                        break
+                    waits = [self._last_poll + self.cancel_poll_seconds - now]
+                    if self._pending:
+                        waits.append(self._last_write + self.flush_seconds - now)
+                    self._cond.wait(max(0.05, min(waits)))
+                if self._stop:
+                    return
+                fields = {}
+                if write_due:
+                    fields, self._pending = self._pending, {}
+                    self._flush_requested = False
+                    self._writing = True
+
+            if fields:
+                self._write(fields)
+                with self._cond:
+                    self._writing = False
+                    self._last_write = time.monotonic()
+                    self._cond.notify_all()
+            if poll_due:
+                self._poll_cancel()
+
+    def _write(self, fields: dict) -> None:
+        fields = {**fields, "updated_at": fields.get("updated_at") or datetime.now(timezone.utc).isoformat()}
+        pending = _drop_missing(fields)
+        for _ in range(len(pending) + 1):
+            if not pending:
+                return
+            try:
+                self.supabase.table(self.table).update(pending).eq("video_id", self.video_id).execute()
+                self.writes += 1
+                return
+            except Exception as e:
+                msg = str(e)
+                match = _MISSING_COLUMN_RE.search(msg)
+                missing = match.group(1) if match else next((c for c in _OPTIONAL_COLUMNS if c in msg), None)
+                if missing and missing in pending:
+                    _mark_missing(missing)
+                    pending.pop(missing, None)
+                    continue
+                print(f"[status_writer] Status write failed for {self.video_id}: {e}", flush=True)
+                # Keep the fields for the next write unless newer values arrived.
+                with self._cond:
+                    self._pending = {**pending, **self._pending}
+                return
+
+    def _poll_cancel(self) -> None:
+        self._last_poll = time.monotonic()
+        try:
+            current = self.supabase.table(self.table).select("status").eq("video_id", self.video_id).execute()
+            if current.data and current.data[0].get("status") == "assembly_canceled":
+                self.canceled = True
+        except Exception as e:
+            print(f"[status_writer] Cancel check failed for {self.video_id}: {e}", flush=True)
@@ -0,0 +1,35 @@
+import itertools
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+# Worker modules import each other as top-level modules (python queue_worker.py).
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def client(tmp_path):
+    from local_backend import LocalClient
+
+    return LocalClient(str(tmp_path / "queue.db"), str(tmp_path / "storage"))
+
+
+@pytest.fixture
+def enqueue(client):
+    """Insert an assembly job; each one is created a second after the last."""
+    counter = itertools.count()
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    def insert(**fields) -> dict:
+        n = next(counter)
+        row = {
+            "video_id": f"video-{n}",
+            "payload": {},
+            "created_at": (start + timedelta(seconds=n)).isoformat(),
+            **fields,
+        }
+        return client.table("assembly_jobs").insert(row).execute().data[0]
+
+    return insert
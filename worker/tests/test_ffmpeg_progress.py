@@ -0,0 +1,40 @@
+from viral_pipeline import _parse_progress
+
+
+def parse(text: str, stop_after: int = 0) -> list:
+    calls = []
+
+    def on_progress(out_seconds, speed):
+        calls.append((out_seconds, speed))
+        return not stop_after or len(calls) < stop_after
+
+    _parse_progress(iter(text.splitlines(keepends=True)), on_progress)
+    return calls
+
+
+def test_one_call_per_block():
+    text = (
+        "frame=10\nout_time_us=1500000\nspeed=2.5x\nprogress=continue\n"
+        "frame=20\nout_time_us=3000000\nspeed=2.4x\nprogress=end\n"
+    )
+    assert parse(text) == [(1.5, 2.5), (3.0, 2.4)]
+
+
+def test_falls_back_to_out_time_ms():
+    # Older ffmpeg builds only write out_time_ms, which is also microseconds.
+    assert parse("out_time_ms=2000000\nspeed=1x\nprogress=continue\n") == [(2.0, 1.0)]
+
+
+def test_unknown_speed_and_negative_time():
+    text = "out_time_us=-5\nspeed=N/A\nprogress=continue\nout_time_us=1000000\nspeed=0x\nprogress=end\n"
+    assert parse(text) == [(0.0, None), (1.0, None)]
+
+
+def test_skips_blocks_without_a_time():
+    text = "out_time_us=N/A\nprogress=continue\n\nout_time_us=500000\nprogress=end\n"
+    assert parse(text) == [(0.5, None)]
+
+
+def test_stops_when_callback_returns_false():
+    block = "out_time_us=1000000\nspeed=1x\nprogress=continue\n"
+    assert len(parse(block * 5, stop_after=2)) == 2
@@ -0,0 +1,63 @@
+import pytest
+
+from job_manifest import MANIFEST_VERSION, expand_manifest
+
+MANIFEST = {
+    "manifest_version": 1,
+    "video_id": "v1",
+    "assets": {
+        "images": [
+            {"url": "https://cdn/a.png", "size": 100, "etag": "ea"},
+            {"url": "https://cdn/b.png", "size": 200},
+        ],
+        "audio": {"url": "https://cdn/voice.mp3", "etag": "ev"},
+        "bgm": None,
+    },
+    "timing": {"beats": [{"line": "one"}, {"line": "two"}], "durations": [2.0, 3.0]},
+    "style": {"caption_style": "bold_stroke", "render_profile": "draft"},
+}
+
+
+def test_flattens_a_manifest():
+    payload = expand_manifest(MANIFEST)
+
+    assert payload["manifest_version"] == 1
+    assert payload["video_id"] == "v1"
+    assert payload["image_urls"] == ["https://cdn/a.png", "https://cdn/b.png"]
+    assert payload["audio_url"] == "https://cdn/voice.mp3"
+    assert payload["bgm_url"] is None
+    assert payload["beats"] == [{"line": "one"}, {"line": "two"}]
+    assert payload["durations"] == [2.0, 3.0]
+    assert payload["caption_style"] == "bold_stroke"
+    assert payload["render_profile"] == "draft"
+
+
+def test_records_asset_sizes_and_etags():
+    payload = expand_manifest(MANIFEST)
+
+    assert payload["asset_sizes"] == {"image_0": 100, "image_1": 200}
+    assert payload["asset_etags"] == {"image_0": "ea", "audio": "ev"}
+
+
+def test_passes_the_dedup_salt_through():
+    assert expand_manifest({**MANIFEST, "dedup_salt": "copy-3"})["dedup_salt"] == "copy-3"
+    assert expand_manifest(MANIFEST)["dedup_salt"] is None
+
+
+def test_legacy_payloads_pass_through():
+    legacy = {"video_id": "v1", "image_urls": ["https://cdn/a.png"], "audio_url": "https://cdn/voice.mp3"}
+    assert expand_manifest(legacy) is legacy
+
+
+def test_rejects_newer_manifests():
+    with pytest.raises(ValueError, match="Unsupported manifest version"):
+        expand_manifest({**MANIFEST, "manifest_version": MANIFEST_VERSION + 1})
+
+
+def test_tolerates_empty_sections():
+    payload = expand_manifest({"manifest_version": 1, "video_id": "v1"})
+
+    assert payload["image_urls"] == []
+    assert payload["audio_url"] is None
+    assert payload["beats"] == [] and payload["durations"] == []
+    assert payload["asset_sizes"] == {} and payload["asset_etags"] == {}
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import queue_worker
+from queue_worker import fail_job, retry_delay
+
+
+@pytest.fixture(autouse=True)
+def backoff(monkeypatch):
+    monkeypatch.setattr(queue_worker, "RETRY_BACKOFF_SECONDS", 10)
+    monkeypatch.setattr(queue_worker, "RETRY_BACKOFF_MAX_SECONDS", 100)
+
+
+@pytest.mark.parametrize("attempts, ceiling", [(0, 10), (1, 10), (2, 20), (3, 40), (4, 80), (5, 100), (12, 100)])
+def test_retry_delay_doubles_up_to_the_cap(attempts, ceiling):
+    for _ in range(50):
+        assert ceiling / 2 <= retry_delay(attempts) <= ceiling
+
+
+def job_row(client, job: dict) -> dict:
+    return client.table("assembly_jobs").select("*").eq("id", job["id"]).execute().data[0]
+
+
+def test_transient_failure_is_retried_later(client, enqueue):
+    job = enqueue(status="running", attempts=0, max_attempts=3)
+    before = datetime.now(timezone.utc)
+
+    fail_job(client, job, "Render timed out", "render", transient=True)
+
+    row = job_row(client, job)
+    assert row["status"] == "retry"
+    assert row["attempts"] == 1
+    assert row["locked_by"] is None
+    delay = (datetime.fromisoformat(row["next_run_at"]) - before).total_seconds()
+    assert 5 <= delay <= 11
+    [entry] = row["error_history"]
+    assert (entry["attempt"], entry["stage"], entry["kind"], entry["error"]) == (1, "render", "transient", "Render timed out")
+
+
+def test_permanent_failure_is_not_retried(client, enqueue):
+    job = enqueue(status="running", attempts=0, max_attempts=3)
+
+    fail_job(client, job, "Image 1 is not a decodable image", "validate", transient=False)
+
+    row = job_row(client, job)
+    assert row["status"] == "failed"
+    assert row["failed_stage"] == "validate"
+    assert row["error_history"][0]["kind"] == "permanent"
+
+
+def test_transient_failure_out_of_attempts_fails(client, enqueue):
+    job = enqueue(status="running", attempts=2, max_attempts=3)
+
+    fail_job(client, job, "Upload failed", "upload", transient=True)
+
+    row = job_row(client, job)
+    assert row["status"] == "failed"
+    assert row["attempts"] == 3
+
+
+def test_error_history_accumulates(client, enqueue):
+    job = enqueue(status="running", attempts=0, max_attempts=5)
+    fail_job(client, job, "first", "download", transient=True)
+    fail_job(client, job_row(client, job), "second", "render", transient=True)
+
+    history = job_row(client, job)["error_history"]
+    assert [(h["attempt"], h["error"]) for h in history] == [(1, "first"), (2, "second")]
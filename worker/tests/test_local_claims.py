@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta, timezone
+
+MANIFEST = {"manifest_version": 1, "assets": {"images": [{"url": "file:///a.png", "size": 10}]}}
+
+
+def claim(client, max_jobs=10, tier_policy=None) -> list:
+    params = {"worker_id": "test-worker", "lock_seconds": 900, "max_jobs": max_jobs, "tier_policy": tier_policy}
+    return client.rpc("claim_assembly_jobs", params).execute().data
+
+
+def ago(seconds: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+def status(client, job: dict) -> str:
+    return client.table("assembly_jobs").select("status").eq("id", job["id"]).execute().data[0]["status"]
+
+
+def test_claims_mark_jobs_running(client, enqueue):
+    job = enqueue()
+
+    [claimed] = claim(client)
+
+    assert claimed["id"] == job["id"]
+    assert claimed["locked_by"] == "test-worker"
+    assert status(client, job) == "running"
+    assert claim(client) == []
+
+
+def test_fair_share_interleaves_users(client, enqueue):
+    backlog = [enqueue(user_id="heavy") for _ in range(3)]
+    light = enqueue(user_id="light")
+
+    claimed = [job["id"] for job in claim(client, max_jobs=2)]
+
+    assert claimed == [backlog[0]["id"], light["id"]]
+
+
+def test_priority_goes_first(client, enqueue):
+    enqueue(user_id="a")
+    urgent = enqueue(user_id="b", priority=9)
+
+    assert claim(client, max_jobs=1)[0]["id"] == urgent["id"]
+
+
+def test_weights_give_heavier_tiers_more_turns(client, enqueue):
+    policy = {"free": {"weight": 1}, "pro": {"weight": 3}}
+    for _ in range(3):
+        enqueue(user_id="pro-user", tier="pro")
+    for _ in range(3):
+        enqueue(user_id="free-user")
+
+    owners = [job["user_id"] for job in claim(client, max_jobs=4, tier_policy=policy)]
+
+    assert owners.count("pro-user") == 3
+    assert owners.count("free-user") == 1
+
+
+def test_running_cap_per_tier(client, enqueue):
+    policy = {"free": {"max_running": 1}, "pro": {"max_running": 2}}
+    enqueue(user_id="f", status="running", locked_at=ago(1))
+    enqueue(user_id="f")
+    for _ in range(3):
+        enqueue(user_id="p", tier="pro")
+
+    owners = [job["user_id"] for job in claim(client, tier_policy=policy)]
+
+    assert owners == ["p", "p"]
+
+
+def test_untiered_owners_use_the_free_policy(client, enqueue):
+    policy = {"free": {"max_running": 1}}
+    for _ in range(2):
+        enqueue(user_id="u", tier="unknown-tier")
+    for _ in range(2):
+        enqueue(user_id="v")
+
+    owners = sorted(job["user_id"] for job in claim(client, tier_policy=policy))
+
+    assert owners == ["u", "v"]
+
+
+def test_ownerless_jobs_are_uncapped(client, enqueue):
+    for _ in range(3):
+        enqueue()
+
+    assert len(claim(client, tier_policy={"free": {"max_running": 1}})) == 3
+
+
+def test_one_claim_per_manifest(client, enqueue):
+    first = enqueue(payload={**MANIFEST, "video_id": "a"})
+    twin = enqueue(payload={**MANIFEST, "video_id": "b"})
+    other = enqueue(payload={**MANIFEST, "dedup_salt": "copy-1", "video_id": "c"})
+
+    claimed = {job["id"] for job in claim(client)}
+    assert claimed == {first["id"], other["id"]}
+
+    # The twin waits while the first render is running...
+    assert claim(client) == []
+    client.table("assembly_jobs").update({"status": "completed"}).eq("id", first["id"]).execute()
+    # ...and is handed out once it finishes, to reuse or re-render.
+    assert [job["id"] for job in claim(client)] == [twin["id"]]
+
+
+def test_waits_for_next_run_at_and_live_locks(client, enqueue):
+    later = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+    enqueue(status="retry", next_run_at=later)
+    enqueue(status="pending", locked_at=ago(60))
+    stale = enqueue(status="pending", locked_at=ago(3600))
+
+    assert [job["id"] for job in claim(client)] == [stale["id"]]
+
+
+def test_reaps_stale_leases(client, enqueue):
+    stale = enqueue(status="running", locked_by="gone", locked_at=ago(120), attempts=0, max_attempts=3)
+    last_try = enqueue(status="running", locked_by="gone", locked_at=ago(120), attempts=2, max_attempts=3)
+    live = enqueue(status="running", locked_by="alive", locked_at=ago(5))
+
+    assert client.rpc("reap_stale_assembly_jobs", {"stale_seconds": 45}).execute().data == 2
+
+    row = client.table("assembly_jobs").select("*").eq("id", stale["id"]).execute().data[0]
+    assert (row["status"], row["attempts"], row["locked_by"]) == ("retry", 1, None)
+    assert "gone" in row["last_error"]
+    assert status(client, last_try) == "failed"
+    assert status(client, live) == "running"
+    assert [job["id"] for job in claim(client)] == [stale["id"]]
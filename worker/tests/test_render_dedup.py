@@ -0,0 +1,62 @@
+from render_dedup import is_dedupable, payload_fingerprint
+from viral_pipeline import DEFAULT_RENDER_PROFILE
+
+PAYLOAD = {
+    "manifest_version": 1,
+    "video_id": "v1",
+    "image_urls": ["https://cdn/a.png", "https://cdn/b.png"],
+    "audio_url": "https://cdn/voice.mp3",
+    "beats": [{"line": "one"}, {"line": "two"}],
+    "durations": [2.0, 3.0],
+    "asset_sizes": {"image_0": 100, "image_1": 200},
+    "asset_etags": {"audio": "ev"},
+}
+
+
+def test_fingerprint_is_stable():
+    reordered = dict(reversed(list(PAYLOAD.items())))
+    assert payload_fingerprint(PAYLOAD) == payload_fingerprint(dict(PAYLOAD)) == payload_fingerprint(reordered)
+
+
+def test_fingerprint_ignores_fields_that_dont_change_the_render():
+    other = {**PAYLOAD, "video_id": "v2", "render_mode": "piped", "callback_url": "https://hook"}
+    assert payload_fingerprint(other) == payload_fingerprint(PAYLOAD)
+
+
+def test_fingerprint_applies_render_defaults():
+    explicit = {
+        **PAYLOAD,
+        "include_captions": True,
+        "caption_style": "red_highlight",
+        "words_per_line": 2,
+        "motion_effect": "ken_burns",
+        "transition_style": "random",
+        "color_grade": "cinematic",
+        "render_profile": DEFAULT_RENDER_PROFILE.upper(),
+        "durations": [2, 3.0001],
+    }
+    assert payload_fingerprint(explicit) == payload_fingerprint(PAYLOAD)
+
+
+def test_fingerprint_changes_with_render_inputs():
+    base = payload_fingerprint(PAYLOAD)
+    changes = [
+        {"image_urls": ["https://cdn/a.png"]},
+        {"durations": [2.0, 4.0]},
+        {"caption_style": "bold_stroke"},
+        {"render_profile": "draft" if DEFAULT_RENDER_PROFILE != "draft" else "final"},
+        {"asset_sizes": {"image_0": 100, "image_1": 201}},
+        {"asset_etags": {"audio": "changed"}},
+        {"dedup_salt": "copy-1"},
+    ]
+    fingerprints = {payload_fingerprint({**PAYLOAD, **change}) for change in changes}
+    assert base not in fingerprints
+    assert len(fingerprints) == len(changes)
+
+
+def test_only_fully_described_manifests_are_dedupable():
+    assert is_dedupable(PAYLOAD)
+    assert not is_dedupable({k: v for k, v in PAYLOAD.items() if k != "manifest_version"})
+    assert not is_dedupable({**PAYLOAD, "asset_sizes": {"image_0": 100}})
+    assert not is_dedupable({**PAYLOAD, "bgm_url": "https://cdn/bgm.mp3"})
+    assert is_dedupable({**PAYLOAD, "bgm_url": "https://cdn/bgm.mp3", "asset_etags": {"audio": "ev", "bgm": "eb"}})
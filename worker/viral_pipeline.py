@@ -1,20 +1,30 @@
 import os
+import queue
 import random
-import re
 import shlex
+import shutil
 import subprocess
 import tempfile
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
-import httpx
 import imageio_ffmpeg
 from mutagen import File as MutagenFile
-from supabase import create_client
+from PIL import Image
 
+import segment_cache
+from asset_fetcher import FetchedAsset, fetch_assets
+from capacity import job_cores
 from captions import STYLES as CAPTION_STYLES
+from config import RenderSettings, get_render_settings
+from job_metrics import JobMetrics
+from queue_backend import get_backend_client
+from status_writer import StatusWriter
 
 
 TRANSITIONS = [
@@ -30,6 +40,238 @@ COLOR_GRADES = {
     "none": "",
 }
 
+# "single_pass" renders the whole reel with one filter_complex graph and one encode.
+# "multi_pass" is the original segment -> concat -> mux -> caption burn chain.
+# "piped" encodes segments like multi_pass, then streams the concat into one
+# mux + caption burn ffmpeg over a pipe instead of writing intermediates.
+RENDER_MODE = os.environ.get("ASSEMBLY_RENDER_MODE", "single_pass").lower()
+CAPTION_FORCE_STYLE = "FontName=Montserrat Black,FontSize=80"
+# draft | preview | final (see config.RENDER_PROFILES); payload["render_profile"] wins.
+DEFAULT_RENDER_PROFILE = os.environ.get("ASSEMBLY_RENDER_PROFILE", "final").lower()
+
+
+def _segment_encode_args(settings: RenderSettings) -> List[str]:
+    return [
+        "-c:v", "libx264",
+        "-preset", settings.segment_preset,
+        "-crf", str(settings.segment_crf),
+        "-r", str(settings.fps),
+        "-pix_fmt", "yuv420p",
+    ]
+
+
+def _delivery_encode_args(settings: RenderSettings) -> List[str]:
+    return [
+        "-c:v", "libx264",
+        "-preset", settings.preset,
+        "-crf", str(settings.crf),
+        "-pix_fmt", "yuv420p",
+        "-r", str(settings.fps),
+    ]
+
+
+# Each job gets its share of the cores (see capacity.worker_slots).
+# Segment encodes run on a bounded pool; each ffmpeg gets a thread cap so
+# workers * threads stays close to that share.
+JOB_CORES = job_cores()
+ENCODE_WORKERS = int(os.environ.get("ASSEMBLY_ENCODE_WORKERS", "0")) or max(1, min(4, JOB_CORES // 2))
+ENCODE_THREADS = int(os.environ.get("ASSEMBLY_ENCODE_THREADS", "0")) or max(1, JOB_CORES // ENCODE_WORKERS)
+
+# Multi-pass jobs start encoding segment i as soon as image i lands. The
+# queue bounds how many downloaded assets may wait for the encoder before
+# downloads are throttled.
+PIPELINE_ENABLED = os.environ.get("ASSEMBLY_PIPELINE", "true").lower() != "false"
+PIPELINE_QUEUE_SIZE = int(os.environ.get("ASSEMBLY_PIPELINE_QUEUE_SIZE", "4"))
+
+# Optional scratch root for job temp files (e.g. a tmpfs mount). A job only
+# lands there if its size estimate fits under the quota; otherwise it uses
+# the system temp dir.
+SCRATCH_DIR = os.environ.get("ASSEMBLY_SCRATCH_DIR", "")
+SCRATCH_QUOTA_MB = int(os.environ.get("ASSEMBLY_SCRATCH_QUOTA_MB", "1024"))
+SCRATCH_JOB_MB = int(os.environ.get("ASSEMBLY_SCRATCH_JOB_MB", "256"))
+
+# Minimum gap between progress writes driven by ffmpeg -progress output.
+PROGRESS_INTERVAL_SECONDS = float(os.environ.get("ASSEMBLY_PROGRESS_INTERVAL_SECONDS", "2"))
+# How often a running ffmpeg is checked for cancellation or a drain.
+STOP_POLL_SECONDS = 1.0
+
+_scratch_lock = threading.Lock()
+_scratch_reserved_mb = 0
+
+
+def _dir_size_mb(root: Path) -> float:
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+@contextmanager
+def _job_tmpdir():
+    """
+    Yield a per-job temp directory, on the scratch root when it has room.
+    Usage already on the scratch root plus reservations held by jobs in this
+    process must leave room for SCRATCH_JOB_MB under the quota.
+    """
+    global _scratch_reserved_mb
+    root = None
+    if SCRATCH_DIR:
+        with _scratch_lock:
+            try:
+                scratch = Path(SCRATCH_DIR)
+                scratch.mkdir(parents=True, exist_ok=True)
+                used_mb = _dir_size_mb(scratch) + _scratch_reserved_mb
+                free_mb = shutil.disk_usage(scratch).free / (1024 * 1024)
+                if used_mb + SCRATCH_JOB_MB <= SCRATCH_QUOTA_MB and free_mb >= SCRATCH_JOB_MB:
+                    root = str(scratch)
+                    _scratch_reserved_mb += SCRATCH_JOB_MB
+                else:
+                    print(f"[viral_pipeline] Scratch dir over quota ({used_mb:.0f} MB used), using system temp")
+            except OSError as e:
+                print(f"[viral_pipeline] Scratch dir unavailable: {e}")
+    try:
+        with tempfile.TemporaryDirectory(dir=root) as tmpdir:
+            yield Path(tmpdir)
+    finally:
+        if root:
+            with _scratch_lock:
+                _scratch_reserved_mb -= SCRATCH_JOB_MB
+
+
+def _parse_progress(stream, on_progress: Callable[[float, Optional[float]], bool]) -> None:
+    """
+    Read ffmpeg `-progress` key=value blocks from stream and call
+    on_progress(out_seconds, speed) once per block. Stops early if the
+    callback returns False.
+    """
+    block: Dict[str, str] = {}
+    for line in stream:
+        key, _, value = line.strip().partition("=")
+        if not key:
+            continue
+        block[key] = value
+        if key != "progress":
+            continue
+        # out_time_ms is microseconds too; older builds only emit that key.
+        raw_time = block.get("out_time_us") or block.get("out_time_ms")
+        raw_speed = block.get("speed", "").rstrip("x").strip()
+        block = {}
+        try:
+            out_seconds = max(0.0, int(raw_time) / 1_000_000)
+        except (TypeError, ValueError):
+            continue
+        try:
+            speed = float(raw_speed) or None
+        except ValueError:
+            speed = None
+        if on_progress(out_seconds, speed) is False:
+            return
+
+
+def _wait_ffmpeg(
+    proc: subprocess.Popen,
+    timeout: int,
+    on_progress: Optional[Callable[[float, Optional[float]], bool]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> str:
+    """
+    Wait for an ffmpeg process and return its stderr. With on_progress the
+    process must have been started with `-progress pipe:1` and stdout=PIPE;
+    the process is killed if the callback returns False. A watchdog checks
+    the deadline and should_stop every STOP_POLL_SECONDS, so a process that
+    never reports progress can still be stopped. Returns only once the
+    process has exited. Raises subprocess.TimeoutExpired (after killing the
+    process) on timeout.
+    """
+    timed_out = threading.Event()
+    finished = threading.Event()
+    deadline = time.monotonic() + timeout
+
+    def watchdog() -> None:
+        while not finished.wait(STOP_POLL_SECONDS):
+            if time.monotonic() >= deadline:
+                timed_out.set()
+            elif not (should_stop and should_stop()):
+                continue
+            proc.kill()
+            return
+
+    guard = threading.Thread(target=watchdog, daemon=True)
+    guard.start()
+    try:
+        if on_progress is None:
+            _, stderr = proc.communicate()
+        else:
+            stderr_chunks: List[str] = []
+            reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+            reader.start()
+            _parse_progress(proc.stdout, on_progress)
+            if proc.poll() is None and not timed_out.is_set():
+                # Callback asked to stop, or stdout closed early.
+                proc.kill()
+            proc.wait()
+            reader.join()
+            stderr = "".join(chunk or "" for chunk in stderr_chunks)
+    finally:
+        finished.set()
+        guard.join()
+    stderr = stderr or ""
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(proc.args, timeout, stderr=stderr)
+    return stderr
+
+
+def _run_ffmpeg(
+    cmd: List[str],
+    timeout: int,
+    on_progress: Optional[Callable[[float, Optional[float]], bool]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> subprocess.CompletedProcess:
+    """subprocess.run for ffmpeg that can stream `-progress` updates and be stopped mid-run."""
+    if on_progress is None and should_stop is None:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if on_progress is not None:
+        cmd = [cmd[0], "-progress", "pipe:1", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    )
+    stderr = _wait_ffmpeg(proc, timeout, on_progress, should_stop)
+    return subprocess.CompletedProcess(cmd, proc.returncode, "", stderr)
+
+
+def _is_transient_failure(error: str) -> bool:
+    """
+    Timeouts and encoders killed by a signal (usually the OOM killer) depend
+    on the worker's load rather than the inputs, so a retry can succeed.
+    """
+    return "timed out" in error or "killed by signal" in error
+
+
+UNDECODABLE_IMAGE = "is not a decodable image"
+
+
+def _image_error(path: Path) -> Optional[str]:
+    """
+    None if the image decodes, else why not. ffmpeg's -loop 1 can spin on a
+    corrupt still until the job times out, so images are checked before any
+    encode starts.
+    """
+    try:
+        with Image.open(path) as image:
+            image.load()
+    except Exception as e:
+        return f"{UNDECODABLE_IMAGE} ({type(e).__name__}: {e})"
+    return None
+
+
 def _get_ffmpeg_bin() -> str:
     try:
         return imageio_ffmpeg.get_ffmpeg_exe()
@@ -37,6 +279,220 @@ def _get_ffmpeg_bin() -> str:
         return "ffmpeg"
 
 
+class _EncodePool:
+    """
+    Bounded pool of ffmpeg processes that accepts commands as they become
+    ready. The first failure (or an abort) kills the encodes still running
+    and skips the queued ones.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        timeout: int = 600,
+        on_output: Optional[Callable[[str], None]] = None,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._timeout = timeout
+        self._on_output = on_output
+        self._abort = threading.Event()
+        self._running: Dict[int, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.error: Optional[str] = None
+
+    def _run_one(self, index: int, cmd: List[str]) -> Optional[str]:
+        with self._lock:
+            if self._abort.is_set():
+                return None
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            self._running[index] = proc
+        try:
+            _, stderr = proc.communicate(timeout=self._timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return f"Segment {index} timed out after {self._timeout}s"
+        finally:
+            with self._lock:
+                self._running.pop(index, None)
+        if self._on_output:
+            self._on_output(stderr or "")
+        if proc.returncode < 0 and not self._abort.is_set():
+            return f"Segment {index} killed by signal {-proc.returncode}"
+        if proc.returncode != 0 and not self._abort.is_set():
+            return f"Segment {index} failed: {(stderr or '')[-200:]}"
+        return None
+
+    def submit(self, index: int, cmd: List[str]) -> None:
+        self._pending.add(self._executor.submit(self._run_one, index, cmd))
+
+    def poll(self, timeout: float = 0.0) -> Optional[str]:
+        """Collect finished encodes, waiting up to timeout for one. Returns the first error."""
+        if self._pending:
+            done, self._pending = wait(self._pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result and not self.error:
+                    self.error = result
+        return self.error
+
+    def abort(self) -> None:
+        with self._lock:
+            self._abort.set()
+            procs = list(self._running.values())
+        for proc in procs:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+        for future in self._pending:
+            future.cancel()
+        wait(self._pending)
+        self._pending = set()
+
+    def drain(self, should_cancel: Optional[Callable[[], bool]] = None) -> Optional[str]:
+        """Wait for every submitted encode. Returns None on success, otherwise an error string."""
+        while self._pending and not self.error:
+            self.poll(timeout=1.0)
+            if not self.error and should_cancel and should_cancel():
+                self.error = "Canceled by user"
+        if self.error:
+            self.abort()
+        return self.error
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def _run_encode_pool(
+    commands: List[List[str]],
+    should_cancel: Optional[Callable[[], bool]] = None,
+    timeout: int = 600,
+    on_output: Optional[Callable[[str], None]] = None,
+) -> Optional[str]:
+    """
+    Run independent ffmpeg commands on a bounded thread pool.
+    Returns None on success, otherwise an error string.
+    """
+    pool = _EncodePool(min(ENCODE_WORKERS, len(commands)) or 1, timeout, on_output)
+    try:
+        for i, cmd in enumerate(commands):
+            pool.submit(i, cmd)
+        return pool.drain(should_cancel)
+    finally:
+        pool.close()
+
+
+def _fetch_and_encode(
+    fetch_items: List[Tuple[str, str, Path]],
+    image_count: int,
+    on_audio: Callable[[Path], None],
+    segment_cmd: Callable[[int, Path], Optional[List[str]]],
+    should_cancel: Optional[Callable[[], bool]] = None,
+    on_output: Optional[Callable[[str], None]] = None,
+) -> Tuple[Dict[str, FetchedAsset], Optional[str]]:
+    """
+    Download assets and encode segments as one producer/consumer pipeline.
+
+    Downloads run on a background thread and hand finished assets over a
+    bounded queue. Segment durations depend on the voiceover length, so
+    on_audio runs once the audio lands; after that, segment_cmd(i, path)
+    is called for every image as it arrives and decodes, and the returned
+    command (None for a cache hit) goes straight to the encode pool.
+
+    Returns the fetched assets and None, or an error string.
+    """
+    ready: "queue.Queue[Optional[FetchedAsset]]" = queue.Queue(maxsize=max(1, PIPELINE_QUEUE_SIZE))
+    stop = threading.Event()
+    fetched: Dict[str, FetchedAsset] = {}
+    fetch_error: List[str] = []
+
+    def deliver(asset: Optional[FetchedAsset]) -> None:
+        while not stop.is_set():
+            try:
+                ready.put(asset, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def produce() -> None:
+        try:
+            fetch_assets(fetch_items, on_complete=deliver, should_stop=stop.is_set)
+        except Exception as e:
+            fetch_error.append(f"Asset download failed: {e}")
+        finally:
+            deliver(None)
+
+    pool = _EncodePool(min(ENCODE_WORKERS, image_count) or 1, on_output=on_output)
+    producer = threading.Thread(target=produce, name="asset-fetch", daemon=True)
+    producer.start()
+
+    waiting: List[Tuple[int, Path]] = []
+    audio_ready = False
+    error = None
+
+    def dispatch(index: int, path: Path) -> None:
+        cmd = segment_cmd(index, path)
+        if cmd:
+            pool.submit(index, cmd)
+
+    try:
+        while error is None:
+            error = pool.poll()
+            if error:
+                break
+            if should_cancel and should_cancel():
+                error = "Canceled by user"
+                break
+            try:
+                asset = ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if asset is None:
+                break
+            fetched[asset.key] = asset
+
+            if asset.key == "audio":
+                if not asset.ok:
+                    error = f"Failed to download audio: {asset.error}"
+                    break
+                on_audio(asset.path)
+                audio_ready = True
+                for index, path in waiting:
+                    dispatch(index, path)
+                waiting = []
+            elif asset.key.startswith("image_"):
+                index = int(asset.key.split("_", 1)[1])
+                if not asset.ok:
+                    error = f"Failed to download image {index + 1}: {asset.error}"
+                    break
+                problem = _image_error(asset.path)
+                if problem:
+                    error = f"Image {index + 1} {problem}"
+                    break
+                if audio_ready:
+                    dispatch(index, asset.path)
+                else:
+                    waiting.append((index, asset.path))
+
+        if error is None:
+            if fetch_error:
+                error = fetch_error[0]
+            elif not audio_ready or len([k for k in fetched if k.startswith("image_")]) < image_count:
+                error = "Asset download did not complete"
+            else:
+                error = pool.drain(should_cancel)
+    finally:
+        stop.set()
+        if error:
+            pool.abort()
+        pool.close()
+        producer.join()
+
+    return fetched, error
+
+
 def _format_ass_time(seconds: float) -> str:
     h = int(seconds // 3600)
     m = int((seconds % 3600) // 60)
@@ -119,16 +575,161 @@ def build_word_by_word_captions(
     return out_path
 
 
-def _enhanced_motion_filter(duration: float, effect: str, scene_index: int) -> str:
+def _enhanced_motion_filter(
+    duration: float,
+    effect: str,
+    scene_index: int,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+) -> str:
     # Use simple, fast filters that don't require zoompan
     # This is much more reliable and won't crash FFmpeg
-    base = "scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black,fps=30"
+    base = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,fps={fps}"
+    )
 
     # For now, just use the simple base filter without motion effects
     # This ensures stability and fast processing
     return base
 
 
+def _scene_filter(
+    duration: float,
+    effect: str,
+    scene_index: int,
+    grade_filter: str,
+    settings: RenderSettings,
+) -> str:
+    motion_vf = _enhanced_motion_filter(
+        duration, effect, scene_index, settings.width, settings.height, settings.fps,
+    )
+    vf = f"{motion_vf},{grade_filter}" if grade_filter else motion_vf
+    return f"{vf},setsar=1"
+
+
+def _resolve_durations(
+    durations: List[float],
+    beats: List[dict],
+    scene_count: int,
+    audio_duration: Optional[float],
+) -> List[float]:
+    if durations and len(durations) == scene_count:
+        resolved = [float(d) for d in durations]
+    elif beats and len(beats) == scene_count:
+        resolved = [float(b.get("duration", 2.5)) for b in beats]
+    elif audio_duration:
+        resolved = [audio_duration / scene_count] * scene_count
+    else:
+        resolved = [2.5] * scene_count
+
+    total_video_duration = sum(resolved)
+    if audio_duration and abs(total_video_duration - audio_duration) > 0.5:
+        scale_factor = audio_duration / total_video_duration
+        resolved = [d * scale_factor for d in resolved]
+    return resolved
+
+
+def _run_piped_finish(
+    ffmpeg_bin: str,
+    seg_list: Path,
+    audio_path: Path,
+    bgm_path: Optional[Path],
+    ass_path: Optional[Path],
+    out_path: Path,
+    settings: RenderSettings,
+    timeout: int = 600,
+    on_output: Optional[Callable[[str], None]] = None,
+    on_progress: Optional[Callable[[float, Optional[float]], bool]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Optional[str]:
+    """
+    Concatenate segments, mix voice + BGM and burn captions without
+    intermediate files: the concat demuxer stream-copies into a NUT stream
+    on stdout, which the muxing ffmpeg reads from stdin.
+    Returns None on success, otherwise an error string.
+    """
+    concat_cmd = [
+        ffmpeg_bin, "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(seg_list),
+        "-c", "copy", "-f", "nut", "pipe:1",
+    ]
+    finish_cmd = [
+        ffmpeg_bin, "-y", "-loglevel", "error", "-stats",
+        *(["-progress", "pipe:1"] if on_progress else []),
+        "-f", "nut", "-i", "pipe:0",
+        "-i", str(audio_path),
+    ]
+    chains = []
+    if bgm_path and bgm_path.exists():
+        finish_cmd += ["-i", str(bgm_path)]
+        chains.append("[2:a]volume=0.2[bgm]")
+        chains.append("[1:a][bgm]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[aout]")
+        audio_map = "[aout]"
+    else:
+        audio_map = "1:a"
+    if ass_path:
+        chains.append(f"[0:v]{_subtitles_filter(ass_path)}[vout]")
+        video_map = "[vout]"
+        video_args = _delivery_encode_args(settings)
+    else:
+        video_map = "0:v"
+        video_args = ["-c:v", "copy"]
+    if chains:
+        finish_cmd += ["-filter_complex", ";".join(chains)]
+    finish_cmd += [
+        "-map", video_map,
+        "-map", audio_map,
+        *video_args,
+        "-c:a", "aac",
+        "-b:a", settings.audio_bitrate,
+        "-shortest",
+        "-movflags", "+faststart",
+        str(out_path),
+    ]
+
+    producer = subprocess.Popen(concat_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        consumer = subprocess.Popen(
+            finish_cmd,
+            stdin=producer.stdout,
+            stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+    except Exception:
+        producer.kill()
+        producer.communicate()
+        raise
+    producer.stdout.close()
+
+    try:
+        finish_err = _wait_ffmpeg(consumer, timeout, on_progress, should_stop)
+    except subprocess.TimeoutExpired:
+        producer.kill()
+        producer.communicate()
+        return f"Piped render timed out after {timeout}s"
+    try:
+        _, concat_err = producer.communicate(timeout=30)
+    except subprocess.TimeoutExpired:
+        producer.kill()
+        _, concat_err = producer.communicate()
+
+    if on_output:
+        on_output(finish_err)
+    if consumer.returncode < 0:
+        return f"Piped render killed by signal {-consumer.returncode}"
+    if consumer.returncode != 0:
+        return f"Piped render failed: {finish_err[-240:]}"
+    concat_err = concat_err.decode(errors="replace")
+    # -shortest stops reading once audio ends, which the producer sees as a broken pipe.
+    if producer.returncode != 0 and "Broken pipe" not in concat_err:
+        return f"Piped concat failed: {concat_err[-240:]}"
+    return None
+
+
 def _audio_duration_seconds(audio_path: Path) -> Optional[float]:
     try:
         audio = MutagenFile(str(audio_path))
@@ -139,7 +740,112 @@ def _audio_duration_seconds(audio_path: Path) -> Optional[float]:
     return None
 
 
-def assemble_video(payload: dict) -> dict:
+def _subtitles_filter(ass_path: Path) -> str:
+    # Use absolute path and proper escaping for subtitles filter
+    ass_abs_path = str(ass_path.absolute()).replace('\\', '/').replace(':', '\\:')
+    return f"subtitles={ass_abs_path}:force_style='{CAPTION_FORCE_STYLE}'"
+
+
+def _build_single_pass_cmd(
+    ffmpeg_bin: str,
+    image_paths: List[Path],
+    durations: List[float],
+    audio_path: Path,
+    bgm_path: Optional[Path],
+    ass_path: Optional[Path],
+    motion_effect: str,
+    grade_filter: str,
+    out_path: Path,
+    settings: RenderSettings,
+    segment_outputs: Optional[Dict[int, Path]] = None,
+) -> List[str]:
+    """
+    Build one ffmpeg command that loops every image for its beat duration,
+    scales/pads it, concatenates the scenes, mixes voice + BGM and burns
+    captions, so the final MP4 is encoded exactly once.
+
+    segment_outputs maps scene index -> path; those scenes are also split
+    off and written as standalone segments to warm the segment cache.
+    """
+    segment_outputs = segment_outputs or {}
+    cmd = [ffmpeg_bin, "-y"]
+    for img_path, duration in zip(image_paths, durations):
+        cmd += ["-loop", "1", "-t", f"{duration:.3f}", "-i", str(img_path)]
+    voice_idx = len(image_paths)
+    cmd += ["-i", str(audio_path)]
+    bgm_idx = None
+    if bgm_path and bgm_path.exists():
+        bgm_idx = voice_idx + 1
+        cmd += ["-i", str(bgm_path)]
+
+    chains = []
+    for i, duration in enumerate(durations):
+        vf = _scene_filter(duration, motion_effect, i, grade_filter, settings)
+        if i in segment_outputs:
+            chains.append(f"[{i}:v]{vf},format=yuv420p,split=2[v{i}][s{i}]")
+        else:
+            chains.append(f"[{i}:v]{vf},format=yuv420p[v{i}]")
+
+    scene_labels = "".join(f"[v{i}]" for i in range(len(image_paths)))
+    concat_out = "[vcat]" if ass_path else "[vout]"
+    chains.append(f"{scene_labels}concat=n={len(image_paths)}:v=1:a=0{concat_out}")
+    if ass_path:
+        chains.append(f"[vcat]{_subtitles_filter(ass_path)}[vout]")
+
+    if bgm_idx is not None:
+        chains.append(f"[{bgm_idx}:a]volume=0.2[bgm]")
+        chains.append(f"[{voice_idx}:a][bgm]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[aout]")
+        audio_map = "[aout]"
+    else:
+        audio_map = f"{voice_idx}:a"
+
+    cmd += [
+        "-filter_complex", ";".join(chains),
+        "-map", "[vout]",
+        "-map", audio_map,
+        *_delivery_encode_args(settings),
+        "-threads", str(JOB_CORES),
+        "-c:a", "aac",
+        "-b:a", settings.audio_bitrate,
+        "-shortest",
+        "-movflags", "+faststart",
+        str(out_path),
+    ]
+    for i, seg_path in sorted(segment_outputs.items()):
+        cmd += ["-map", f"[s{i}]", *_segment_encode_args(settings), "-an", str(seg_path)]
+    return cmd
+
+
+def assemble_video(payload: dict, should_stop: Optional[Callable[[], bool]] = None) -> dict:
+    """
+    Assemble one video. should_stop is polled alongside user cancellation;
+    the queue worker uses it to abort a job whose lease it has lost.
+    Failures carry failed_stage and whether a retry could succeed (transient).
+    """
+    video_id = payload.get("video_id")
+    if not video_id:
+        return {"error": "Missing video_id", "failed_stage": "validate", "transient": False}
+
+    supabase = None
+    try:
+        supabase = get_backend_client()
+    except Exception as e:
+        print(f"[{video_id}] WARN: Supabase client init failed: {e}", flush=True)
+
+    status_writer = StatusWriter(supabase, video_id).start() if supabase else None
+    try:
+        return _assemble_video(payload, supabase, status_writer, should_stop)
+    finally:
+        if status_writer:
+            status_writer.close()
+
+
+def _assemble_video(
+    payload: dict,
+    supabase,
+    status_writer: Optional[StatusWriter],
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> dict:
     video_id = payload.get("video_id")
     image_urls = payload.get("image_urls") or []
     audio_url = payload.get("audio_url")
@@ -152,66 +858,21 @@ def assemble_video(payload: dict) -> dict:
     color_grade = payload.get("color_grade", "cinematic")
     bgm_url = payload.get("bgm_url")
     words_per_line = payload.get("words_per_line", 2)
-
-    if not video_id:
-        return {"error": "Missing video_id"}
-
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    supabase = None
-    if SUPABASE_URL and SUPABASE_KEY:
-        try:
-            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        except Exception as e:
-            print(f"[{video_id}] WARN: Supabase client init failed: {e}", flush=True)
-
-    def safe_update(fields: dict):
-        if not supabase:
-            return None
-        if "updated_at" not in fields:
-            fields = {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}
-        pending = dict(fields)
-        attempts = 0
-        missing_column_re = re.compile(r"Could not find the '([^']+)' column")
-        while True:
-            try:
-                return supabase.table("videos").update(pending).eq("video_id", video_id).execute()
-            except Exception as e:
-                msg = str(e)
-                match = missing_column_re.search(msg)
-                if match:
-                    missing = match.group(1)
-                    if missing in pending:
-                        pending.pop(missing, None)
-                        attempts += 1
-                        if attempts < 6 and pending:
-                            continue
-                if "assembly_reason" in msg or "updated_at" in msg:
-                    trimmed = {k: v for k, v in pending.items() if k not in ("assembly_reason", "updated_at")}
-                    return supabase.table("videos").update(trimmed).eq("video_id", video_id).execute()
-                raise
+    asset_sizes = payload.get("asset_sizes") or {}
+    render_mode = (payload.get("render_mode") or RENDER_MODE).lower()
+    render_profile = (payload.get("render_profile") or DEFAULT_RENDER_PROFILE).lower()
+    settings = get_render_settings(render_profile)
 
     start_time = time.monotonic()
     started_at = datetime.now(timezone.utc).isoformat()
+    metrics = JobMetrics(video_id, render_mode, render_profile)
     total_steps = 8
-    last_cancel_check = 0.0
-    canceled = False
 
     def check_canceled() -> bool:
-        nonlocal canceled, last_cancel_check
-        if canceled or not supabase:
-            return canceled
-        now = time.monotonic()
-        if now - last_cancel_check < 5:
-            return canceled
-        last_cancel_check = now
-        try:
-            current = supabase.table("videos").select("status").eq("video_id", video_id).execute()
-            if current.data and current.data[0].get("status") == "assembly_canceled":
-                canceled = True
-        except Exception as status_err:
-            print(f"[{video_id}] WARN: Status check failed: {status_err}", flush=True)
-        return canceled
+        # Polled on the status writer thread; reading the flag is free.
+        if should_stop and should_stop():
+            return True
+        return bool(status_writer and status_writer.canceled)
 
     def estimate_eta(completed_steps: int) -> Optional[int]:
         if completed_steps <= 0:
@@ -241,7 +902,7 @@ def assemble_video(payload: dict) -> dict:
         if progress is None:
             progress = 100 if effective_status == "completed" else max(1, min(99, int((completed_steps / total_steps) * 100)))
 
-        if supabase:
+        if status_writer:
             update_fields = {
                 "status": effective_status,
                 "assembly_progress": progress,
@@ -258,7 +919,39 @@ def assemble_video(payload: dict) -> dict:
                 update_fields["assembly_reason"] = reason
             if completed_at:
                 update_fields["assembly_completed_at"] = completed_at
-            safe_update(update_fields)
+            status_writer.update(update_fields)
+
+    def ffmpeg_progress(stage: str, log_line: str, start_pct: int, end_pct: int):
+        """
+        Build an on_progress callback that maps ffmpeg's out_time onto the
+        start_pct..end_pct band, derives the ETA from its encode speed and
+        writes at most once per PROGRESS_INTERVAL_SECONDS. Returning False
+        (job canceled) stops the ffmpeg run.
+        """
+        media_seconds = sum(durations)
+        last_report = 0.0
+        furthest = 0.0
+
+        def on_progress(out_seconds: float, speed: Optional[float]) -> bool:
+            nonlocal last_report, furthest
+            # Renders with side outputs report per-output times; never go backwards.
+            furthest = max(furthest, min(out_seconds, media_seconds))
+            now = time.monotonic()
+            if now - last_report < PROGRESS_INTERVAL_SECONDS or media_seconds <= 0:
+                return True
+            last_report = now
+            fraction = furthest / media_seconds
+            eta = int((media_seconds - furthest) / speed) if speed else None
+            report_status(
+                stage=stage,
+                progress=int(start_pct + (end_pct - start_pct) * fraction),
+                log_line=log_line,
+                status="assembling",
+                eta_override=eta,
+            )
+            return not check_canceled()
+
+        return on_progress
 
     def report_step(step_index: int, stage: str, log_line: str) -> None:
         completed_steps = max(step_index - 1, 0)
@@ -271,7 +964,11 @@ def assemble_video(payload: dict) -> dict:
             completed_steps=completed_steps,
         )
 
-    def fail(reason: str):
+    def log_metrics() -> dict:
+        metrics.render_mode = render_mode
+        return metrics.log()
+
+    def fail(reason: str, stage: str, transient: bool = False):
         report_status(
             stage="failed",
             status="assembly_failed",
@@ -279,206 +976,397 @@ def assemble_video(payload: dict) -> dict:
             log_line=f"Assembly failed: {reason}",
             completed_steps=total_steps,
         )
-        return {"error": reason}
+        return {"error": reason, "failed_stage": stage, "transient": transient, "metrics": log_metrics()}
 
     report_status(stage="starting", progress=1, log_line="Assembly started", status="assembling")
 
     if not image_urls:
-        return fail("No image URLs provided")
+        return fail("No image URLs provided", "validate")
     if not audio_url:
-        return fail("No audio URL provided")
+        return fail("No audio URL provided", "validate")
 
     ffmpeg_bin = _get_ffmpeg_bin()
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
-
-        report_step(1, "downloading_images", f"Downloading {len(image_urls)} images")
-        image_paths = []
-        for i, url in enumerate(image_urls):
-            try:
-                resp = httpx.get(url, timeout=60.0, follow_redirects=True)
-                resp.raise_for_status()
-                img_path = tmpdir / f"img_{i:03d}.png"
-                img_path.write_bytes(resp.content)
-                image_paths.append(img_path)
-            except Exception as e:
-                return fail(f"Failed to download image {i+1}: {e}")
-
-        report_step(2, "downloading_audio", "Downloading voiceover")
-        try:
-            resp = httpx.get(audio_url, timeout=60.0, follow_redirects=True)
-            resp.raise_for_status()
-            audio_path = tmpdir / "voiceover.mp3"
-            audio_path.write_bytes(resp.content)
-        except Exception as e:
-            return fail(f"Failed to download audio: {e}")
-
-        actual_audio_duration = _audio_duration_seconds(audio_path)
-
-        if durations and len(durations) == len(image_urls):
-            durations = [float(d) for d in durations]
-        elif beats and len(beats) == len(image_urls):
-            durations = [float(b.get("duration", 2.5)) for b in beats]
-        elif actual_audio_duration:
-            avg_duration = actual_audio_duration / len(image_urls)
-            durations = [avg_duration] * len(image_urls)
-        else:
-            durations = [2.5] * len(image_urls)
-
-        total_video_duration = sum(durations)
-        if actual_audio_duration:
-            duration_diff = abs(total_video_duration - actual_audio_duration)
-            if duration_diff > 0.5:
-                scale_factor = actual_audio_duration / total_video_duration
-                durations = [d * scale_factor for d in durations]
-
-        bgm_path = None
+    with _job_tmpdir() as tmpdir:
+        report_step(1, "downloading_assets", f"Downloading {len(image_urls)} images and audio")
+        # Audio goes first: segment durations are scaled to the voiceover length.
+        fetch_items = [("audio", audio_url, tmpdir / "voiceover.mp3")]
+        fetch_items += [
+            (f"image_{i}", url, tmpdir / f"img_{i:03d}.png")
+            for i, url in enumerate(image_urls)
+        ]
         if bgm_url:
-            report_step(3, "downloading_bgm", "Downloading background music")
-            try:
-                resp = httpx.get(bgm_url, timeout=60.0, follow_redirects=True)
-                resp.raise_for_status()
-                bgm_path = tmpdir / "bgm.mp3"
-                bgm_path.write_bytes(resp.content)
-            except Exception:
-                bgm_path = None
+            fetch_items.append(("bgm", bgm_url, tmpdir / "bgm.mp3"))
 
-        report_step(4, "building_motion_clips", "Building motion clips")
-        segment_paths: List[Path] = []
         grade_filter = COLOR_GRADES.get(color_grade, COLOR_GRADES["cinematic"])
+        final_path = None
+        segment_keys: List[Optional[str]] = [None] * len(image_urls)
+        cached_segments: Dict[int, Path] = {}
+        segment_files: Dict[int, Path] = {}
 
-        for i, (img_path, duration) in enumerate(zip(image_paths, durations)):
-            seg_path = tmpdir / f"seg_{i:03d}.mp4"
-            motion_vf = _enhanced_motion_filter(duration, motion_effect, i)
-            vf = f"{motion_vf},{grade_filter}" if grade_filter else motion_vf
+        def cache_lookup(index: int, img_path: Path) -> Optional[Path]:
+            if not segment_cache.SEGMENT_CACHE_ENABLED:
+                return None
+            duration = durations[index]
+            segment_keys[index] = segment_cache.segment_key(
+                img_path,
+                duration,
+                motion_effect,
+                color_grade,
+                settings.width,
+                settings.height,
+                settings.fps,
+                _scene_filter(duration, motion_effect, index, grade_filter, settings),
+                _segment_encode_args(settings),
+            )
+            hit = segment_cache.lookup(segment_keys[index], tmpdir / f"seg_{index:03d}.mp4")
+            if hit:
+                cached_segments[index] = hit
+            return hit
 
-            cmd = [
+        def segment_cmd(index: int, img_path: Path) -> Optional[List[str]]:
+            hit = cached_segments.get(index)
+            if hit is None and segment_keys[index] is None:
+                hit = cache_lookup(index, img_path)
+            if hit:
+                segment_files[index] = hit
+                return None
+            duration = durations[index]
+            seg_path = tmpdir / f"seg_{index:03d}.mp4"
+            segment_files[index] = seg_path
+            return [
                 ffmpeg_bin, "-y",
                 "-loop", "1",
-                "-t", str(duration),
+                "-t", f"{duration:.3f}",
                 "-i", str(img_path),
-                "-vf", vf,
-                "-c:v", "libx264",
-                "-preset", "veryfast",
-                "-crf", "28",
-                "-r", "30",
-                "-threads", "0",
-                "-pix_fmt", "yuv420p",
+                "-vf", _scene_filter(duration, motion_effect, index, grade_filter, settings),
+                *_segment_encode_args(settings),
+                "-threads", str(ENCODE_THREADS),
                 "-an",
                 str(seg_path),
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-            if result.returncode != 0:
-                return fail(f"Segment {i} failed: {result.stderr[:200]}")
-            segment_paths.append(seg_path)
 
-        report_step(5, "joining_clips", "Joining video clips")
-        if len(segment_paths) == 1:
-            video_only = segment_paths[0]
+        def resolve_durations(audio_path: Path) -> None:
+            nonlocal durations
+            durations = _resolve_durations(durations, beats, len(image_urls), _audio_duration_seconds(audio_path))
+
+        pipelined = render_mode in ("multi_pass", "piped") and PIPELINE_ENABLED
+        if pipelined:
+            report_step(4, "building_motion_clips", "Downloading assets and building motion clips")
+            with metrics.stage("download_and_encode") as stage:
+                fetched, pipeline_error = _fetch_and_encode(
+                    fetch_items,
+                    len(image_urls),
+                    on_audio=resolve_durations,
+                    segment_cmd=segment_cmd,
+                    should_cancel=check_canceled,
+                    on_output=stage.add_ffmpeg_output,
+                )
+                stage.bytes_in = sum(asset.bytes for asset in fetched.values())
+                stage.add_outputs(*[segment_files[i] for i in segment_files if i not in cached_segments])
+            if pipeline_error:
+                if check_canceled():
+                    return {"error": "Canceled by user", "canceled": True}
+                if UNDECODABLE_IMAGE in pipeline_error:
+                    return fail(pipeline_error, "validate")
+                failed_download = any(not asset.ok and asset.transient for asset in fetched.values())
+                return fail(pipeline_error, "download_and_encode", failed_download or _is_transient_failure(pipeline_error))
         else:
-            # Direct concatenation without any transitions - simple frame cuts for storytelling
-            seg_list = tmpdir / "segments.txt"
-            seg_list.write_text("\n".join([f"file '{p}'" for p in segment_paths]), encoding="utf-8")
-            video_only = tmpdir / "video_concat.mp4"
-            concat_cmd = [
-                ffmpeg_bin, "-y", "-f", "concat", "-safe", "0",
-                "-i", str(seg_list), "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23",
-                "-pix_fmt", "yuv420p", "-r", "30", str(video_only),
-            ]
-            result = subprocess.run(concat_cmd, capture_output=True, text=True, timeout=240)
-            if result.returncode != 0:
-                return fail(f"Concat failed: {result.stderr[:240]}")
+            with metrics.stage("download") as stage:
+                fetched = fetch_assets(fetch_items)
+                stage.bytes_in = stage.bytes_out = sum(asset.bytes for asset in fetched.values())
 
-        report_step(6, "mixing_audio", "Mixing audio")
-        final_audio = tmpdir / "final_audio.mp3"
-        if bgm_path and bgm_path.exists():
-            mix_cmd = [
-                ffmpeg_bin, "-y",
-                "-i", str(audio_path),
-                "-i", str(bgm_path),
-                "-filter_complex",
-                "[1:a]volume=0.2[bgm];[0:a][bgm]amerge=inputs=2,pan=stereo|c0<c0+c2|c1<c1+c3[aout]",
-                "-map", "[aout]",
-                "-c:a", "aac",
-                "-b:a", "192k",
-                str(final_audio),
-            ]
-            result = subprocess.run(mix_cmd, capture_output=True, text=True, timeout=300)
-            if result.returncode != 0:
-                final_audio = audio_path
+        # Manifests record asset sizes at enqueue. A body cut short of its
+        # Content-Length is a transport error the fetcher already retried, so
+        # a different size here means the asset was replaced since and a
+        # retry would fetch the same bytes. Fail for good.
+        for key, expected in asset_sizes.items():
+            asset = fetched.get(key)
+            if asset and asset.ok and asset.bytes != expected:
+                return fail(f"{key} is {asset.bytes} bytes, manifest says {expected}", "validate")
+
+        image_paths = []
+        for i in range(len(image_urls)):
+            asset = fetched[f"image_{i}"]
+            if not asset.ok:
+                return fail(f"Failed to download image {i+1}: {asset.error}", "download", asset.transient)
+            if not pipelined:
+                # The pipeline checks each image before handing it to the encoder.
+                problem = _image_error(asset.path)
+                if problem:
+                    return fail(f"Image {i+1} {problem}", "validate")
+            image_paths.append(asset.path)
+
+        if not pipelined:
+            report_step(2, "downloading_audio", "Voiceover downloaded")
+        if not fetched["audio"].ok:
+            return fail(f"Failed to download audio: {fetched['audio'].error}", "download", fetched["audio"].transient)
+        audio_path = fetched["audio"].path
+
+        bgm_path = None
+        if bgm_url:
+            if not pipelined:
+                report_step(3, "downloading_bgm", "Background music downloaded")
+            if fetched["bgm"].ok:
+                bgm_path = fetched["bgm"].path
+
+        if pipelined:
+            for i, seg_path in segment_files.items():
+                if segment_keys[i] and i not in cached_segments:
+                    segment_cache.store(segment_keys[i], seg_path)
         else:
-            final_audio = audio_path
-
-        report_step(7, "merging_audio_video", "Merging video with audio")
-        merged_path = tmpdir / "merged.mp4"
-        merge_cmd = [
-            ffmpeg_bin, "-y",
-            "-i", str(video_only),
-            "-i", str(final_audio),
-            "-c:v", "copy",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-shortest",
-            str(merged_path),
-        ]
-        result = subprocess.run(merge_cmd, capture_output=True, text=True, timeout=240)
-        if result.returncode != 0:
-            return fail(f"Audio merge failed: {result.stderr[:240]}")
-
-        final_path = merged_path
-        print(f"[viral_pipeline] Caption check: include_captions={include_captions}, beats={len(beats) if beats else 0}, caption_style={caption_style}")
-        if include_captions and beats:
-            report_step(8, "burning_captions", "Adding word-by-word captions")
+            resolve_durations(audio_path)
+            # Single-pass never reads segments, so only hash images when it warms the
+            # cache; multi-pass (and a single-pass fallback) looks them up per segment.
+            if render_mode != "single_pass" or segment_cache.SEGMENT_CACHE_WARM_SINGLE_PASS:
+                for i, img_path in enumerate(image_paths):
+                    cache_lookup(i, img_path)
+                if cached_segments and len(cached_segments) == len(image_paths):
+                    print(f"[viral_pipeline] All {len(image_paths)} segments cached, skipping segment encoding")
+                    if render_mode == "single_pass":
+                        render_mode = "multi_pass"
+
+        def build_captions() -> Optional[Path]:
+            if not (include_captions and beats):
+                return None
             ass_path = tmpdir / "captions.ass"
             try:
-                print(f"[viral_pipeline] Building captions: style={caption_style}, beats={len(beats)}, words_per_line={words_per_line}")
                 build_word_by_word_captions(beats, durations, caption_style, ass_path, words_per_line)
-                print(f"[viral_pipeline] Caption file created: {ass_path}, exists={ass_path.exists()}, size={ass_path.stat().st_size if ass_path.exists() else 0} bytes")
+            except Exception as e:
+                print(f"[viral_pipeline] Caption error: {type(e).__name__}: {e}")
+                return None
+            return ass_path
+
+        if render_mode == "single_pass":
+            warm_outputs = {
+                i: tmpdir / f"seg_{i:03d}.mp4"
+                for i, key in enumerate(segment_keys)
+                if key and i not in cached_segments
+            } if segment_cache.SEGMENT_CACHE_WARM_SINGLE_PASS else {}
+            ass_path = build_captions()
+            report_step(4, "rendering", "Rendering video in a single pass")
+            single_pass_path = tmpdir / "final.mp4"
+            render_cmd = _build_single_pass_cmd(
+                ffmpeg_bin,
+                image_paths,
+                durations,
+                audio_path,
+                bgm_path,
+                ass_path,
+                motion_effect,
+                grade_filter,
+                single_pass_path,
+                settings,
+                segment_outputs=warm_outputs,
+            )
+            with metrics.stage("render") as stage:
+                stage.add_inputs(*image_paths, audio_path, bgm_path)
+                result = _run_ffmpeg(
+                    render_cmd,
+                    timeout=900,
+                    on_progress=ffmpeg_progress("rendering", "Rendering video in a single pass", 37, 87),
+                    should_stop=check_canceled,
+                )
+                stage.add_ffmpeg_output(result.stderr)
+                stage.add_outputs(single_pass_path, *warm_outputs.values())
+            if result.returncode == 0:
+                final_path = single_pass_path
+                for i, seg_path in warm_outputs.items():
+                    segment_cache.store(segment_keys[i], seg_path)
+                report_step(8, "finalizing", "Finalizing video")
+            elif check_canceled():
+                return {"error": "Canceled by user", "canceled": True}
+            else:
+                print(f"[viral_pipeline] Single-pass render failed, falling back to multi-pass: {result.stderr[-1000:]}")
+
+        if final_path is None:
+            if not pipelined:
+                report_step(4, "building_motion_clips", "Building motion clips")
+                segment_cmds: List[List[str]] = []
+                for i, img_path in enumerate(image_paths):
+                    cmd = segment_cmd(i, img_path)
+                    if cmd:
+                        segment_cmds.append(cmd)
 
-                # Use absolute path and proper escaping for subtitles filter
-                ass_abs_path = str(ass_path.absolute()).replace('\\', '/').replace(':', '\\:')
-                burn_cmd = [
+                with metrics.stage("segment_encode") as stage:
+                    stage.add_inputs(*image_paths)
+                    segment_error = _run_encode_pool(
+                        segment_cmds,
+                        should_cancel=check_canceled,
+                        on_output=stage.add_ffmpeg_output,
+                    )
+                    stage.add_outputs(*[segment_files[i] for i in segment_files if i not in cached_segments])
+                if segment_error:
+                    if check_canceled():
+                        return {"error": "Canceled by user", "canceled": True}
+                    return fail(segment_error, "segment_encode", _is_transient_failure(segment_error))
+                for i, seg_path in segment_files.items():
+                    if segment_keys[i] and i not in cached_segments:
+                        segment_cache.store(segment_keys[i], seg_path)
+            segment_paths = [segment_files[i] for i in range(len(image_paths))]
+            seg_list = tmpdir / "segments.txt"
+            # Concat resolves relative entries against the list file, so write absolute paths.
+            seg_list.write_text("\n".join([f"file '{p.resolve()}'" for p in segment_paths]), encoding="utf-8")
+
+        if final_path is None and render_mode == "piped":
+            report_step(5, "joining_clips", "Joining clips, audio and captions")
+            piped_path = tmpdir / "final.mp4"
+            with metrics.stage("piped_finish") as stage:
+                stage.add_inputs(*segment_paths, audio_path, bgm_path)
+                piped_error = _run_piped_finish(
+                    ffmpeg_bin, seg_list, audio_path, bgm_path, build_captions(), piped_path, settings,
+                    on_output=stage.add_ffmpeg_output,
+                    on_progress=ffmpeg_progress("joining_clips", "Joining clips, audio and captions", 50, 87),
+                    should_stop=check_canceled,
+                )
+                stage.add_outputs(piped_path)
+            if piped_error is None:
+                final_path = piped_path
+                report_step(8, "finalizing", "Finalizing video")
+            elif check_canceled():
+                return {"error": "Canceled by user", "canceled": True}
+            else:
+                print(f"[viral_pipeline] Piped render failed, falling back to intermediate files: {piped_error}")
+
+        if final_path is None:
+            report_step(5, "joining_clips", "Joining video clips")
+            if len(segment_paths) == 1:
+                video_only = segment_paths[0]
+            else:
+                # Direct concatenation without any transitions - simple frame cuts for storytelling
+                video_only = tmpdir / "video_concat.mp4"
+                with metrics.stage("concat") as stage:
+                    stage.add_inputs(*segment_paths)
+                    # Segments share one encoder config, so a stream copy is enough;
+                    # re-encode only if the copy is rejected.
+                    concat_cmd = [
+                        ffmpeg_bin, "-y", "-f", "concat", "-safe", "0",
+                        "-i", str(seg_list), "-c", "copy", str(video_only),
+                    ]
+                    result = _run_ffmpeg(concat_cmd, timeout=240, should_stop=check_canceled)
+                    if result.returncode != 0 and not check_canceled():
+                        concat_cmd = [
+                            ffmpeg_bin, "-y", "-f", "concat", "-safe", "0",
+                            "-i", str(seg_list), *_segment_encode_args(settings), str(video_only),
+                        ]
+                        result = _run_ffmpeg(concat_cmd, timeout=240, should_stop=check_canceled)
+                    stage.add_ffmpeg_output(result.stderr)
+                    stage.add_outputs(video_only)
+                if result.returncode != 0:
+                    if check_canceled():
+                        return {"error": "Canceled by user", "canceled": True}
+                    return fail(f"Concat failed: {result.stderr[-240:]}", "concat", result.returncode < 0)
+
+            report_step(6, "mixing_audio", "Mixing audio")
+            final_audio = tmpdir / "final_audio.mp3"
+            if bgm_path and bgm_path.exists():
+                mix_cmd = [
                     ffmpeg_bin, "-y",
-                    "-i", str(merged_path),
-                    "-vf", f"subtitles={ass_abs_path}:force_style='FontName=Montserrat Black,FontSize=80'",
-                    "-c:v", "libx264",
-                    "-preset", "fast",
-                    "-crf", "23",
-                    "-c:a", "copy",
-                    "-pix_fmt", "yuv420p",
-                    "-r", "30",
-                    str(tmpdir / "final.mp4"),
+                    "-i", str(audio_path),
+                    "-i", str(bgm_path),
+                    "-filter_complex",
+                    "[1:a]volume=0.2[bgm];[0:a][bgm]amerge=inputs=2,pan=stereo|c0<c0+c2|c1<c1+c3[aout]",
+                    "-map", "[aout]",
+                    "-c:a", "aac",
+                    "-b:a", settings.audio_bitrate,
+                    str(final_audio),
                 ]
-                print(f"[viral_pipeline] Running caption burn command with subtitles filter...")
-                print(f"[viral_pipeline] ASS path: {ass_abs_path}")
-                result = subprocess.run(burn_cmd, capture_output=True, text=True, timeout=180)
-                if result.returncode == 0:
-                    final_path = tmpdir / "final.mp4"
-                    print(f"[viral_pipeline] Captions burned successfully!")
-                else:
-                    print(f"[viral_pipeline] Caption burn FAILED!")
-                    print(f"[viral_pipeline] Error: {result.stderr[:1000]}")
-            except Exception as e:
-                print(f"[viral_pipeline] Caption error: {type(e).__name__}: {e}")
-                import traceback
-                print(f"[viral_pipeline] Traceback: {traceback.format_exc()}")
-        else:
-            report_step(8, "finalizing", "Finalizing video")
+                with metrics.stage("mix") as stage:
+                    stage.add_inputs(audio_path, bgm_path)
+                    result = _run_ffmpeg(mix_cmd, timeout=300, should_stop=check_canceled)
+                    stage.add_ffmpeg_output(result.stderr)
+                    stage.add_outputs(final_audio)
+                if result.returncode != 0:
+                    if check_canceled():
+                        return {"error": "Canceled by user", "canceled": True}
+                    final_audio = audio_path
+            else:
+                final_audio = audio_path
+
+            report_step(7, "merging_audio_video", "Merging video with audio")
+            merged_path = tmpdir / "merged.mp4"
+            merge_cmd = [
+                ffmpeg_bin, "-y",
+                "-i", str(video_only),
+                "-i", str(final_audio),
+                "-c:v", "copy",
+                "-c:a", "aac",
+                "-b:a", settings.audio_bitrate,
+                "-shortest",
+                str(merged_path),
+            ]
+            with metrics.stage("merge") as stage:
+                stage.add_inputs(video_only, final_audio)
+                result = _run_ffmpeg(merge_cmd, timeout=240, should_stop=check_canceled)
+                stage.add_ffmpeg_output(result.stderr)
+                stage.add_outputs(merged_path)
+            if result.returncode != 0:
+                if check_canceled():
+                    return {"error": "Canceled by user", "canceled": True}
+                return fail(f"Audio merge failed: {result.stderr[:240]}", "merge", result.returncode < 0)
+
+            final_path = merged_path
+            print(f"[viral_pipeline] Caption check: include_captions={include_captions}, beats={len(beats) if beats else 0}, caption_style={caption_style}")
+            if include_captions and beats:
+                report_step(8, "burning_captions", "Adding word-by-word captions")
+                ass_path = tmpdir / "captions.ass"
+                try:
+                    print(f"[viral_pipeline] Building captions: style={caption_style}, beats={len(beats)}, words_per_line={words_per_line}")
+                    build_word_by_word_captions(beats, durations, caption_style, ass_path, words_per_line)
+                    print(f"[viral_pipeline] Caption file created: {ass_path}, exists={ass_path.exists()}, size={ass_path.stat().st_size if ass_path.exists() else 0} bytes")
+
+                    subtitles_vf = _subtitles_filter(ass_path)
+                    burn_cmd = [
+                        ffmpeg_bin, "-y",
+                        "-i", str(merged_path),
+                        "-vf", subtitles_vf,
+                        *_delivery_encode_args(settings),
+                        "-c:a", "copy",
+                        str(tmpdir / "final.mp4"),
+                    ]
+                    print(f"[viral_pipeline] Running caption burn command with subtitles filter...")
+                    print(f"[viral_pipeline] Subtitles filter: {subtitles_vf}")
+                    with metrics.stage("caption_burn") as stage:
+                        stage.add_inputs(merged_path)
+                        result = _run_ffmpeg(
+                            burn_cmd,
+                            timeout=180,
+                            on_progress=ffmpeg_progress("burning_captions", "Adding word-by-word captions", 87, 94),
+                            should_stop=check_canceled,
+                        )
+                        stage.add_ffmpeg_output(result.stderr)
+                        stage.add_outputs(tmpdir / "final.mp4")
+                    if result.returncode == 0:
+                        final_path = tmpdir / "final.mp4"
+                        print(f"[viral_pipeline] Captions burned successfully!")
+                    elif check_canceled():
+                        return {"error": "Canceled by user", "canceled": True}
+                    else:
+                        print(f"[viral_pipeline] Caption burn FAILED!")
+                        print(f"[viral_pipeline] Error: {result.stderr[:1000]}")
+                except Exception as e:
+                    print(f"[viral_pipeline] Caption error: {type(e).__name__}: {e}")
+                    import traceback
+                    print(f"[viral_pipeline] Traceback: {traceback.format_exc()}")
+            else:
+                report_step(8, "finalizing", "Finalizing video")
 
         if not supabase:
-            return fail("Supabase not configured")
+            return fail("Supabase not configured", "upload", transient=True)
 
         report_status(stage="uploading_video", progress=95, log_line="Uploading video")
         storage_path = f"{video_id}/video.mp4"
         try:
-            supabase.storage.from_("videos").upload(
-                storage_path,
-                str(final_path),
-                {"content-type": "video/mp4", "upsert": "true"},
-            )
+            with metrics.stage("upload") as stage:
+                stage.add_inputs(final_path)
+                supabase.storage.from_("videos").upload(
+                    storage_path,
+                    str(final_path),
+                    {"content-type": "video/mp4", "upsert": "true"},
+                )
+                stage.bytes_out = stage.bytes_in
         except Exception as upload_err:
-            return fail(f"Upload failed: {upload_err}")
+            return fail(f"Upload failed: {upload_err}", "upload", transient=True)
 
         video_url = supabase.storage.from_("videos").get_public_url(storage_path)
         if video_url.endswith("?"):
@@ -498,4 +1386,6 @@ def assemble_video(payload: dict) -> dict:
         return {
             "video_url": video_url,
             "duration": sum(durations),
+            "render_profile": render_profile,
+            "metrics": log_metrics(),
         }